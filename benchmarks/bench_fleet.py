@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmarks fanning out over fleets of simulated hosts, each a local
+    interpreter reached through the `local` connection method, without sudo
+    or bootstrapping, so no real hosts are needed.
+
+    Run with `python -m pytest -s benchmarks/bench_fleet.py`. Fleet sizes
+    come from FROG_BENCH_HOSTS, and how many hosts are connected to at
+    once from FROG_BENCH_MAX_CONNECTIONS.
+"""
+
+import copy
+import os
+from typing import Callable, Tuple
+
+import pytest
+import yaml
+
+from conftest import fleet_sizes
+from frog import inventory
+from frog.fact_cache import MemoryFactCache
+from frog.resources import facts
+from frog.runner import RunnerOptions
+from frog.util import Timer
+
+""" Hosts connected to at once, each connection being a process of its own. """
+MAX_CONNECTIONS = int(os.environ.get("FROG_BENCH_MAX_CONNECTIONS", "64"))
+
+""" Hosts whose call payload is serialized, the rest cost the same. """
+SERIALIZATION_SAMPLE = 10
+
+
+def _best_of(fn: Callable[[], object], rounds: int) -> Tuple[float, object]:
+    best, value = None, None
+    for _ in range(rounds):
+        timer = Timer()
+        with timer:
+            value = fn()
+        best = timer.time_taken if best is None else min(best, timer.time_taken)
+
+    return best, value
+
+
+@pytest.fixture(scope="module")
+def local_facts() -> dict:
+    """ Facts of this machine, standing in for every simulated host's.
+    """
+
+    return facts.gather()
+
+
+def fleet(hosts: int, host_facts: dict=None) -> inventory.Inventory:
+    inv = inventory.Inventory.combine(inventory.synthetic(hosts, groups=max(1, hosts // 100)))
+    for item in inv:
+        item.update_facts(copy.deepcopy(host_facts or {}))
+
+    return inv
+
+
+@pytest.mark.parametrize("hosts", fleet_sizes())
+def bench_inventory_load_and_select(tmp_path, record, hosts):
+    for group, document in inventory.synthetic(hosts, groups=max(1, hosts // 100)):
+        with open(tmp_path / f"{group}.yml", "w") as inv_fp:
+            yaml.safe_dump(document, inv_fp)
+
+    load, inv = _best_of(lambda: inventory.load([tmp_path]), rounds=3)
+    last = list(inv)[-1].host
+    select, _ = _best_of(lambda: inv.select(last), rounds=3)
+    where, _ = _best_of(lambda: inv.where(lambda item: item.host.endswith("0")), rounds=3)
+
+    assert len(inv) == hosts
+    record(hosts=hosts, load=load, select=select, where=where)
+
+
+@pytest.mark.parametrize("hosts", fleet_sizes())
+def bench_call_payload_serialization(record, local_facts, hosts):
+    """ Serializes what a call sends a host, the whole inventory and the
+        host itself, as the runner does for every host.
+    """
+
+    inv = fleet(hosts, local_facts)
+    sample = list(inv)[:SERIALIZATION_SAMPLE]
+
+    def serialize():
+        for item in sample:
+            inv.serialize(deepcopy=True)
+            item.serialize(deepcopy=True)
+
+    seconds, _ = _best_of(serialize, rounds=3)
+    per_host = seconds / len(sample)
+    record(hosts=hosts, per_host=per_host, all_hosts=per_host * hosts)
+
+
+@pytest.mark.parametrize("hosts", fleet_sizes())
+def bench_gather_facts(record, hosts):
+    runner = RunnerOptions(max_connections=MAX_CONNECTIONS).build()
+    inv = fleet(hosts)
+    try:
+        seconds, _ = _best_of(lambda: runner.gather_facts(inv, fact_cache=MemoryFactCache()), rounds=1)
+    finally:
+        runner.close()
+
+    assert all("platform" in item.facts for item in inv)
+    record(hosts=hosts, seconds=seconds, connections=runner.connection_stats.asdict())
+
+
+@pytest.mark.parametrize("hosts", fleet_sizes())
+def bench_run_ping(record, local_facts, hosts):
+    """ `frog run test.ping` with every host's facts already cached.
+    """
+
+    runner = RunnerOptions(max_connections=MAX_CONNECTIONS).build()
+    inv = fleet(hosts)
+    fact_cache = MemoryFactCache()
+    for item in inv:
+        fact_cache.update(item.host, copy.deepcopy(local_facts))
+
+    try:
+        seconds, results = _best_of(lambda: runner.run(inv, "test.ping", fact_cache=fact_cache), rounds=1)
+    finally:
+        runner.close()
+
+    assert sorted(result.outcome()["changed"] for result in results) == ["pong"] * hosts
+    phases = {phase: {"p50": summary["p50"], "p95": summary["p95"]} for phase, summary in runner.latencies.summary().items()}
+    record(hosts=hosts, seconds=seconds, hosts_per_second=hosts / seconds, phases=phases)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmarks `frog.util.kvparse` against the recursive regex it replaced.
+
+    Run with `python -m pytest -s benchmarks/bench_kvparse.py`.
+"""
+
+import pytest
+import regex
+
+from frog.util import Timer, kvparse
+
+# The recursive pattern `frog.util.kvparse` used before the hand-written parser.
+_legacy_pattern = regex.compile(
+    r"""(?:
+          (?P<key>[\w]+)
+          =
+          (?P<value>
+            (?:
+              (?P<subitem>{(?R)+?})
+              | (?:'.+?')
+              | (?:".+?")
+              | (?:[\w\s,-/]+)
+            )
+          )
+          (?:\s+)?
+        )+?
+""",
+    regex.VERBOSE,
+)
+
+
+def _legacy_parse(data: str) -> dict:
+    kvitems = {}
+    for match in _legacy_pattern.finditer(data):
+        key, value, subitem = match.groups()
+        if value == subitem:
+            kvitems[key] = _legacy_parse(value[1:-1])
+        else:
+            kvitems[key] = value.strip("\"'")
+
+    return kvitems
+
+
+def _time(fn, data: str, rounds: int=3) -> float:
+    best = None
+    for _ in range(rounds):
+        timer = Timer()
+        with timer:
+            try:
+                fn(data)
+            except kvparse.ParseError:
+                pass
+        best = timer.time_taken if best is None else min(best, timer.time_taken)
+
+    return best
+
+
+def flat(pairs: int) -> str:
+    return " ".join(f"key{i}='value {i}'" for i in range(pairs))
+
+
+def nested(depth: int) -> str:
+    data = "leaf='x'"
+    for level in range(depth):
+        data = f"k{level}={{{data} n{level}={level}}}"
+
+    return data
+
+
+def unclosed_brace(pairs: int) -> str:
+    return "a={" + "b=1 " * pairs
+
+
+def unterminated_quote(length: int) -> str:
+    return "a='" + "x " * length
+
+
+@pytest.mark.parametrize("generator, size", [
+    (flat, 1000),
+    (flat, 10000),
+    (nested, 50),
+    (unterminated_quote, 100000),
+])
+def bench_generated_inputs(generator, size):
+    data = generator(size)
+
+    legacy = _time(_legacy_parse, data)
+    current = _time(kvparse.parse, data)
+
+    print(f"\n{generator.__name__}({size}): {len(data)} chars, regex {legacy:.4f}s, kvparse {current:.4f}s")
+
+
+@pytest.mark.parametrize("pairs", [4, 8, 12, 16])
+def bench_unclosed_brace_backtracking(pairs):
+    """ The regex backtracks exponentially on an unclosed brace,
+        roughly 16x for every 4 pairs. kvparse fails in linear time.
+    """
+
+    data = unclosed_brace(pairs)
+
+    legacy = _time(_legacy_parse, data, rounds=1)
+    current = _time(kvparse.parse, data)
+
+    print(f"\nunclosed_brace({pairs}): regex {legacy:.4f}s, kvparse {current:.6f}s")
+
+
+def bench_kvparse_scales_linearly():
+    small = _time(kvparse.parse, unclosed_brace(5000))
+    large = _time(kvparse.parse, unclosed_brace(50000))
+
+    print(f"\nunclosed_brace(5000) {small:.4f}s, unclosed_brace(50000) {large:.4f}s")
+    assert large < small * 30
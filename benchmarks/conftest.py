@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+""" Records what benchmarks measured into one JSON document per session, so
+    runs against different versions of frog can be compared.
+
+    Run with `python -m pytest benchmarks`, optionally with
+    `--bench-output results.json` and `FROG_BENCH_HOSTS=10,100,1000`.
+"""
+
+import datetime
+import json
+import os
+import pathlib
+import platform
+import subprocess
+from typing import List, Optional
+
+import pytest
+
+""" Fleet sizes benchmarks run at, unless FROG_BENCH_HOSTS says otherwise. """
+DEFAULT_FLEET_SIZES = "10,100,1000"
+
+_RESULTS_DIR = pathlib.Path(__file__).parent / "results"
+
+
+def fleet_sizes() -> List[int]:
+    return [int(size) for size in os.environ.get("FROG_BENCH_HOSTS", DEFAULT_FLEET_SIZES).split(",") if size.strip()]
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", *args], cwd=pathlib.Path(__file__).parent, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def pytest_addoption(parser):
+    parser.addoption("--bench-output", help="Where to write benchmark results, benchmarks/results/<revision>-<time>.json by default")
+
+
+def pytest_configure(config):
+    config._bench_results = []
+
+
+@pytest.fixture
+def record(request):
+    """ Records a measurement of the running benchmark, eg.
+        `record(hosts=100, seconds=1.5)`.
+    """
+
+    def record(**measurement):
+        request.config._bench_results.append({"benchmark": request.node.originalname, **measurement})
+        print(f"\n{request.node.name}: {measurement}")
+
+    return record
+
+
+def pytest_sessionfinish(session):
+    results = getattr(session.config, "_bench_results", None)
+    if not results:
+        return
+
+    revision = _git("rev-parse", "--short", "HEAD")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    document = {
+        "frog": {"revision": revision, "dirty": bool(_git("status", "--porcelain", "--untracked-files=no"))},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started": now.isoformat(),
+        "results": results,
+    }
+
+    output = session.config.getoption("--bench-output")
+    path = pathlib.Path(output) if output else _RESULTS_DIR / f"{revision or 'unknown'}-{now:%Y%m%dT%H%M%S}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as results_fp:
+        json.dump(document, results_fp, indent=2)
+
+    print(f"\nWrote benchmark results to {path}")
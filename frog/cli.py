@@ -1,22 +1,30 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
 import os
 import pathlib
 import sys
 from itertools import chain, zip_longest
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
 import click
 from texttable import Texttable
 
 from . import (
     inventory, 
+    journal,
+    metrics,
+    precheck,
+    recipes,
     resources,
     remoteenv,
     runner,
+    sharding,
 )
+from .connection import SshMultiplexer
 from .fact_cache import FilesystemFactCache, MemoryFactCache
+from .outcome_cache import DEFAULT_OUTCOME_TTL
 from .util import kvparse, outputs
 
 logger = logging.getLogger(__name__)
@@ -24,6 +32,12 @@ logger = logging.getLogger(__name__)
 DEFAULT_BOOTSTRAP_DIRECTORY = "/opt/frog-env"
 DEFAULT_BOOTSTRAP_CLEAN = False
 DEFAULT_MITOGEN_DEBUG = False
+DEFAULT_SSH_CONTROL_DIR = f"/tmp/frog-ssh-control-{os.getuid()}"
+# Run history, journals and caches are kept per user rather than at fixed
+# paths in /tmp, where anyone could plant or read them.
+DEFAULT_STATE_DIRECTORY = pathlib.Path(os.environ.get("XDG_STATE_HOME") or pathlib.Path.home() / ".local" / "state") / "frog"
+DEFAULT_CACHE_DIRECTORY = pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache") / "frog"
+LOG_FORMAT = "[%(levelname)s] [%(asctime)s] %(message)s"
 
 
 @click.group()
@@ -38,7 +52,7 @@ def root(ctx: click.Context, inventories: List[str], log_level: str, mitogen_deb
 
     log_level = logging._nameToLevel[log_level]
 
-    logging.basicConfig(level=log_level, stream=sys.stdout, format="[%(levelname)s] [%(asctime)s] %(message)s")
+    logging.basicConfig(level=log_level, stream=sys.stdout, format=LOG_FORMAT)
     if not mitogen_debug:
         logging.getLogger("mitogen").setLevel(logging.INFO)
 
@@ -85,41 +99,199 @@ def _inventory_list(ctx: click.Context):
         print(f"{host.host}")
 
 
+@root.group("ssh-control")
+def _ssh_control():
+    """ Manage persistent SSH control sockets
+    """
+    pass
+
+
+@_ssh_control.command("clean")
+@click.option("--ssh-control-dir", help="Directory SSH control sockets are kept in", type=click.Path(file_okay=False, path_type=pathlib.Path), default=DEFAULT_SSH_CONTROL_DIR)
+def _ssh_control_clean(ssh_control_dir: pathlib.Path):
+    """ Stop every persistent SSH master and remove the socket directory.
+    """
+
+    if not ssh_control_dir.exists():
+        return
+
+    SshMultiplexer(ssh_control_dir).close_all()
+
+
 @root.command("run")
 @click.option("-c", "--cookbooks", type=click.Path(exists=True, dir_okay=True, file_okay=False), help="Path to directory containing cookbooks", multiple=True)
+@click.option("--cookbook-bundle-dir", help="Where cookbooks are packed into bundles every host installs once, instead of importing them module by module", type=click.Path(file_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=str(DEFAULT_CACHE_DIRECTORY / "bundles"))
+@click.option("--bundle-cookbooks/--no-bundle-cookbooks", help="Ship cookbooks to hosts as a single bundle", type=bool, default=True)
 @click.option("-l", "--limit", help="Limit hosts that should be pinged")
-@click.option("-o", "--outputter", help="Output formatter function", type=click.Choice(["table", "json", "pretty-json"]), default="json")
+@click.option("-o", "--outputter", help="Output formatter function; summary groups hosts with the same response together", type=click.Choice(["table", "json", "pretty-json", "summary"]), default="json")
 @click.option("--bootstrap-directory", help="Directory the tool should be bootstrapped into", type=str, default=DEFAULT_BOOTSTRAP_DIRECTORY)
 @click.option("--bootstrap-clean", help="Whether bootstrap directory should be cleaned before bootstrapping", type=bool, default=DEFAULT_BOOTSTRAP_CLEAN)
 @click.option("--fact-cache-type", help="Type of fact cache to use", type=click.Choice(["memory", "filesystem"], case_sensitive=False), default="memory")
 @click.option("--fact-cache-dir", help="Where the facts cache should be stored", type=click.Path(exists=False, dir_okay=True, file_okay=False, writable=True, readable=True, resolve_path=True, path_type=pathlib.Path), default="/tmp/infra-facts-cache")
 @click.option("--fact-cache-lifetime", help="How long the facts cache should be considered valid", type=click.INT, default=3600)
+@click.option("--max-connections", help="Maximum number of host connections to keep open at once, unlimited by default", type=click.IntRange(min=0), default=0)
+@click.option("--connection-idle-timeout", help="Seconds an unused host connection is kept open, forever by default", type=click.FLOAT, default=0)
+@click.option("--max-concurrent-connects", help="Maximum number of connections being established at once, unlimited by default", type=click.IntRange(min=0), default=0)
+@click.option("--max-connects-per-destination", help="Maximum number of connections being established at once to a single host or jump host", type=click.IntRange(min=0), default=8)
+@click.option("--connect-rate", help="Maximum number of new connections started per second, unlimited by default", type=click.FLOAT, default=0)
+@click.option("--connect-burst", help="Number of connections that may be started at once before --connect-rate applies", type=click.IntRange(min=1), default=1)
+@click.option("--ssh-multiplex/--no-ssh-multiplex", help="Reuse persistent SSH connections (ControlMaster) across connections and runs", type=bool, default=False)
+@click.option("--ssh-control-dir", help="Directory SSH control sockets are kept in", type=click.Path(file_okay=False, path_type=pathlib.Path), default=DEFAULT_SSH_CONTROL_DIR)
+@click.option("--ssh-control-persist", help="Seconds an idle SSH master connection is kept open", type=click.IntRange(min=1), default=SshMultiplexer.DEFAULT_PERSIST)
+@click.option("--fused-connect/--no-fused-connect", help="Start the bootstrapped interpreter directly and gather facts while connecting", type=bool, default=True)
+@click.option("--call-timeout", help="Seconds a resource call may take on a host before it is disconnected, unlimited by default", type=click.FLOAT, default=0)
+@click.option("--run-timeout", help="Seconds the whole run may take; hosts still running are recorded as timed out, unlimited by default", type=click.FLOAT, default=0)
+@click.option("--max-concurrency", help="Maximum number of hosts worked on at once, unlimited by default", type=click.IntRange(min=0), default=0)
+@click.option("--adaptive-concurrency/--no-adaptive-concurrency", help="Adjust how many hosts are worked on at once by observed latency and connection errors", type=bool, default=False)
+@click.option("--initial-concurrency", help="Number of hosts worked on at once when --adaptive-concurrency starts out", type=click.IntRange(min=1), default=8)
+@click.option("--history-file", help="Where how long hosts took in previous runs is kept, to start the slowest hosts first when concurrency is limited", type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=str(DEFAULT_STATE_DIRECTORY / "history.json"))
+@click.option("--history/--no-history", "use_history", help="Record host durations and schedule by them", type=bool, default=True)
+@click.option("--precheck/--no-precheck", help="Check every host's connection port is reachable before connecting, and skip hosts that are down", type=bool, default=False)
+@click.option("--probe-timeout", help="Seconds a reachability check waits for a host to answer", type=click.FLOAT, default=precheck.DEFAULT_PROBE_TIMEOUT)
+@click.option("--probe-cache", "probe_cache_path", help="Where reachability check results are cached", type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=str(DEFAULT_CACHE_DIRECTORY / "probe-cache.json"))
+@click.option("--probe-cache-ttl", help="How long reachability check results are cached for, 0 to not cache them", type=click.FLOAT, default=precheck.DEFAULT_CACHE_TTL)
+@click.option("--strategy", help="How hosts work through a run: step by step together (linear) or each on its own (free)", type=click.Choice(sorted(runner.STRATEGY_MAP.keys() - {runner.SerialStrategy.NAME}), case_sensitive=False), default=runner.LinearStrategy.NAME)
+@click.option("--serial", help="Run hosts in batches of this many hosts, or this percentage of them, eg. 25%", type=str, default=None)
+@click.option("--max-fail-percentage", help="Abort the remaining batches once more than this percentage of a batch failed", type=click.FloatRange(min=0, max=100), default=None)
+@click.option("--depends-on", "depends_on", help="Converge groups before another group, as GROUP=PREREQ[,PREREQ...], on top of inventory `depends_on`", multiple=True)
+@click.option("--journal-dir", help="Where run journals are kept", type=click.Path(file_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=str(DEFAULT_STATE_DIRECTORY / "runs"))
+@click.option("--journal/--no-journal", "use_journal", help="Record every result to a run journal as it comes in", type=bool, default=True)
+@click.option("--resume", "resume_run", help="Resume the journaled run with this id, skipping hosts that already succeeded", type=str, default=None)
+@click.option("--outcome-cache", "outcome_cache_path", help="Where calls that changed nothing on a host are remembered", type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=str(DEFAULT_STATE_DIRECTORY / "outcome-cache.json"))
+@click.option("--outcome-cache-ttl", help="How long a call that changed nothing is remembered for, 0 to not remember them", type=click.FLOAT, default=DEFAULT_OUTCOME_TTL)
+@click.option("--skip-unchanged/--no-skip", help="Skip, without connecting, calls that recently changed nothing on a host with the same parameters and cached facts (needs a filesystem fact cache)", type=bool, default=False)
+@click.option("--trace", "trace_path", help="Write what every host spent its time on, phase by phase, to this file in Chrome trace event format", type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=None)
+@click.option("--profile-remote/--no-profile-remote", help="Have mitogen profile every context it starts on the hosts, leaving the profiles on them", type=bool, default=False)
+@click.option("--metrics-textfile", help="Write metrics of the run to this file at the end, in the Prometheus text format", type=click.Path(dir_okay=False, writable=True, resolve_path=True, path_type=pathlib.Path), default=None)
+@click.option("--metrics-port", help="Serve metrics on this local port while running, 0 to not serve them", type=click.IntRange(min=0, max=65535), default=0)
+@click.option("--shards", help="Number of controller processes to split the hosts across, 0 for one per CPU", type=click.IntRange(min=0), default=1)
+@click.option("-t", "--template-dir", "template_dirs", type=click.Path(exists=True, dir_okay=True, file_okay=False, resolve_path=True), help="Path to directory containing templates", multiple=True)
+@click.option("--template-cache-dir", help="Where compiled template bytecode should be cached", type=click.Path(exists=False, dir_okay=True, file_okay=False, writable=True, readable=True, resolve_path=True, path_type=pathlib.Path), default=str(DEFAULT_CACHE_DIRECTORY / "templates"))
 @click.argument("target")
 @click.argument("parameters", nargs=-1)
 @click.pass_context
-def _run(ctx: click.Context, cookbooks: List[str], limit: str, outputter: str,
+def _run(ctx: click.Context, cookbooks: List[str], cookbook_bundle_dir: pathlib.Path, bundle_cookbooks: bool, limit: str, outputter: str,
          bootstrap_directory: str, bootstrap_clean: bool, fact_cache_type: str, fact_cache_dir: pathlib.Path,
-         fact_cache_lifetime: int, target: str, parameters: List[str]):
-    """ Run the cookbook or resource on the host(s) specified.
+         fact_cache_lifetime: int, max_connections: int, connection_idle_timeout: float,
+         max_concurrent_connects: int, max_connects_per_destination: int, connect_rate: float, connect_burst: int,
+         ssh_multiplex: bool, ssh_control_dir: pathlib.Path, ssh_control_persist: int, fused_connect: bool,
+         call_timeout: float, run_timeout: float, max_concurrency: int, adaptive_concurrency: bool,
+         initial_concurrency: int, history_file: pathlib.Path, use_history: bool, precheck: bool, probe_timeout: float,
+         probe_cache_path: pathlib.Path, probe_cache_ttl: float, strategy: str, serial: Optional[str],
+         max_fail_percentage: Optional[float], depends_on: List[str], journal_dir: pathlib.Path, use_journal: bool,
+         resume_run: Optional[str], outcome_cache_path: pathlib.Path, outcome_cache_ttl: float, skip_unchanged: bool,
+         trace_path: Optional[pathlib.Path], profile_remote: bool, metrics_textfile: Optional[pathlib.Path],
+         metrics_port: int, shards: int,
+         template_dirs: List[str], template_cache_dir: pathlib.Path, target: str, parameters: List[str]):
+    """ Run the cookbook recipe or resource on the host(s) specified.
+        Recipes are named by cookbook module and function, eg.
+        `webserver.site`, and run on each host along with their dependencies.
+
+        Parameter values may be templates evaluated per host, eg.
+        `address={{ facts.network.interface.eth0.ipv4[0].addr }}`.
     """
 
-    _runner = runner.Runner()
-
-    bootstrap_settings = remoteenv.Settings(directory=bootstrap_directory, clean=bootstrap_clean)
-    if fact_cache_type.lower() == "memory":
-        fact_cache = MemoryFactCache()
-    elif fact_cache_type.lower() == "filesystem":
-        fact_cache = FilesystemFactCache(fact_cache_dir, fact_cache_lifetime)
-
     cookbook_paths = []
     for path in cookbooks:
         cookbook_paths.append(os.path.realpath(path))
 
-    formatter = pick_formatter(outputter)
+    recipes.load_cookbooks(cookbook_paths)
+    try:
+        resources.lookup(target)
+    except (NameError, TypeError) as err:
+        raise click.BadParameter(str(err), param_hint="TARGET")
+
+    if skip_unchanged and fact_cache_type.lower() == "memory":
+        # Whether a call would change anything depends on the host's facts,
+        # which would otherwise be gathered by connecting to every host.
+        raise click.BadParameter("needs --fact-cache-type filesystem, to know hosts' facts without connecting to them", param_hint="--skip-unchanged")
+
+    inv = ctx.obj["inventory"]
+    group_dependencies = _group_dependencies(inv, depends_on)
+
+    options = runner.RunnerOptions(
+        template_cache_dir=template_cache_dir,
+        max_connections=max_connections,
+        connection_idle_timeout=connection_idle_timeout,
+        max_concurrent_connects=max_concurrent_connects,
+        max_connects_per_destination=max_connects_per_destination,
+        connect_rate=connect_rate,
+        connect_burst=connect_burst,
+        fused_connect=fused_connect,
+        call_timeout=call_timeout,
+        run_timeout=run_timeout,
+        max_concurrency=max_concurrency,
+        adaptive_concurrency=adaptive_concurrency,
+        initial_concurrency=initial_concurrency,
+        history_path=history_file if use_history else None,
+        precheck=precheck,
+        probe_timeout=probe_timeout,
+        probe_cache_path=probe_cache_path,
+        probe_cache_ttl=probe_cache_ttl,
+        bootstrap_settings=remoteenv.Settings(directory=bootstrap_directory, clean=bootstrap_clean).asdict(),
+        template_prefixes=[*cookbook_paths, *template_dirs],
+        ssh_control_dir=ssh_control_dir if ssh_multiplex else None,
+        ssh_control_persist=ssh_control_persist,
+        strategy=strategy,
+        serial=serial,
+        max_fail_percentage=max_fail_percentage,
+        group_dependencies=group_dependencies,
+        cookbook_paths=cookbook_paths,
+        cookbook_bundle_dir=cookbook_bundle_dir if bundle_cookbooks else None,
+        outcome_cache_path=outcome_cache_path,
+        outcome_cache_ttl=outcome_cache_ttl,
+        skip_unchanged=skip_unchanged,
+        trace=trace_path is not None,
+        remote_profiling=profile_remote,
+    )
+
+    try:
+        options.build_strategy()
+    except ValueError as err:
+        raise click.UsageError(str(err))
+
+    if shards == 0:
+        shards = os.cpu_count() or 1
+    if shards > 1 and (serial or max_fail_percentage is not None):
+        # Each shard would batch and abort on its own share of the hosts.
+        raise click.UsageError("--serial and --max-fail-percentage can't be used with --shards")
+    if shards > 1 and group_dependencies:
+        # Shards split groups up, so none of them sees a whole group converge.
+        raise click.UsageError("Group dependencies can't be used with --shards")
+
     resource_params = kvparse.parse_many(parameters)
     logger.debug(f"KVparse parsed parameters {resource_params}")
 
-    inv = ctx.obj["inventory"]
+    run_journal = None
+    if resume_run:
+        run_journal = journal.Journal(journal_dir, resume_run)
+        header = run_journal.header()
+        if header is None:
+            raise click.BadParameter(f"no journal for run {resume_run} in {journal_dir}", param_hint="--resume")
+        if (header["target"], header["parameters"]) != (target, resource_params):
+            raise click.UsageError(f"Run {resume_run} ran {header['target']} with {header['parameters']}, not {target} with {resource_params}")
+    elif use_journal:
+        run_journal = journal.Journal(journal_dir)
+
+    metrics_server = metrics.REGISTRY.serve(metrics_port) if metrics_port else None
+
+    multiplexer = None
+    if shards > 1:
+        if ssh_multiplex:
+            SshMultiplexer(ssh_control_dir).prune()
+        _runner = sharding.ShardedRunner(options, shards, log_format=LOG_FORMAT, journal=run_journal)
+    else:
+        multiplexer = options.configure_ssh()
+        if multiplexer is not None:
+            multiplexer.prune()
+        _runner = options.build(journal=run_journal)
+
+    if fact_cache_type.lower() == "memory":
+        fact_cache = MemoryFactCache()
+    elif fact_cache_type.lower() == "filesystem":
+        fact_cache = FilesystemFactCache(fact_cache_dir, fact_cache_lifetime)
+
+    formatter = pick_formatter(outputter)
 
     if limit:
         logger.debug(f"Limiting inventory {inv.hosts} by filter `{limit}`")
@@ -129,13 +301,75 @@ def _run(ctx: click.Context, cookbooks: List[str], limit: str, outputter: str,
         logger.fatal(f"Inventory filter `{limit}` resulted in empty inventory")
         return False
 
+    if resume_run:
+        succeeded = run_journal.succeeded()
+        inv = inv.where(lambda item: item.host not in succeeded)
+        logger.info(f"Resuming run {resume_run}: {len(succeeded)} hosts already succeeded, {len(inv)} left")
+
+    if run_journal is not None:
+        run_journal.start(target, resource_params)
+        logger.info(f"Journaling run {run_journal.run_id} to {run_journal.path}, resume it with --resume {run_journal.run_id}")
+
     logger.debug(f"Executing on inventory {inv.hosts}")
 
-    _runner.gather_facts(inv, fact_cache=fact_cache)
-    results = list(_runner.execute(inv, target, resource_params))
+    results = _runner.run(inv, target, resource_params, fact_cache=fact_cache) if len(inv) > 0 else []
+    logger.info(f"Connection pool: {_runner.connection_stats.asdict()}")
+    for phase, summary in _runner.latencies.summary().items():
+        logger.info(f"Latency of {phase}: {summary}")
+    if trace_path is not None:
+        _runner.tracer.write(trace_path)
+        logger.info(f"Wrote trace of the run to {trace_path}")
+    if skip_unchanged and shards == 1 and _runner.outcome_cache is not None:
+        logger.info(f"Skipped {_runner.outcome_cache.hits} calls that recently changed nothing")
+    if cookbook_paths and bundle_cookbooks:
+        logger.info(f"Cookbook bundle installs: {_runner.bundle_stats}")
+    for gateway, stats in _runner.relay_stats().items():
+        logger.info(f"Relay on {gateway}: {stats}")
+    if multiplexer is not None:
+        logger.info(f"SSH multiplexing: {multiplexer.stats()}")
+    elif shards > 1 and ssh_multiplex:
+        logger.info(f"SSH multiplexing: {_runner.ssh_stats}")
     _runner.close()
+    if metrics_textfile is not None:
+        metrics.REGISTRY.write_textfile(metrics_textfile)
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+    if run_journal is not None:
+        run_journal.close()
+        # Rendered back from disk, so results earlier in a resumed run are
+        # included, and streamed where the outputter can be so the full set
+        # never has to be held at once.
+        del results
+        streamer = pick_streamer(outputter)
+        if streamer is None:
+            print(formatter(run_journal.results(latest_only=True)))
+        else:
+            for chunk in streamer(run_journal.results(latest_only=True)):
+                sys.stdout.write(chunk)
+            print()
+    else:
+        print(formatter(results))
+
+
+def _group_dependencies(inv: inventory.Inventory, depends_on: List[str]) -> Dict[str, List[str]]:
+    """ Merges the group dependencies given on the command line into the
+        ones the inventory declares.
+    """
+
+    dependencies = {group: list(deps) for group, deps in inv.dependencies.items()}
+    for spec in depends_on:
+        group, sep, prerequisites = spec.partition("=")
+        if not sep or not group.strip() or not prerequisites.strip():
+            raise click.BadParameter(f"expected GROUP=PREREQ[,PREREQ...], got {spec!r}", param_hint="--depends-on")
+
+        dependencies.setdefault(group.strip(), []).extend(dep.strip() for dep in prerequisites.split(",") if dep.strip())
 
-    print(formatter(results))
+    unknown = set(dependencies).union(*dependencies.values()) - set(inv.hosts)
+    if unknown:
+        raise click.BadParameter(f"unknown groups {', '.join(sorted(unknown))}", param_hint="--depends-on")
+
+    return dependencies
 
 
 def pick_formatter(formatter: str) -> Callable[[Any], str]:
@@ -144,6 +378,18 @@ def pick_formatter(formatter: str) -> Callable[[Any], str]:
             "table": outputs.as_texttable,
             "json": outputs.as_json,
             "pretty-json": outputs.as_pretty_json,
+            "summary": outputs.as_summary,
         }[formatter.lower()]
     except KeyError:
-        raise ValueError(f"Unknown formatter {formatter}")
\ No newline at end of file
+        raise ValueError(f"Unknown formatter {formatter}")
+
+
+def pick_streamer(formatter: str) -> Optional[Callable[[Iterable[Any]], Iterator[str]]]:
+    """ Returns the outputter rendering results in pieces as they are read,
+        if `formatter` has one.
+    """
+
+    return {
+        "json": outputs.stream_json,
+        "pretty-json": functools.partial(outputs.stream_json, indent=2),
+    }.get(formatter.lower())
\ No newline at end of file
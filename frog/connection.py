@@ -3,10 +3,19 @@
 from __future__ import annotations
 
 import abc
+import errno
+import hashlib
 import json
 import logging
+import os
+import pathlib
 import shutil
-from typing import List, Optional
+import socket
+import stat
+import subprocess
+import sys
+import threading
+from typing import List, Optional, Tuple
 
 from mitogen.core import Context
 from mitogen.master import Router
@@ -51,9 +60,33 @@ class ConnectionMethod(DictSerializable, metaclass=abc.ABCMeta):
         raise NotImplemented
 
     @abc.abstractmethod
-    def connect(self, router: Router):
+    def connect(self, router: Router, **overrides):
+        """ Connects to the remote. `overrides` replace connection options
+            for this connection only, eg. `python_path`.
+        """
+
         raise NotImplemented
 
+    def probe_address(self) -> Optional[Tuple[str, int]]:
+        """ (host, port) a plain TCP connect can check the remote is up
+            through, or None if the remote can't be probed that way.
+        """
+
+        return None
+
+    def escalates(self) -> bool:
+        """ Whether connections go on to sudo as the host's `sudo_as` user.
+        """
+
+        return True
+
+    def bootstraps(self) -> bool:
+        """ Whether calls run in the bootstrapped venv, rather than in the
+            interpreter connected to.
+        """
+
+        return True
+
     def asdict(self) -> dict:
         return {
             "type": self.type(),
@@ -68,10 +101,103 @@ class ConnectionMethod(DictSerializable, metaclass=abc.ABCMeta):
             logger.warning(f"Options left over after constructing ConnectionMethod: {kw}")
 
 
+class SshMultiplexer:
+    """ Manages persistent SSH ControlMaster sockets, one per (user, host, port),
+        in a private directory. Connections made while a master is alive
+        reuse it and skip key exchange and authentication entirely, including
+        across separate runs for as long as ControlPersist keeps it around.
+    """
+
+    DEFAULT_PERSIST = 600
+
+    def __init__(self, directory: pathlib.Path, persist: int=DEFAULT_PERSIST):
+        self.directory = directory
+        self.persist = persist
+        self.reused = 0
+        self.created = 0
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.chmod(self.directory, 0o700)
+
+    def __repr__(self) -> str:
+        return f"<SshMultiplexer at {self.directory} (persist {self.persist}s)>"
+
+    def control_path(self, username: Optional[str], hostname: str, port: Optional[int]) -> pathlib.Path:
+        # Hashed so the path stays well under the unix socket path length limit.
+        key = f"{username or ''}@{hostname}:{port or 22}"
+        return self.directory / hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+    @staticmethod
+    def is_live(path: pathlib.Path) -> bool:
+        try:
+            if not stat.S_ISSOCK(path.stat().st_mode):
+                return False
+        except FileNotFoundError:
+            return False
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(path))
+                return True
+            except OSError as err:
+                if err.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                    return False
+                raise
+
+    def prune(self) -> int:
+        """ Removes sockets left behind by masters that are gone.
+        """
+
+        removed = 0
+        for path in self.directory.iterdir():
+            if not self.is_live(path):
+                path.unlink(missing_ok=True)
+                removed += 1
+
+        logger.debug(f"Pruned {removed} stale control sockets from {self.directory}")
+        return removed
+
+    def ssh_args(self, username: Optional[str], hostname: str, port: Optional[int]) -> List[str]:
+        path = self.control_path(username, hostname, port)
+        with self._lock:
+            if self.is_live(path):
+                self.reused += 1
+            else:
+                self.created += 1
+
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={path}",
+            "-o", f"ControlPersist={self.persist}",
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"reused": self.reused, "created": self.created}
+
+    def close_all(self, ssh_path: str="ssh"):
+        """ Asks every master to exit and removes the socket directory.
+        """
+
+        for path in self.directory.iterdir():
+            if self.is_live(path):
+                subprocess.run(
+                    [ssh_path, "-o", f"ControlPath={path}", "-O", "exit", "frog-control-master"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
 class SshConnectionMethod(ConnectionMethod):
 
     TYPE = "ssh"
 
+    """ Multiplexer shared by every SSH connection, if multiplexing is turned on. """
+    multiplexer: Optional[SshMultiplexer] = None
+
     def __init__(self, **kw):
         super().__init__(**kw)
         self.options.update({
@@ -94,8 +220,21 @@ class SshConnectionMethod(ConnectionMethod):
     def type(self) -> str:
         return self.TYPE
 
-    def connect(self, router: Router) -> Context:
-        return router.ssh(**self.options)
+    def connect(self, router: Router, **overrides) -> Context:
+        options = dict(self.options, **overrides)
+        ssh_args = list(options["ssh_args"] or [])
+        if self.multiplexer is not None and not any("ControlPath" in arg for arg in ssh_args):
+            ssh_args.extend(self.multiplexer.ssh_args(options["username"], options["hostname"], options["port"]))
+            options["ssh_args"] = ssh_args
+
+        return router.ssh(**options)
+
+    def probe_address(self) -> Optional[Tuple[str, int]]:
+        # Proxied connections can't be checked from here.
+        if any("Proxy" in arg for arg in self.options["ssh_args"] or []):
+            return None
+
+        return (self.options["hostname"], int(self.options["port"] or 22))
 
 
 class DockerConnectionMethod(ConnectionMethod):
@@ -118,8 +257,8 @@ class DockerConnectionMethod(ConnectionMethod):
     def type(self) -> str:
         return self.TYPE
 
-    def connect(self, router: Router) -> Context:
-        return router.docker(**self.options)
+    def connect(self, router: Router, **overrides) -> Context:
+        return router.docker(**dict(self.options, **overrides))
 
 
 class PodmanConnectionMethod(DockerConnectionMethod):
@@ -140,8 +279,46 @@ class PodmanConnectionMethod(DockerConnectionMethod):
         return self.TYPE
 
 
+class LocalConnectionMethod(ConnectionMethod):
+    """ A new interpreter on this machine, eg. to stand in for hosts when
+        measuring frog itself. Connections can skip sudo and bootstrapping,
+        calls then run in the interpreter started, which is this one's by
+        default.
+    """
+
+    TYPE = "local"
+
+    """ Options of ours rather than mitogen's. """
+    _FROG_OPTIONS = {"sudo", "bootstrap"}
+
+    def __init__(self, /, **kw):
+        kw.setdefault("python_path", [sys.executable])
+        super().__init__(**kw)
+        self.options.update({
+            "sudo": kw.pop("sudo", True),
+            "bootstrap": kw.pop("bootstrap", True),
+        })
+
+    def __repr__(self) -> str:
+        return f"<LocalConnectionMethod {self.options}>"
+
+    def type(self) -> str:
+        return self.TYPE
+
+    def connect(self, router: Router, **overrides) -> Context:
+        options = dict(self.options, **overrides)
+        return router.local(**{name: value for name, value in options.items() if name not in self._FROG_OPTIONS})
+
+    def escalates(self) -> bool:
+        return bool(self.options["sudo"])
+
+    def bootstraps(self) -> bool:
+        return bool(self.options["bootstrap"])
+
+
 CONNECTION_METHOD_MAP = {
     DockerConnectionMethod.TYPE: DockerConnectionMethod,
+    LocalConnectionMethod.TYPE: LocalConnectionMethod,
     PodmanConnectionMethod.TYPE: PodmanConnectionMethod,
     SshConnectionMethod.TYPE: SshConnectionMethod,
 }
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from mitogen.core import Context, TimeoutError
+from mitogen.master import Router
+
+from frog.remoteenv import relay
+from frog.util import Timer
+from frog.util.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHUTDOWN_TIMEOUT = 10.0
+
+
+class PoolStats:
+    """ Counters describing how a ConnectionPool has been used.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.opened = 0
+        self.closed = 0
+
+    def __repr__(self) -> str:
+        return f"<PoolStats {self.asdict()}>"
+
+    def asdict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "opened": self.opened,
+            "closed": self.closed,
+        }
+
+    def merge(self, counts: dict):
+        """ Adds counters collected elsewhere, eg. by another process.
+        """
+
+        for name, value in counts.items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+class PooledConnection:
+    """ A chain of contexts leading to a host, outermost first.
+        The innermost context is the one calls are made on.
+    """
+
+    def __init__(self, key: str, chain: List[Context]):
+        self.key = key
+        self.chain = chain
+        self.leases = 0
+        self.last_used = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"<PooledConnection {self.key} leases={self.leases}>"
+
+    @property
+    def context(self) -> Context:
+        return self.chain[-1]
+
+    def idle_for(self, now: float) -> float:
+        return now - self.last_used if self.leases == 0 else 0.0
+
+
+class ConnectThrottle:
+    """ Limits connection establishment: how many handshakes run at once,
+        overall and per destination (eg. a bastion every host is reached
+        through), and how many new connections are started per second.
+        Any limit given as None or 0 is unlimited.
+    """
+
+    def __init__(self, max_concurrent: Optional[int]=None, max_per_destination: Optional[int]=None, rate: Optional[float]=None, burst: Optional[int]=None):
+        self._max_concurrent = max_concurrent or None
+        self._max_per_destination = max_per_destination or None
+        self._bucket = TokenBucket(rate, burst)
+        self._in_flight = 0
+        self._by_destination: Dict[str, int] = {}
+        self._cond = threading.Condition()
+
+    def __repr__(self) -> str:
+        return f"<ConnectThrottle max_concurrent={self._max_concurrent} max_per_destination={self._max_per_destination} {self._bucket}>"
+
+    def _has_room(self, destination: str) -> bool:
+        if self._max_concurrent is not None and self._in_flight >= self._max_concurrent:
+            return False
+        if self._max_per_destination is not None and self._by_destination.get(destination, 0) >= self._max_per_destination:
+            return False
+
+        return True
+
+    @contextlib.contextmanager
+    def slot(self, destination: str) -> Iterator[Timer]:
+        """ Holds a handshake slot for `destination` while connecting.
+            Yields a Timer holding how long we waited for the slot.
+        """
+
+        waited = Timer()
+        with waited:
+            with self._cond:
+                while not self._has_room(destination):
+                    self._cond.wait()
+
+                self._in_flight += 1
+                self._by_destination[destination] = self._by_destination.get(destination, 0) + 1
+
+            self._bucket.acquire()
+
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._by_destination[destination] -= 1
+                if self._by_destination[destination] == 0:
+                    del self._by_destination[destination]
+                self._cond.notify_all()
+
+
+class ConnectionPool:
+    """ Holds open connection chains, keyed by host.
+        At most `max_size` chains are kept open; when full, the least recently
+        used idle chain is disconnected to make room, and if every chain is
+        leased, callers wait for one to be released. Chains idle for longer
+        than `idle_timeout` seconds are disconnected the next time the pool
+        is used. Only one caller opens a given key at a time; others asking
+        for the same key wait for it instead of opening their own.
+    """
+
+    def __init__(self, router: Router, max_size: Optional[int]=None, idle_timeout: Optional[float]=None, shutdown_timeout: float=DEFAULT_SHUTDOWN_TIMEOUT):
+        self._router = router
+        self._max_size = max_size or None
+        self._idle_timeout = idle_timeout or None
+        self._shutdown_timeout = shutdown_timeout
+        self._entries: OrderedDict[str, PooledConnection] = OrderedDict()
+        self._opening: Set[str] = set()
+        self._cond = threading.Condition()
+        self.stats = PoolStats()
+
+    def __repr__(self) -> str:
+        return f"<ConnectionPool size={len(self)} max_size={self._max_size} idle_timeout={self._idle_timeout}>"
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def _full(self) -> bool:
+        return self._max_size is not None and len(self._entries) + len(self._opening) >= self._max_size
+
+    def _pop_expired(self) -> List[PooledConnection]:
+        if self._idle_timeout is None:
+            return []
+
+        now = time.monotonic()
+        expired = [entry for entry in self._entries.values() if entry.idle_for(now) > self._idle_timeout]
+        for entry in expired:
+            del self._entries[entry.key]
+            self.stats.expirations += 1
+
+        return expired
+
+    def _pop_lru_idle(self) -> Optional[PooledConnection]:
+        for entry in self._entries.values():
+            if entry.leases == 0:
+                del self._entries[entry.key]
+                self.stats.evictions += 1
+                return entry
+
+        return None
+
+    def _acquire(self, key: str) -> Tuple[Optional[PooledConnection], List[PooledConnection]]:
+        """ Returns (entry, to_close). If entry is None, the caller holds an
+            opening slot and has to create the connection.
+        """
+
+        to_close: List[PooledConnection] = []
+        waited_on_open = False
+        with self._cond:
+            to_close.extend(self._pop_expired())
+            while True:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.leases += 1
+                    self._entries.move_to_end(key)
+                    if waited_on_open:
+                        self.stats.coalesced += 1
+                    else:
+                        self.stats.hits += 1
+                    return entry, to_close
+
+                if key in self._opening:
+                    waited_on_open = True
+                    self._cond.wait()
+                    continue
+
+                if not self._full():
+                    break
+
+                evicted = self._pop_lru_idle()
+                if evicted is not None:
+                    to_close.append(evicted)
+                    continue
+
+                logger.debug(f"Connection pool is full, waiting for a connection to be released ({key})")
+                self._cond.wait()
+
+            self._opening.add(key)
+            self.stats.misses += 1
+            return None, to_close
+
+    def _insert(self, key: str, chain: List[Context]) -> PooledConnection:
+        with self._cond:
+            self._opening.discard(key)
+            self.stats.opened += 1
+            entry = PooledConnection(key, chain)
+            entry.leases += 1
+            self._entries[key] = entry
+            self._cond.notify_all()
+            return entry
+
+    def _abandon(self, key: str):
+        with self._cond:
+            self._opening.discard(key)
+            self._cond.notify_all()
+
+    def _release(self, entry: PooledConnection):
+        with self._cond:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self, key: str, factory: Callable[[], List[Context]]) -> Iterator[Context]:
+        """ Leases the connection for `key`, opening it with `factory` if
+            it isn't already open. `factory` returns the connection chain,
+            outermost context first.
+        """
+
+        entry, to_close = self._acquire(key)
+        self._close_all(to_close)
+
+        if entry is None:
+            try:
+                chain = factory()
+            except BaseException:
+                self._abandon(key)
+                raise
+
+            entry = self._insert(key, chain)
+
+        try:
+            yield entry.context
+        finally:
+            self._release(entry)
+
+    def discard(self, key: str, force: bool=False):
+        """ Disconnects and forgets the connection for `key`, eg. after it broke.
+            If `force` is set, the chain is torn down without asking each
+            context to shut down first, eg. when it is stuck in a call.
+        """
+
+        with self._cond:
+            entry = self._entries.pop(key, None)
+            self._cond.notify_all()
+
+        if entry is not None:
+            self._close(entry, force=force)
+
+    def reap(self):
+        """ Disconnects every chain that has been idle for too long.
+        """
+
+        with self._cond:
+            expired = self._pop_expired()
+            self._cond.notify_all()
+
+        self._close_all(expired)
+
+    def close(self):
+        with self._cond:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._cond.notify_all()
+
+        self._close_all(entries)
+
+    def _close_all(self, entries: List[PooledConnection]):
+        for entry in entries:
+            self._close(entry)
+
+        if entries:
+            with self._cond:
+                self._cond.notify_all()
+
+    def _close(self, entry: PooledConnection, force: bool=False):
+        """ Shuts down a chain innermost first, so each context exits before
+            the one it was started through. Disconnecting the outermost
+            context takes everything started through it down with it.
+        """
+
+        logger.debug(f"Disconnecting {entry}")
+        for ctx in [] if force else reversed(entry.chain):
+            try:
+                ctx.shutdown().get(timeout=self._shutdown_timeout)
+            except TimeoutError:
+                logger.warning(f"Timed out shutting down {ctx} for {entry.key}")
+            except Exception:
+                logger.exception(f"Error shutting down {ctx} for {entry.key}")
+
+        try:
+            self._disconnect(entry.chain[0])
+        except Exception:
+            logger.exception(f"Error disconnecting {entry.chain[0]} for {entry.key}")
+
+        with self._cond:
+            self.stats.closed += 1
+
+    def _disconnect(self, ctx: Context):
+        """ Drops the stream to a context, which takes down every context
+            started through it. A context started through another one, eg. a
+            jump host, is dropped by that one, as our only stream leads there.
+            Router.disconnect() looks the stream up by context rather than by
+            its id, so never finds it.
+        """
+
+        if ctx.via is not None:
+            ctx.via.call_no_reply(relay.disconnect, ctx.context_id)
+            return
+
+        stream = self._router.stream_by_id(ctx.context_id)
+        if stream is None or stream.protocol.remote_id != ctx.context_id:
+            return
+
+        self._router.broker.defer(stream.on_disconnect, self._router.broker)
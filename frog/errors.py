@@ -2,21 +2,94 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from frog.inventory import InventoryItem
 
 
 class ConnectionError(Exception):
     def __init__(self, host: InventoryItem):
-        super().__init__(self)
+        # Plain args, so failures carrying them serialize and pickle.
+        super().__init__(host.host)
         self._host = host
         self._cause: Optional[Exception] = None
+        self._reason = "unknown"
 
     def __repr__(self):
-        return f"Error connecting to {self._host.host}: {self._cause or 'unknown'}"
+        return f"Error connecting to {self._host.host}: {self._reason}"
 
     __str__ = __repr__
 
     def with_cause(self, cause: Optional[Exception]) -> ConnectionError:
         self._cause = cause
+        if cause is not None:
+            # Mitogen follows why a child failed to start with its whole
+            # command line, which differs by host and process and buries it.
+            self._reason = str(cause).split(". Command was: ")[0]
+        self.args = (self._host.host, self._reason)
+
+        return self
+
+
+class ShardError(Exception):
+    def __init__(self, shard: int, exitcode: Optional[int]):
+        super().__init__(shard, exitcode)
+        self.shard = shard
+        self.exitcode = exitcode
+
+    def __repr__(self):
+        return f"Shard {self.shard} exited with code {self.exitcode} before reporting a result"
+
+    __str__ = __repr__
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, host: str, phase: str, seconds: float):
+        super().__init__(host, phase, seconds)
+        self.host = host
+        self.phase = phase
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"{self.host} did not finish its {self.phase} within {self.seconds}s"
+
+    __str__ = __repr__
+
+
+class HostUnreachable(Exception):
+    def __init__(self, host: str, reason: str):
+        super().__init__(host, reason)
+        self.host = host
+        self.reason = reason
 
-        return self
\ No newline at end of file
+    def __repr__(self):
+        return f"{self.host} is unreachable: {self.reason}"
+
+    __str__ = __repr__
+
+
+class RolloutAborted(Exception):
+    def __init__(self, host: str, reason: str):
+        super().__init__(host, reason)
+        self.host = host
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Not run on {self.host}: {self.reason}"
+
+    __str__ = __repr__
+
+
+class RecipeFailed(Exception):
+    def __init__(self, recipe: str, failed: Dict[str, str], skipped: List[str]):
+        super().__init__(recipe, failed, skipped)
+        self.recipe = recipe
+        self.failed = failed
+        self.skipped = skipped
+
+    def __repr__(self):
+        failed = ", ".join(f"{name}: {error}" for name, error in self.failed.items())
+        return f"Recipe {self.recipe} failed ({failed}), skipped {len(self.skipped)} recipes depending on them"
+
+    __str__ = __repr__
@@ -7,6 +7,11 @@ import pathlib
 import pickle
 from datetime import datetime, timedelta
 
+from frog import metrics
+
+""" Fact cache lookups, by cache and whether usable facts were found. """
+LOOKUPS = metrics.REGISTRY.counter("frog_fact_cache_lookups_total", "Fact cache lookups, by cache and outcome")
+
 
 class FactCache(metaclass=abc.ABCMeta):
 
@@ -28,10 +33,14 @@ class MemoryFactCache(FactCache):
 
     def get(self, hostname: str) -> dict:
         try:
-            return self._cache[hostname]
+            facts = self._cache[hostname]
         except KeyError:
+            LOOKUPS.inc(cache="memory", outcome="miss")
             raise FactCache.NeedsUpdate(hostname)
 
+        LOOKUPS.inc(cache="memory", outcome="hit")
+        return facts
+
     def update(self, hostname: str, data: dict):
         self._cache[hostname] = data
 
@@ -61,8 +70,10 @@ class FilesystemFactCache(FactCache):
     def get(self, hostname: str) -> dict:
         host_cache = self.get_host_cache_path(hostname)
         if not self.is_valid(host_cache):
+            LOOKUPS.inc(cache="filesystem", outcome="miss")
             raise FactCache.NeedsUpdate(hostname)
 
+        LOOKUPS.inc(cache="filesystem", outcome="hit")
         with io.open(str(host_cache.absolute()), "rb") as cache_fp:
             return pickle.load(cache_fp)
 
@@ -3,6 +3,7 @@
 import concurrent.futures
 import logging
 import os
+import socket
 
 from frog import context
 from frog.facts import (
@@ -20,16 +21,19 @@ def gather() -> dict:
     """ Gathers all facts for a host and returns a meta dictionary. """
 
     data = {}
+    # Facts may be gathered while bringing a connection up, before any
+    # inventory context has been sent over.
+    hostname = context.host.host if context.host else socket.gethostname()
     timer = Timer()
     with timer:
         fs = []
         with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-            logger.debug(f"Starting fact gathering on host {context.host.host}")
+            logger.debug(f"Starting fact gathering on host {hostname}")
             fs = [executor.submit(mod.gather) for mod in _modules]
 
         for gathered in concurrent.futures.as_completed(fs):
             data.update(gathered.result())
 
-    logger.debug(f"Done fact gathering on {context.host.host}, took {timer.time_taken}s")
+    logger.debug(f"Done fact gathering on {hostname}, took {timer.time_taken}s")
 
     return data
\ No newline at end of file
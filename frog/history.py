@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import heapq
+import io
+import json
+import logging
+import os
+import pathlib
+import statistics
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from frog.inventory import InventoryItem
+
+logger = logging.getLogger(__name__)
+
+""" Weight of the newest duration against what was known before. """
+DEFAULT_SMOOTHING = 0.5
+
+
+def predict_makespan(durations: Sequence[float], slots: Optional[int]) -> float:
+    """ How long running `durations` in order takes when at most `slots`
+        run at once, each starting as soon as a slot frees up.
+    """
+
+    if not durations:
+        return 0.0
+    if not slots:
+        return max(durations)
+
+    finishes = [0.0] * min(slots, len(durations))
+    for duration in durations:
+        heapq.heappush(finishes, heapq.heappop(finishes) + duration)
+
+    return max(finishes)
+
+
+class DurationHistory:
+    """ How long each target took on each host in previous runs, kept in a
+        small JSON file as {target: {host: seconds}}.
+    """
+
+    def __init__(self, path: pathlib.Path, smoothing: float=DEFAULT_SMOOTHING):
+        self._path = pathlib.Path(path)
+        self._smoothing = smoothing
+        self._durations: Dict[str, Dict[str, float]] = self._load()
+        self._recorded: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<DurationHistory at {self._path}>"
+
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        try:
+            with io.open(self._path, "r") as history_fp:
+                return json.load(history_fp)
+        except (OSError, ValueError):
+            return {}
+
+    def expected(self, host: str, target: str) -> Optional[float]:
+        with self._lock:
+            return self._durations.get(target, {}).get(host)
+
+    def record(self, host: str, target: str, seconds: float):
+        with self._lock:
+            durations = self._durations.setdefault(target, {})
+            previous = durations.get(host)
+            smoothed = seconds if previous is None else previous + self._smoothing * (seconds - previous)
+            durations[host] = smoothed
+            self._recorded.setdefault(target, {})[host] = smoothed
+
+    def estimates(self, items: Iterable[InventoryItem], targets: Sequence[str]) -> Dict[str, float]:
+        """ Expected duration of running `targets` on each host. Hosts we know
+            nothing about are expected to take the median of the ones we know.
+        """
+
+        items = list(items)
+        estimates = {item.host: 0.0 for item in items}
+        with self._lock:
+            for target in targets:
+                known = self._durations.get(target, {})
+                fallback = statistics.median(known.values()) if known else 0.0
+                for item in items:
+                    estimates[item.host] += known.get(item.host, fallback)
+
+        return estimates
+
+    def longest_first(self, items: Sequence[InventoryItem], targets: Sequence[str]) -> List[InventoryItem]:
+        estimates = self.estimates(items, targets)
+        # sorted() is stable, so hosts expected to take as long keep their order.
+        return sorted(items, key=lambda item: estimates[item.host], reverse=True)
+
+    def save(self):
+        """ Writes what was recorded to disk, on top of whatever other runs
+            wrote there since we loaded it.
+        """
+
+        with self._lock:
+            recorded = {target: dict(durations) for target, durations in self._recorded.items()}
+            self._recorded.clear()
+
+        if not recorded:
+            return
+
+        # Groups of hosts may finish, and save, at the same time.
+        with self._save_lock:
+            durations = self._load()
+            for target, hosts in recorded.items():
+                durations.setdefault(target, {}).update(hosts)
+
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._path.parent, prefix=f".{self._path.name}.")
+            with io.open(fd, "w") as history_fp:
+                json.dump(durations, history_fp)
+            os.replace(tmp_path, self._path)
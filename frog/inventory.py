@@ -2,13 +2,14 @@
 
 from __future__ import annotations
 
+import copy
 import dataclasses
 import io
 import json
 import pathlib
 from functools import reduce
 from itertools import chain
-from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Sized, Tuple
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Sized, Tuple
 
 import yaml
 from mitogen.core import Context
@@ -45,6 +46,27 @@ def _load_file(inv_path: pathlib.Path) -> Tuple[str, dict]:
         return (inv_name, yaml.safe_load(inv_file))
 
 
+def synthetic(count: int, groups: int=1, connection_method: Optional[dict]=None, prefix: str="sim") -> List[Tuple[str, dict]]:
+    """ Generates inventories of `count` made up hosts spread over `groups`
+        groups, as (group, inventory) like `load` reads them from files.
+        Hosts are reached through `connection_method`, by default each as
+        its own interpreter on this machine, without sudo or bootstrapping.
+    """
+
+    if connection_method is None:
+        connection_method = {"type": "local", "options": {"sudo": False, "bootstrap": False}}
+
+    width = len(str(max(count - 1, 0)))
+    inventories: List[Tuple[str, dict]] = [(f"{prefix}{group}", {"hosts": []}) for group in range(groups)]
+    for index in range(count):
+        inventories[index % groups][1]["hosts"].append({
+            "host": f"{prefix}-{index:0{width}d}",
+            "connection_method": copy.deepcopy(connection_method),
+        })
+
+    return inventories
+
+
 class Inventory(DictSerializable, Sized):
     """ Represents a collection of hosts.
     """
@@ -52,17 +74,22 @@ class Inventory(DictSerializable, Sized):
     hosts: Mapping[str, List[InventoryItem]]
     parent: Optional[Inventory] = None
 
+    """ Groups that have to be converged before each group is worked on. """
+    dependencies: Dict[str, List[str]]
+
     @classmethod
     def combine(cls, inventories: List[Tuple[str, dict]]) -> Inventory:
         hosts: Dict[str, List[InventoryItem]] = {}
+        dependencies: Dict[str, List[str]] = {}
         for (group, inventory) in inventories:
             options = inventory.get("options", {})
             hosts.setdefault(group, [])
             items = [InventoryItem(**host) for host in inventory.get("hosts", [])]
             [item.inherits_options(options) for item in items]
             hosts[group].extend(items)
+            dependencies.setdefault(group, []).extend(inventory.get("depends_on", []))
 
-        return Inventory(hosts)
+        return Inventory(hosts, dependencies={group: deps for group, deps in dependencies.items() if deps})
 
     @classmethod
     def fromdict(cls, data: dict) -> Inventory:
@@ -73,11 +100,13 @@ class Inventory(DictSerializable, Sized):
         props = json.loads(data)
         return cls.fromdict(props)
 
-    def __init__(self, hosts: Optional[Mapping[str, List[InventoryItem]]], parent: Optional[Inventory]=None):
+    def __init__(self, hosts: Optional[Mapping[str, List[InventoryItem]]], parent: Optional[Inventory]=None,
+                 dependencies: Optional[Dict[str, List[str]]]=None):
         if hosts is None:
             hosts = {}
         self.hosts = hosts
         self.parent = parent
+        self.dependencies = dependencies or {}
 
     def __repr__(self) -> str:
         return f"<Inventory object, groups={list(self.hosts.keys())}>"
@@ -88,6 +117,16 @@ class Inventory(DictSerializable, Sized):
     def __len__(self) -> int:
         return reduce(lambda acc, group: acc+len(group), self.hosts.values(), 0)
 
+    def root(self) -> Inventory:
+        """ Returns the inventory this one was ultimately selected from.
+        """
+
+        root = self
+        while root.parent is not None:
+            root = root.parent
+
+        return root
+
     def select(self, criteria: str) -> Inventory:
         subset: Dict[str, List[InventoryItem]] = {}
 
@@ -99,10 +138,18 @@ class Inventory(DictSerializable, Sized):
 
         return Inventory(subset, parent=self)
 
+    def where(self, predicate: Callable[[InventoryItem], bool]) -> Inventory:
+        """ Returns the subset of hosts `predicate` is true for.
+        """
+
+        subset = {group: [item for item in items if predicate(item)] for group, items in self.hosts.items()}
+        return Inventory(subset, parent=self)
+
     def asdict(self) -> dict:
         return {
             "hosts": self.hosts,
             "parent": self.parent,
+            "dependencies": self.dependencies,
         }
 
     def asjson(self) -> str:
@@ -182,15 +229,78 @@ class InventoryItem(DictSerializable):
         if not self.jump_via:
             self.jump_via = options.get("jump_via")
 
+    @property
+    def destination(self) -> str:
+        """ Where connections to this host are made to: the jump host if
+            there is one, otherwise the host itself.
+        """
+
+        if self.jump_via:
+            return self.jump_via.host if isinstance(self.jump_via, InventoryItem) else str(self.jump_via)
+
+        options = self.connection_method.options
+        return options.get("hostname") or options.get("container") or self.host
+
+    @property
+    def escalates(self) -> bool:
+        """ Whether connections to this host sudo to `sudo_as`.
+        """
+
+        return bool(self.sudo_as) and self.connection_method.escalates()
+
+    def jump_item(self) -> Optional[InventoryItem]:
+        """ The jump host this host is reached through. A jump host given
+            only by name is reached as a plain SSH host.
+        """
+
+        if not self.jump_via:
+            return None
+        elif isinstance(self.jump_via, InventoryItem):
+            return self.jump_via
+        elif isinstance(self.jump_via, dict):
+            return InventoryItem.fromdict(dict(self.jump_via))
+
+        return InventoryItem(str(self.jump_via), {"type": "ssh", "options": {"hostname": str(self.jump_via)}})
+
+    def probe_address(self) -> Optional[Tuple[str, int]]:
+        """ Where to check this host is reachable, if it is reached directly.
+        """
+
+        if self.jump_via:
+            return None
+
+        return self.connection_method.probe_address()
+
     def open_connection(self, router: Router) -> Context:
-        ctx = self.connection_method.connect(router)
-        if self.sudo_as:
-            ctx = router.sudo(
-                username=self.sudo_as,
-                via=ctx,
-            )
+        return self.open_connection_chain(router)[-1]
+
+    def open_connection_chain(self, router: Router, python_path: Optional[List[str]]=None, via: Optional[Context]=None,
+                              **options) -> List[Context]:
+        """ Opens a connection to the host, through `via` if given, returning
+            every context along the way, outermost first. If `python_path` is
+            given, the innermost context runs that interpreter. `options`
+            apply to every context, eg. `profiling`.
+        """
+
+        hop = dict(options) if via is None else dict(options, via=via)
+        innermost = dict(options) if python_path is None else dict(options, python_path=python_path)
+        if not self.escalates:
+            return [self.connection_method.connect(router, **dict(hop, **innermost))]
+
+        chain = [self.connection_method.connect(router, **hop)]
+        chain.append(self.escalate(router, chain[-1], **innermost))
+
+        return chain
+
+    def escalate(self, router: Router, via: Context, **overrides) -> Context:
+        """ Opens the sudo hop to `sudo_as` through `via`.
+        """
 
-        return ctx
+        return router.sudo(
+            username=self.sudo_as,
+            via=via,
+            **overrides,
+        )
 
     def update_facts(self, new_facts: dict):
         """ Updates the facts we have stored with a new set of facts.
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import io
+import json
+import logging
+import os
+import pathlib
+import secrets
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from frog.runner import ExecutionResult
+
+logger = logging.getLogger(__name__)
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(3)}"
+
+
+class Journal:
+    """ Append-only record of a run's results, one JSON document per line
+        in `<directory>/<run id>.jsonl`, headed by what the run executed.
+        Every result is written out as soon as it is known, so a run the
+        controller died in the middle of can be resumed from it.
+    """
+
+    def __init__(self, directory: pathlib.Path, run_id: Optional[str]=None):
+        self.run_id = run_id or new_run_id()
+        self.path = pathlib.Path(directory) / f"{self.run_id}.jsonl"
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<Journal {self.run_id} at {self.path}>"
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def header(self) -> Optional[dict]:
+        for record in self._records():
+            return record.get("run")
+
+        return None
+
+    def start(self, target: str, kw: dict):
+        """ Opens the journal for appending, writing its header if it's new.
+        """
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not self.exists()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        if is_new:
+            self._write({"run": {"id": self.run_id, "target": target, "parameters": kw, "started": time.time()}})
+        elif not self._ends_with_newline():
+            # We died writing the last line, don't let it swallow the next.
+            os.write(self._fd, b"\n")
+
+    def _ends_with_newline(self) -> bool:
+        with io.open(self.path, "rb") as journal_fp:
+            journal_fp.seek(0, io.SEEK_END)
+            if journal_fp.tell() == 0:
+                return True
+
+            journal_fp.seek(-1, io.SEEK_END)
+            return journal_fp.read(1) == b"\n"
+
+    def _write(self, record: dict):
+        # A single write to a file opened for appending lands in one piece,
+        # and is safe from us dying as soon as it returns.
+        line = json.dumps(record, default=repr) + "\n"
+        with self._lock:
+            os.write(self._fd, line.encode("utf-8"))
+
+    def append(self, results: Iterable[ExecutionResult]):
+        if self._fd is None:
+            return
+
+        for result in results:
+            self._write({"result": result.asdict()})
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _records(self) -> Iterator[dict]:
+        try:
+            journal_fp = io.open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+
+        with journal_fp:
+            for line in journal_fp:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # The last line is cut short if we died writing it.
+                    logger.warning(f"Skipping unreadable line in {self.path}")
+
+    def results(self, latest_only: bool=False) -> Iterator[ExecutionResult]:
+        """ Reads the results back, in the order they were recorded. With
+            `latest_only`, only each host's last result is returned, which
+            takes a second pass over the file rather than holding results.
+        """
+
+        latest: Optional[Dict[str, int]] = None
+        if latest_only:
+            latest = {}
+            for index, record in enumerate(self._records()):
+                if "result" in record:
+                    latest[record["result"]["host"]] = index
+
+        for index, record in enumerate(self._records()):
+            if "result" not in record:
+                continue
+            if latest is not None and latest[record["result"]["host"]] != index:
+                continue
+
+            yield ExecutionResult.fromdict(record["result"])
+
+    def succeeded(self) -> Set[str]:
+        """ Hosts whose last recorded result was a success.
+        """
+
+        return {result.host for result in self.results(latest_only=True) if result.success}
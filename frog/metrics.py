@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import abc
+import bisect
+import http.server
+import io
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+""" Upper bounds, in seconds, of latency histogram buckets. """
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(metaclass=abc.ABCMeta):
+    """ A named metric, with one value per set of labels.
+    """
+
+    TYPE: str
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.name}>"
+
+    @abc.abstractmethod
+    def samples(self) -> list:
+        """ [labels, value] of every label set, as plain data.
+        """
+
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def merge(self, samples: list):
+        """ Adds samples taken elsewhere, eg. by another process.
+        """
+
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [[list(map(list, labels)), value] for labels, value in self._values.items()]
+
+    def merge(self, samples: list):
+        for labels, value in samples:
+            self.inc(value, **dict(labels))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = sorted(buckets)
+        # labels -> [count per bucket, then past the last], sum
+        self._values: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts, _ = self._values.get(_labels(labels)) or ([], 0.0)
+            return sum(counts)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [[list(map(list, labels)), [list(counts), total]] for labels, (counts, total) in self._values.items()]
+
+    def merge(self, samples: list):
+        for labels, (counts, total) in samples:
+            key = _labels(dict(labels))
+            with self._lock:
+                mine, my_total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+                self._values[key] = ([a + b for a, b in zip(mine, counts)], my_total + total)
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip([*self.buckets, float("inf")], counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels + (("le", _format_value(bound)),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+
+        return lines
+
+
+class Registry:
+    """ Every metric frog keeps, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<Registry metrics={len(self._metrics)}>"
+
+    def _get_or_create(self, kind: type, name: str, help: str, **kw) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, help, **kw)
+            elif not isinstance(metric, kind):
+                raise ValueError(f"Metric {name} is a {metric.TYPE}, not a {kind.TYPE}")
+
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float]=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def samples(self) -> Dict[str, list]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return {metric.name: metric.samples() for metric in metrics}
+
+    def merge(self, samples: Dict[str, list]):
+        """ Adds samples taken by another registry, for metrics known here.
+        """
+
+        with self._lock:
+            metrics = dict(self._metrics)
+
+        for name, metric_samples in samples.items():
+            if name in metrics:
+                metrics[name].merge(metric_samples)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: pathlib.Path):
+        """ Writes every metric to `path`, for node_exporter's textfile
+            collector, which must never see a half written file.
+        """
+
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        with io.open(fd, "w") as metrics_fp:
+            metrics_fp.write(self.render())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, address: str="127.0.0.1") -> http.server.ThreadingHTTPServer:
+        """ Serves every metric on http://`address`:`port`/metrics from a
+            background thread, until the returned server is shut down.
+        """
+
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request from {self.address_string()}: {format % args}")
+
+        server = http.server.ThreadingHTTPServer((address, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(name="metrics-server", target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on http://{address}:{server.server_address[1]}/metrics")
+        return server
+
+
+""" The registry frog's own metrics are kept in. """
+REGISTRY = Registry()
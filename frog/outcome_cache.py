@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional
+
+if TYPE_CHECKING:
+    from frog.runner import ExecutionResult
+
+logger = logging.getLogger(__name__)
+
+""" Seconds an unchanged outcome is trusted for. """
+DEFAULT_OUTCOME_TTL = 600
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+
+def unchanged(changed: Any) -> bool:
+    """ Whether what a resource returned says it changed nothing: False, or
+        a mapping of False, as batched resources return.
+    """
+
+    if isinstance(changed, Mapping):
+        return all(unchanged(value) for value in changed.values())
+
+    return changed is False
+
+
+class OutcomeCache:
+    """ Remembers, on disk, which calls last left their host unchanged, so
+        a call made again within `ttl` with the same parameters on a host
+        with the same facts can be skipped. Hosts are only spared a
+        connection if their facts come from a persistent fact cache.
+    """
+
+    def __init__(self, path: pathlib.Path, ttl: float=DEFAULT_OUTCOME_TTL, skip: bool=True):
+        self._path = pathlib.Path(path)
+        self._ttl = ttl
+        self.skip = skip
+        self._entries: Optional[Dict[str, float]] = None
+        self._recorded: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.hits = 0
+
+    def __repr__(self) -> str:
+        return f"<OutcomeCache at {self._path} (lifetime {self._ttl}s)>"
+
+    @staticmethod
+    def key(host: str, target: str, kw: Optional[dict], facts: Optional[dict]) -> str:
+        return _digest([host, target, _digest(kw or {}), _digest(facts or {})])
+
+    def _load(self) -> Dict[str, float]:
+        try:
+            with io.open(self._path, "r") as cache_fp:
+                entries = json.load(cache_fp)
+        except (OSError, ValueError):
+            return {}
+
+        now = time.time()
+        return {key: at for key, at in entries.items() if now - at < self._ttl}
+
+    def is_unchanged(self, key: str) -> bool:
+        """ Whether the call `key` was made recently and changed nothing,
+            and may be skipped.
+        """
+
+        if not self.skip:
+            return False
+
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+
+            at = self._entries.get(key)
+            if at is None or time.time() - at >= self._ttl:
+                return False
+
+            self.hits += 1
+            return True
+
+    def record(self, key: str, result: ExecutionResult):
+        """ Remembers a call that changed nothing, and forgets one that
+            changed something or failed.
+        """
+
+        at = time.time() if result.success is not None and unchanged(result.success.get("changed")) else None
+        with self._lock:
+            self._recorded[key] = at
+            if self._entries is not None:
+                if at is None:
+                    self._entries.pop(key, None)
+                else:
+                    self._entries[key] = at
+
+    def save(self):
+        """ Writes what was recorded to disk, on top of whatever other runs
+            wrote there since we loaded it. Expired entries are dropped.
+        """
+
+        with self._lock:
+            recorded = dict(self._recorded)
+            self._recorded.clear()
+
+        if not recorded:
+            return
+
+        with self._save_lock:
+            entries = self._load()
+            for key, at in recorded.items():
+                if at is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = at
+
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._path.parent, prefix=f".{self._path.name}.")
+            with io.open(fd, "w") as cache_fp:
+                json.dump(entries, cache_fp)
+            os.replace(tmp_path, self._path)
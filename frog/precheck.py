@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from frog.inventory import Inventory
+from frog.util import Timer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROBE_TIMEOUT = 2.0
+DEFAULT_PROBE_CONCURRENCY = 512
+DEFAULT_CACHE_TTL = 60
+
+Address = Tuple[str, int]
+
+
+def _key(address: Address) -> str:
+    return f"{address[0]}:{address[1]}"
+
+
+class ProbeCache:
+    """ Remembers probe outcomes on disk for `ttl` seconds, so repeated runs
+        don't wait on hosts that were just found to be down.
+    """
+
+    def __init__(self, path: pathlib.Path, ttl: float=DEFAULT_CACHE_TTL):
+        self._path = pathlib.Path(path)
+        self._ttl = ttl
+
+    def __repr__(self) -> str:
+        return f"<ProbeCache at {self._path} (lifetime {self._ttl}s)>"
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with io.open(self._path, "r") as cache_fp:
+                entries = json.load(cache_fp)
+        except (OSError, ValueError):
+            return {}
+
+        now = time.time()
+        return {key: entry for key, entry in entries.items() if now - entry["at"] < self._ttl}
+
+    def get_all(self, addresses: Iterable[Address]) -> Dict[Address, Optional[str]]:
+        """ Returns the cached outcome of each address that has one: None if
+            it was up, otherwise why it wasn't.
+        """
+
+        entries = self._load()
+        return {address: entries[_key(address)]["error"] for address in addresses if _key(address) in entries}
+
+    def update(self, outcomes: Dict[Address, Optional[str]]):
+        entries = self._load()
+        now = time.time()
+        entries.update({_key(address): {"at": now, "error": error} for address, error in outcomes.items()})
+
+        # Written aside and moved into place, since other runs may be
+        # reading it at the same time.
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._path.parent, prefix=f".{self._path.name}.")
+        with io.open(fd, "w") as cache_fp:
+            json.dump(entries, cache_fp)
+        os.replace(tmp_path, self._path)
+
+
+class Prober:
+    """ Checks every directly reachable host accepts TCP connections on its
+        connection port, all at once with a short timeout, so hosts that are
+        down fail in seconds instead of each waiting out the SSH connect
+        timeout.
+    """
+
+    def __init__(self, timeout: float=DEFAULT_PROBE_TIMEOUT, concurrency: int=DEFAULT_PROBE_CONCURRENCY, cache: Optional[ProbeCache]=None):
+        self._timeout = timeout
+        self._concurrency = concurrency
+        self._cache = cache
+
+    def __repr__(self) -> str:
+        return f"<Prober timeout={self._timeout} concurrency={self._concurrency} cache={self._cache}>"
+
+    def check(self, hosts: Inventory) -> Dict[str, str]:
+        """ Returns why each unreachable host in `hosts` is unreachable.
+            Hosts that can't be probed directly are assumed to be reachable.
+        """
+
+        addresses: Dict[str, Address] = {}
+        for item in hosts:
+            address = item.probe_address()
+            if address is not None:
+                addresses[item.host] = address
+
+        unique = set(addresses.values())
+        outcomes = self._cache.get_all(unique) if self._cache is not None else {}
+        to_probe = unique - set(outcomes)
+
+        timer = Timer()
+        with timer:
+            probed = asyncio.run(self._probe_all(to_probe)) if to_probe else {}
+        logger.debug(f"Probed {len(to_probe)} addresses in {timer.time_taken}s, {len(unique) - len(to_probe)} were cached")
+
+        if self._cache is not None and probed:
+            self._cache.update(probed)
+        outcomes.update(probed)
+
+        return {host: outcomes[address] for host, address in addresses.items() if outcomes[address] is not None}
+
+    async def _probe_all(self, addresses: Iterable[Address]) -> Dict[Address, Optional[str]]:
+        limit = asyncio.Semaphore(self._concurrency)
+
+        async def probe(address: Address) -> Tuple[Address, Optional[str]]:
+            async with limit:
+                return address, await self._probe(address)
+
+        return dict(await asyncio.gather(*(probe(address) for address in addresses)))
+
+    async def _probe(self, address: Address) -> Optional[str]:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            return f"no answer on {_key(address)} within {self._timeout}s"
+        except OSError as err:
+            return f"{_key(address)}: {err.strerror or err}"
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+        return None
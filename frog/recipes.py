@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import concurrent.futures
+import functools
+import importlib
+import inspect
+import logging
+import os
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+from frog.errors import RecipeFailed
+
+logger = logging.getLogger(__name__)
+
+""" Most recipes run at once on a host. """
+DEFAULT_MAX_WORKERS = 8
+
+
+class Recipe:
+    """ A function decorated with @recipe, and the recipes that have to
+        complete before it runs. Calling a recipe runs it on the host along
+        with everything it depends on, see `execute`.
+    """
+
+    def __init__(self, fn: Callable, desc: str, depends_on: Optional[Sequence[Callable]]=None):
+        functools.update_wrapper(self, fn)
+        self.fn = fn
+        self.desc = desc
+        self.depends_on: List[Recipe] = []
+        for dependency in depends_on or []:
+            if not isinstance(dependency, Recipe):
+                raise TypeError(f"{self.name} depends on {dependency!r}, which is not a @recipe")
+            self.depends_on.append(dependency)
+
+        self._parameters = inspect.signature(fn).parameters
+        self._takes_any = any(param.kind == param.VAR_KEYWORD for param in self._parameters.values())
+
+    def __repr__(self) -> str:
+        return f"<Recipe {self.name}: {self.desc}>"
+
+    def __call__(self, **kw) -> Dict[str, Any]:
+        return execute(self, kw)
+
+    @property
+    def name(self) -> str:
+        return f"{self.fn.__module__}.{self.fn.__qualname__}"
+
+    def run(self, kw: dict) -> Any:
+        """ Runs just this recipe, with whichever of the run's parameters
+            it accepts.
+        """
+
+        if not self._takes_any:
+            kw = {name: value for name, value in kw.items() if name in self._parameters}
+
+        return self.fn(**kw)
+
+
+def graph(root: Recipe) -> Dict[Recipe, List[Recipe]]:
+    """ Returns every recipe `root` needs, `root` included, mapped to the
+        recipes it directly depends on. Raises ValueError on a cycle.
+    """
+
+    found: Dict[Recipe, List[Recipe]] = {}
+    visiting = set()
+
+    def visit(recipe: Recipe, path: List[Recipe]):
+        if recipe in found:
+            return
+        if recipe in visiting:
+            cycle = " -> ".join(r.name for r in path + [recipe])
+            raise ValueError(f"Recipe dependency cycle: {cycle}")
+
+        visiting.add(recipe)
+        for dependency in recipe.depends_on:
+            visit(dependency, path + [recipe])
+        visiting.discard(recipe)
+        found[recipe] = list(recipe.depends_on)
+
+    visit(root, [])
+    return found
+
+
+def execute(root: Recipe, kw: Optional[dict]=None, max_workers: int=DEFAULT_MAX_WORKERS) -> Dict[str, Any]:
+    """ Runs `root` and everything it depends on, each recipe once and as
+        soon as all of its dependencies completed, so independent recipes
+        run side by side. Returns what every recipe returned, by name.
+        Recipes depending on one that failed don't run, and RecipeFailed
+        is raised once everything that could run has. If a recipe is
+        interrupted, eg. by a KeyboardInterrupt, nothing else is started and
+        the interruption is raised once the recipes already running finish.
+    """
+
+    kw = kw or {}
+    dependencies = graph(root)
+    dependents: Dict[Recipe, List[Recipe]] = {recipe: [] for recipe in dependencies}
+    waiting_on = {recipe: len(deps) for recipe, deps in dependencies.items()}
+    for recipe, deps in dependencies.items():
+        for dependency in deps:
+            dependents[dependency].append(recipe)
+
+    results: Dict[str, Any] = {}
+    failed: Dict[str, str] = {}
+    skipped: Set[Recipe] = set()
+    lock = threading.Lock()
+    done = threading.Event()
+    interrupted: List[BaseException] = []
+    remaining = [len(dependencies)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recipe") as pool:
+
+        def finish(recipe: Recipe, ok: bool):
+            ready = []
+            with lock:
+                remaining[0] -= 1
+                if interrupted:
+                    return
+                for dependent in dependents[recipe]:
+                    if dependent in skipped:
+                        continue
+                    if not ok:
+                        skip(dependent)
+                        continue
+                    waiting_on[dependent] -= 1
+                    if waiting_on[dependent] == 0:
+                        ready.append(dependent)
+                if remaining[0] == 0:
+                    done.set()
+
+            for dependent in ready:
+                pool.submit(run, dependent)
+
+        def skip(recipe: Recipe):
+            # Called with the lock held.
+            skipped.add(recipe)
+            remaining[0] -= 1
+            for dependent in dependents[recipe]:
+                if dependent not in skipped:
+                    skip(dependent)
+
+        def run(recipe: Recipe):
+            logger.debug(f"Running recipe {recipe.name}: {recipe.desc}")
+            try:
+                result = recipe.run(kw)
+            except Exception as err:
+                logger.exception(f"Recipe {recipe.name} failed")
+                with lock:
+                    failed[recipe.name] = repr(err)
+                finish(recipe, ok=False)
+                return
+            except BaseException as err:
+                with lock:
+                    interrupted.append(err)
+                    done.set()
+                raise
+
+            with lock:
+                results[recipe.name] = result
+            finish(recipe, ok=True)
+
+        for recipe in [recipe for recipe, deps in dependencies.items() if not deps]:
+            pool.submit(run, recipe)
+
+        done.wait()
+
+    if interrupted:
+        raise interrupted[0]
+    if failed:
+        raise RecipeFailed(root.name, failed, sorted(recipe.name for recipe in skipped))
+
+    return results
+
+
+def load_cookbooks(paths: Iterable[str]):
+    """ Makes the cookbooks in each of `paths` importable, here and, through
+        mitogen's module forwarding, on remote hosts.
+    """
+
+    for path in paths:
+        path = os.path.realpath(path)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def lookup(target: str) -> Recipe:
+    """ Finds the recipe named by `target`, eg. `webserver.site` for the
+        `site` recipe in the `webserver` cookbook.
+    """
+
+    module_name, _, name = target.rpartition(".")
+    if not module_name:
+        raise NameError(f"Recipe named {target} not found")
+
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as err:
+        raise NameError(f"Recipe named {target} not found: {err}")
+
+    found = getattr(module, name, None)
+    if not isinstance(found, Recipe):
+        raise NameError(f"Recipe named {target} not found")
+
+    return found
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import annotations
+
+import hashlib
 import io
 import logging
 import os
@@ -8,13 +11,17 @@ import subprocess
 import sys
 import textwrap
 import venv
-from typing import Optional
+from typing import Optional, Union
 
 from mitogen.core import Context, Router
-from mitogen.service import FileService
+
+from frog.remoteenv import relay
 
 logger = logging.getLogger(__name__)
 
+FINGERPRINT_FILE = ".frog-fingerprint"
+REQUIREMENTS_PATH = pathlib.Path(__file__).parent / "requirements.txt"
+
 
 class Settings:
     def __init__(
@@ -25,14 +32,97 @@ class Settings:
         self.directory = directory
         self.clean = clean
 
+    @classmethod
+    def load(cls, settings: Optional[Union[Settings, dict]]) -> Settings:
+        """ Accepts settings as sent over the wire, where only builtin types
+            can be unpickled.
+        """
+
+        if settings is None:
+            return cls()
+        elif isinstance(settings, dict):
+            return cls(**settings)
+
+        return settings
+
+    def asdict(self) -> dict:
+        return {
+            "directory": self.directory,
+            "clean": self.clean,
+        }
+
+    @property
+    def python_path(self) -> str:
+        return str(pathlib.Path(self.directory) / "bin" / "python3")
+
+
+def requirements_fingerprint() -> str:
+    """ Fingerprint of the remote environment we expect, computed on the controller.
+    """
+
+    with io.open(REQUIREMENTS_PATH, "rb") as requirements:
+        return hashlib.sha256(requirements.read()).hexdigest()
+
 
-def bootstrap(from_ctx: Context, settings: Optional[Settings]=None) -> str:
+def read_fingerprint(settings: Settings) -> Optional[str]:
+    try:
+        with io.open(pathlib.Path(settings.directory) / FINGERPRINT_FILE, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def is_bootstrapped(settings: Settings, fingerprint: Optional[str]) -> bool:
+    return (
+        fingerprint is not None
+        and not settings.clean
+        and os.path.exists(settings.python_path)
+        and read_fingerprint(settings) == fingerprint
+    )
+
+
+def bring_up(settings: Optional[Union[Settings, dict]], fingerprint: str, gather_facts: bool=False,
+             from_ctx: Optional[Context]=None, cookbook_bundle: Optional[str]=None, relay_ctx: Optional[Context]=None,
+             assume_bootstrapped: bool=False) -> dict:
+    """ First call made on a new connection. Checks that the venv is
+        bootstrapped for `fingerprint`, unless told to assume it is, and, if
+        asked, gathers the host's facts and installs the cookbook bundle from
+        `from_ctx`, or the jump host at `relay_ctx`, in the same round trip.
+    """
+
+    settings = Settings.load(settings)
+    state = {
+        "bootstrapped": assume_bootstrapped or is_bootstrapped(settings, fingerprint),
+        "facts": None,
+        "bundle_fetched": None,
+    }
+
+    if state["bootstrapped"] and cookbook_bundle is not None:
+        from frog.remoteenv import bundle
+        state["bundle_fetched"] = bundle.install(from_ctx, settings.directory, cookbook_bundle, relay_ctx=relay_ctx)
+
+    if state["bootstrapped"] and gather_facts:
+        # Fact modules need the venv's packages, and this module is also
+        # imported by the system interpreter we bootstrap from. Go through
+        # the resource so the imports happen in the same order as a call.
+        from frog.resources import facts
+        state["facts"] = facts.gather()
+
+    return state
+
+
+def bootstrap(from_ctx: Context, settings: Optional[Union[Settings, dict]]=None, fingerprint: Optional[str]=None,
+              relay_ctx: Optional[Context]=None) -> str:
     """ Bootstraps a Python virtualenv that we can operate out of.
         Returns a path to the bootstrapped venv's Python.
+        If the venv was already bootstrapped for `fingerprint`, nothing is done.
+        Requirements are fetched through the jump host at `relay_ctx`, if given.
     """
 
-    if settings is None:
-        settings = Settings()
+    settings = Settings.load(settings)
+    if is_bootstrapped(settings, fingerprint):
+        logger.debug(f"{settings.directory} is already bootstrapped for {fingerprint}")
+        return settings.python_path
 
     # So... for some reason, Mitogen(!?) modifies sys._base_executable which breaks venv.
     # Set it to sys.executable temporarily.
@@ -43,7 +133,7 @@ def bootstrap(from_ctx: Context, settings: Optional[Settings]=None) -> str:
     venv.create(
         str(base_dir),
         system_site_packages=False,
-        clear=False,
+        clear=settings.clean,
         with_pip=True,
     )
 
@@ -53,10 +143,14 @@ def bootstrap(from_ctx: Context, settings: Optional[Settings]=None) -> str:
     # Fetch the requirements.txt into the remote environment
     requirements_path = str(base_dir / "requirements.txt")
     with io.BytesIO() as buffer:
-        success, _ = FileService.get(
+        # The fingerprint is the hash of the requirements, so relays can
+        # cache them by it.
+        success = relay.fetch(
             from_ctx,
             "frog/remoteenv/requirements.txt",
+            requirements_fingerprint() if fingerprint is None else fingerprint,
             buffer,
+            relay=relay_ctx,
         )
         if not success:
             raise RuntimeError(f"Bootstrapping failed on {from_ctx}")
@@ -74,7 +168,11 @@ def bootstrap(from_ctx: Context, settings: Optional[Settings]=None) -> str:
 
         logger.debug(f"pip3 venv bootstrapping result: {result}")
 
-        return str(base_dir / "bin" / "python3")
+        if fingerprint is not None:
+            with io.open(base_dir / FINGERPRINT_FILE, "w") as f:
+                f.write(fingerprint)
+
+        return settings.python_path
     except subprocess.CalledProcessError as err:
         logger.exception(f"""Remote dependency installation failed
 stdout:
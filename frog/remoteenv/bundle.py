@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import pathlib
+import sys
+import tempfile
+import zipfile
+from typing import Iterable, List, Optional, Tuple
+
+from mitogen.core import Context
+
+from frog.remoteenv import relay
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_DIRECTORY = "bundles"
+
+""" Timestamp every bundle entry gets, so the same files always zip the same. """
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+_IGNORED_DIRECTORIES = {"__pycache__", ".git", ".hg", ".mypy_cache", ".pytest_cache"}
+_IGNORED_SUFFIXES = {".pyc", ".pyo"}
+
+
+def _collect(paths: Iterable[str]) -> List[Tuple[str, pathlib.Path]]:
+    """ Returns (archive name, file) of every file in the cookbook
+        directories, sorted. Cookbooks sit at the root of the archive, the
+        same as on sys.path.
+    """
+
+    entries = {}
+    for path in paths:
+        root = pathlib.Path(path).resolve()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(name for name in dirnames if name not in _IGNORED_DIRECTORIES)
+            for filename in filenames:
+                file_path = pathlib.Path(dirpath) / filename
+                if file_path.suffix in _IGNORED_SUFFIXES:
+                    continue
+
+                # The first cookbook directory providing a file wins, as it
+                # would on sys.path.
+                entries.setdefault(file_path.relative_to(root).as_posix(), file_path)
+
+    return sorted(entries.items())
+
+
+def build(paths: Iterable[str], out_dir: pathlib.Path) -> Optional[pathlib.Path]:
+    """ Packs the cookbook directories in `paths` into a zip named by the
+        sha256 of its contents, in `out_dir`. The same files always make the
+        same zip. Returns None if there is nothing to pack.
+    """
+
+    entries = _collect(paths)
+    if not entries:
+        return None
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, file_path in entries:
+            info = zipfile.ZipInfo(name, date_time=ZIP_EPOCH)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            archive.writestr(info, file_path.read_bytes())
+
+    contents = buffer.getvalue()
+    out_dir = pathlib.Path(out_dir)
+    bundle_path = out_dir / f"{hashlib.sha256(contents).hexdigest()}.zip"
+    if not bundle_path.exists():
+        out_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=f".{bundle_path.name}.")
+        with io.open(fd, "wb") as bundle_fp:
+            bundle_fp.write(contents)
+        os.replace(tmp_path, bundle_path)
+
+    logger.debug(f"Packed {len(entries)} cookbook files into {bundle_path}")
+    return bundle_path
+
+
+def digest_of(bundle_path: str) -> str:
+    return pathlib.PurePath(bundle_path).stem
+
+
+def install(from_ctx: Context, directory: str, bundle_path: str, relay_ctx: Optional[Context]=None) -> bool:
+    """ Makes the bundle at `bundle_path` on the controller importable here,
+        fetching it into `directory`, through `relay_ctx` if given, unless a
+        bundle with the same digest is already there. Returns whether it had
+        to be fetched.
+    """
+
+    digest = digest_of(bundle_path)
+    local_dir = pathlib.Path(directory) / BUNDLE_DIRECTORY
+    local_path = local_dir / f"{digest}.zip"
+
+    fetched = False
+    if not local_path.exists():
+        local_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=local_dir, prefix=f".{digest}.")
+        try:
+            with io.open(fd, "w+b") as bundle_fp:
+                if not relay.fetch(from_ctx, bundle_path, digest, bundle_fp, relay=relay_ctx):
+                    raise RuntimeError(f"Could not fetch cookbook bundle {digest} from {from_ctx}")
+
+                bundle_fp.seek(0)
+                if hashlib.sha256(bundle_fp.read()).hexdigest() != digest:
+                    raise RuntimeError(f"Cookbook bundle {digest} was corrupted in transfer")
+
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        fetched = True
+
+    # zipimport picks the cookbooks up from here, before mitogen would ask
+    # the controller for them module by module.
+    if str(local_path) not in sys.path:
+        sys.path.insert(0, str(local_path))
+
+    return fetched
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import threading
+from typing import BinaryIO, Dict, Optional
+
+from mitogen.core import Blob, Context, Router, takes_router
+from mitogen.service import AllowAny, FileService, Service, arg_spec, expose
+
+logger = logging.getLogger(__name__)
+
+
+class RelayCache(Service):
+    """ Runs on a jump host and serves content-addressed payloads to the hosts
+        behind it, fetching each one from the controller only once. Payloads
+        are kept in memory for as long as the jump host connection lives.
+    """
+
+    def __init__(self, router: Router):
+        super().__init__(router)
+        self._payloads: Dict[str, bytes] = {}
+        self._fetching: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bytes_fetched": 0, "bytes_served": 0}
+
+    def _count(self, **counts: int):
+        with self._lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    @expose(policy=AllowAny())
+    @arg_spec({
+        "path": str,
+        "digest": str,
+    })
+    def fetch(self, source: Context, path: str, digest: str) -> Blob:
+        """ Returns the contents of `path` on `source`, whose sha256 is `digest`.
+        """
+
+        with self._lock:
+            fetching = self._fetching.setdefault(digest, threading.Lock())
+
+        # Hosts asking for the same payload at once wait on the first one
+        # fetching it rather than all going to the controller.
+        with fetching:
+            payload = self._payloads.get(digest)
+            if payload is None:
+                with io.BytesIO() as buffer:
+                    success, _ = FileService.get(source, path, buffer)
+                    payload = buffer.getvalue()
+                if not success or hashlib.sha256(payload).hexdigest() != digest:
+                    raise RuntimeError(f"Could not relay {path} ({digest}) from {source}")
+
+                self._payloads[digest] = payload
+                self._count(misses=1, bytes_fetched=len(payload))
+            else:
+                self._count(hits=1)
+
+        self._count(bytes_served=len(payload))
+        return Blob(payload)
+
+    @expose(policy=AllowAny())
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+def fetch(from_ctx: Context, path: str, digest: str, out_fp: BinaryIO, relay: Optional[Context]=None) -> bool:
+    """ Fetches `path` from the controller at `from_ctx` into `out_fp`,
+        through the RelayCache on `relay` if there is one.
+    """
+
+    if relay is None:
+        success, _ = FileService.get(from_ctx, path, out_fp)
+        return success
+
+    out_fp.write(relay.call_service(RelayCache.name(), "fetch", source=from_ctx, path=path, digest=digest))
+    return True
+
+
+@takes_router
+def disconnect(context_id: int, router: Router=None):
+    """ Drops this jump host's stream to the context it started as
+        `context_id`, taking down every context started through it. Called
+        by the controller to tear down a chain stuck in a call.
+    """
+
+    stream = router.stream_by_id(context_id)
+    if stream is None or stream.protocol.remote_id != context_id:
+        return
+
+    router.broker.defer(stream.on_disconnect, router.broker)
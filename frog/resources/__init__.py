@@ -7,14 +7,17 @@ import sys
 from typing import Any, Callable, Dict, List
 from types import ModuleType
 
+from frog import recipes
+
 # This line tricks mitogen into pulling all child modules over to the remote hosts.
 from frog.resources import (
-    facts, file, test
+    facts, file, pkg, test
 )
 
 _submodules: Dict[str, ModuleType] = {
     "facts": facts,
     "file": file,
+    "pkg": pkg,
     "test": test,
 }
 
@@ -28,10 +31,15 @@ def fqpn_leaf(fqpn: str) -> str:
 
 
 def lookup(resource: str) -> Callable:
+    """ Finds a resource function, or otherwise a recipe from a cookbook.
+    """
+
     namespace, _, func = resource.partition(".")
     if namespace in _submodules:
         module = _submodules[namespace]
         if func != "" and func in dir(module):
             return getattr(_submodules.get(namespace), func)
 
-    raise NameError(f"Resource named {resource} not found")
\ No newline at end of file
+        raise NameError(f"Resource named {resource} not found")
+
+    return recipes.lookup(resource)
\ No newline at end of file
@@ -1,19 +1,33 @@
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
+import contextlib
+import functools
 import grp
+import hashlib
 import io
 import logging
 import os
 import pwd
+import tempfile
+import threading
 from re import I
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
 from mitogen.service import FileService
 
+from frog import context
 from frog.inventory import InventoryItem
 
 logger = logging.getLogger(__name__)
 
+# Batches at least this large are written from a thread pool on the remote.
+BATCH_CONCURRENCY_THRESHOLD = 32
+BATCH_MAX_WORKERS = 16
+
+# Referenced by name so the remote never has to import jinja2.
+TEMPLATE_SERVICE = "frog.templating.TemplateService"
+
 
 def exists(*, path: str) -> bool:
     """ Returns a boolean of whether a file/directory exists on disk.
@@ -69,11 +83,63 @@ def touch(*, path: str, create_mode: int=0o640, exist_ok: bool=True, update_crea
         os.utime(path, times=(fstat.st_atime, update_create_time))
 
 
-def _update_file_mode(*, path: str, mode: int) -> bool:
+class _StatCache:
+    """ Holds stat results for paths touched during a batch, so each path
+        is only stat'd again after we've changed it.
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, Optional[os.stat_result]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[os.stat_result]:
+        with self._lock:
+            if path in self._stats:
+                return self._stats[path]
+
+        try:
+            fstat = os.stat(path, follow_symlinks=True)
+        except FileNotFoundError:
+            fstat = None
+
+        with self._lock:
+            self._stats[path] = fstat
+
+        return fstat
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._stats.pop(path, None)
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_uid(owner: Union[int, str]) -> int:
+    """ Resolves a user name to a uid, memoized for the life of the remote.
+    """
+
+    if isinstance(owner, int):
+        return owner
+
+    return pwd.getpwnam(owner).pw_uid
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_gid(group: Union[int, str]) -> int:
+    """ Resolves a group name to a gid, memoized for the life of the remote.
+    """
+
+    if isinstance(group, int):
+        return group
+
+    return grp.getgrnam(group).gr_gid
+
+
+def _update_file_mode(*, path: str, mode: int, fstat: Optional[os.stat_result]=None) -> bool:
     """ Returns true if the file mode was updated.
     """
 
-    fstat = os.stat(path, follow_symlinks=True)
+    if fstat is None:
+        fstat = os.stat(path, follow_symlinks=True)
     if (fstat.st_mode & 0o777) != mode:
         os.chmod(path, mode=mode, follow_symlinks=True)
         return True
@@ -81,21 +147,15 @@ def _update_file_mode(*, path: str, mode: int) -> bool:
     return False
 
 
-def _update_file_ownership(*, path: str, owner: Union[int, str], group: Union[int, str], follow_symlinks: bool=False) -> bool:
+def _update_file_ownership(*, path: str, owner: Union[int, str], group: Union[int, str], follow_symlinks: bool=False, fstat: Optional[os.stat_result]=None) -> bool:
     """ Returns true if the file ownership was updated.
     """
 
-    if isinstance(owner, int):
-        to_uid = owner
-    else:
-        to_uid = pwd.getpwnam(owner).pw_uid
-
-    if isinstance(group, int):
-        to_gid = group
-    else:
-        to_gid = grp.getgrnam(group).gr_gid
+    to_uid = _resolve_uid(owner)
+    to_gid = _resolve_gid(group)
 
-    fstat = os.stat(path, follow_symlinks=True)
+    if fstat is None:
+        fstat = os.stat(path, follow_symlinks=True)
     if fstat.st_uid != to_uid or fstat.st_gid != to_gid:
         os.chown(path, to_uid, to_gid, follow_symlinks=follow_symlinks)
         return True
@@ -115,18 +175,48 @@ def put(*, path: str, contents: str, mode: int=0o600, owner: Optional[str]=None,
     """ Places contents onto the remote at path.
     """
 
-    if encoding is None:
-        encoding = "utf-8"
+    return _put_one(_StatCache(), path=path, contents=contents, mode=mode, owner=owner, group=group, overwrite=overwrite, encoding=encoding)
 
-    contents = contents.encode(encoding)
 
-    logger.debug(f"Writing {len(contents)} bytes to path {path}")
+def _write_atomically(path: str, data: bytes, mode: int, owner: Union[int, str], group: Union[int, str], overwrite: bool=True):
+    """ Writes `data` to a temporary file next to `path`, already with its
+        final mode and ownership, and then moves it into place. The contents
+        are never readable by anyone they're not meant for, and `path` never
+        holds half of them. Without `overwrite`, raises FileExistsError if
+        `path` exists.
+    """
+
+    path = os.path.realpath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
+    try:
+        with io.open(fd, "wb") as f:
+            os.fchmod(f.fileno(), mode)
+            uid, gid = _resolve_uid(owner), _resolve_gid(group)
+            if uid != os.geteuid() or gid != os.getegid():
+                os.fchown(f.fileno(), uid, gid)
+            f.write(data)
 
-    fmode = "wb" if overwrite else "xb"
-    with io.open(path, fmode) as f:
         if overwrite:
-            f.truncate(0)
-        f.write(contents)
+            os.replace(tmp_path, path)
+        else:
+            # Linking fails if the path exists, where replacing wouldn't.
+            os.link(tmp_path, path)
+            os.unlink(tmp_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _put_one(stat_cache: _StatCache, *, path: str, contents: str, mode: int=0o600, owner: Optional[Union[int, str]]=None, group: Optional[Union[int, str]]=None, overwrite: bool=False, encoding: Optional[str]=None) -> bool:
+    """ Places a single file spec, reusing the batch's stat results.
+    """
+
+    if encoding is None:
+        encoding = "utf-8"
+
+    # Unquoted parameters like `contents=123` arrive as numbers.
+    contents = str(contents).encode(encoding)
 
     # if owner or group are not set, inherit from the user we're running as
     if owner is None:
@@ -137,8 +227,121 @@ def put(*, path: str, contents: str, mode: int=0o600, owner: Optional[str]=None,
         group = os.getegid()
         logger.debug(f"No group set, defaulting to {group} (for {path})")
 
-    updated = []
-    updated.append(_update_file_mode(path=path, mode=mode))
-    updated.append(_update_file_ownership(path=path, owner=owner, group=group))
+    logger.debug(f"Writing {len(contents)} bytes to path {path}")
+    _write_atomically(path, contents, mode, owner, group, overwrite=overwrite)
+    stat_cache.invalidate(path)
+
+    return True
+
+
+def _ensure_one(stat_cache: _StatCache, *, path: str, contents: Optional[str]=None, mode: int=0o600, owner: Optional[Union[int, str]]=None, group: Optional[Union[int, str]]=None, encoding: Optional[str]=None) -> bool:
+    """ Converges a single file spec, only writing contents that differ.
+    """
+
+    fstat = stat_cache.get(path)
+
+    if owner is None:
+        owner = os.geteuid()
+    if group is None:
+        group = os.getegid()
+
+    if contents is not None:
+        data = str(contents).encode(encoding or "utf-8")
+        current = None
+        if fstat is not None and fstat.st_size == len(data):
+            with io.open(path, "rb") as f:
+                current = f.read()
+
+        if current != data:
+            logger.debug(f"Writing {len(data)} bytes to path {path}")
+            _write_atomically(path, data, mode, owner, group)
+            stat_cache.invalidate(path)
+            return True
+    elif fstat is None:
+        raise FileNotFoundError(f"No such file and no contents given: {path}")
+
+    updated = [
+        _update_file_mode(path=path, mode=mode, fstat=fstat),
+        _update_file_ownership(path=path, owner=owner, group=group, fstat=fstat),
+    ]
+    if any(updated):
+        stat_cache.invalidate(path)
+
+    return any(updated)
+
+
+def _run_batch(fn, specs: List[dict]) -> Dict[str, bool]:
+    """ Applies `fn` to every spec, from a thread pool for large batches.
+        Raises ValueError if two specs share a path, as they would race
+        each other and only one result could be returned.
+    """
+
+    paths = [spec["path"] for spec in specs]
+    if len(set(paths)) != len(paths):
+        duplicates = sorted({path for path in paths if paths.count(path) > 1})
+        raise ValueError(f"Batch has more than one spec for: {', '.join(duplicates)}")
+
+    if len(specs) < BATCH_CONCURRENCY_THRESHOLD:
+        return {spec["path"]: fn(**spec) for spec in specs}
+
+    workers = min(BATCH_MAX_WORKERS, len(specs))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        fs = {spec["path"]: executor.submit(fn, **spec) for spec in specs}
+
+    return {path: future.result() for path, future in fs.items()}
+
+
+def put_many(*, files: List[dict]) -> Dict[str, bool]:
+    """ Places a batch of files onto the remote in one call. Each item
+        of `files` takes the same keys as `put`, and every path may only
+        appear once. Returns a mapping of path to whether it was changed.
+    """
+
+    stat_cache = _StatCache()
+    return _run_batch(functools.partial(_put_one, stat_cache), files)
+
+
+def ensure_many(*, files: List[dict]) -> Dict[str, bool]:
+    """ Converges a batch of files in one call. Each item of `files` takes
+        `path`, and optionally `contents`, `mode`, `owner`, `group` and `encoding`.
+        Contents are only written when they differ from what is on disk,
+        and every path may only appear once. Returns a mapping of path to whether it was changed.
+    """
+
+    stat_cache = _StatCache()
+    return _run_batch(functools.partial(_ensure_one, stat_cache), files)
+
+
+def template(*, path: str, src: str, variables: Optional[dict]=None, mode: int=0o600, owner: Optional[Union[int, str]]=None, group: Optional[Union[int, str]]=None, encoding: Optional[str]=None) -> bool:
+    """ Renders the controller-side template `src` against this host's facts
+        and places it at `path`. The rendered output is only transferred
+        when its hash differs from the file already on disk.
+    """
+
+    if encoding is None:
+        encoding = "utf-8"
 
-    return any(updated)
\ No newline at end of file
+    current = None
+    if os.path.isfile(path):
+        with io.open(path, "rb") as f:
+            current = hashlib.sha256(f.read()).hexdigest()
+
+    rendered = context.parent.call_service(
+        TEMPLATE_SERVICE,
+        "render",
+        name=src,
+        variables=variables or {},
+        checksum=current,
+        encoding=encoding,
+    )
+    logger.debug(f"Template {src} for {path} rendered to {rendered['checksum']} (on disk: {current})")
+
+    return _ensure_one(
+        _StatCache(),
+        path=path,
+        contents=rendered["contents"],
+        mode=mode,
+        owner=owner,
+        group=group,
+        encoding=encoding,
+    )
\ No newline at end of file
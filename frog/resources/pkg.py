@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import abc
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+STATE_PRESENT = "present"
+STATE_ABSENT = "absent"
+STATE_LATEST = "latest"
+
+_STATE_ALIASES = {
+    "installed": STATE_PRESENT,
+    "present": STATE_PRESENT,
+    "absent": STATE_ABSENT,
+    "removed": STATE_ABSENT,
+    "latest": STATE_LATEST,
+}
+
+# Installed package state, keyed by package manager type. Lives for as long as
+# the remote interpreter does, and is only dropped when we run a transaction.
+_installed_cache: Dict[str, Dict[str, str]] = {}
+_cache_lock = threading.Lock()
+
+
+class PackageManager(metaclass=abc.ABCMeta):
+    """ Representation of a host's package manager.
+    """
+
+    TYPE: str
+    BINARY: str
+
+    @classmethod
+    def detect(cls) -> PackageManager:
+        for manager in PACKAGE_MANAGERS:
+            if shutil.which(manager.BINARY):
+                return manager()
+
+        raise RuntimeError("No supported package manager found")
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}>"
+
+    @abc.abstractmethod
+    def query(self) -> Dict[str, str]:
+        """ Returns a mapping of every installed package to its version,
+            in one call to the package database.
+        """
+
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def transaction(self, install: List[Tuple[str, Optional[str]]], upgrade: List[str], remove: List[str]) -> List[str]:
+        """ Builds the command line that applies all changes at once.
+        """
+
+        raise NotImplementedError
+
+    def environment(self) -> dict:
+        return dict(os.environ)
+
+    def apply(self, install: List[Tuple[str, Optional[str]]], upgrade: List[str], remove: List[str]) -> bytes:
+        cmd = self.transaction(install, upgrade, remove)
+        logger.debug(f"Running package transaction: {cmd}")
+        return subprocess.check_output(cmd, env=self.environment(), stderr=subprocess.STDOUT)
+
+
+class AptPackageManager(PackageManager):
+
+    TYPE = "apt"
+    BINARY = "dpkg-query"
+
+    def query(self) -> Dict[str, str]:
+        output = subprocess.check_output(
+            ["dpkg-query", "-W", "-f", "${Package}\t${Version}\t${db:Status-Status}\n"],
+        )
+
+        installed = {}
+        for line in output.decode("utf-8").splitlines():
+            name, version, status = line.split("\t")
+            if status == "installed":
+                installed[name] = version
+
+        return installed
+
+    def transaction(self, install: List[Tuple[str, Optional[str]]], upgrade: List[str], remove: List[str]) -> List[str]:
+        # apt-get treats a trailing `-` on a package name as a removal, which
+        # lets installs and removals share one dpkg lock and metadata read.
+        args = [name if version is None else f"{name}={version}" for name, version in install]
+        args.extend(upgrade)
+        args.extend(f"{name}-" for name in remove)
+
+        return ["apt-get", "install", "-y", "-q", *args]
+
+    def environment(self) -> dict:
+        env = super().environment()
+        env["DEBIAN_FRONTEND"] = "noninteractive"
+        return env
+
+
+class DnfPackageManager(PackageManager):
+
+    TYPE = "dnf"
+    BINARY = "rpm"
+
+    def query(self) -> Dict[str, str]:
+        output = subprocess.check_output(
+            ["rpm", "-qa", "--queryformat", "%{NAME}\t%{VERSION}-%{RELEASE}\n"],
+        )
+
+        installed = {}
+        for line in output.decode("utf-8").splitlines():
+            name, version = line.split("\t")
+            installed[name] = version
+
+        return installed
+
+    def script(self, install: List[Tuple[str, Optional[str]]], upgrade: List[str], remove: List[str]) -> str:
+        lines = []
+        if install:
+            lines.append("install " + " ".join(
+                name if version is None else f"{name}-{version}" for name, version in install
+            ))
+        if upgrade:
+            lines.append("upgrade " + " ".join(upgrade))
+        if remove:
+            lines.append("remove " + " ".join(remove))
+        lines.append("run")
+
+        return "\n".join(lines) + "\n"
+
+    def transaction(self, install: List[Tuple[str, Optional[str]]], upgrade: List[str], remove: List[str]) -> List[str]:
+        return [shutil.which("dnf") or "yum", "-y", "-q", "shell"]
+
+    def apply(self, install: List[Tuple[str, Optional[str]]], upgrade: List[str], remove: List[str]) -> bytes:
+        # `dnf shell` runs every queued operation in a single rpm transaction.
+        cmd = self.transaction(install, upgrade, remove)
+        script = self.script(install, upgrade, remove)
+        logger.debug(f"Running package transaction: {cmd} <<< {script!r}")
+        return subprocess.check_output(
+            cmd,
+            input=script.encode("utf-8"),
+            env=self.environment(),
+            stderr=subprocess.STDOUT,
+        )
+
+
+PACKAGE_MANAGERS = [AptPackageManager, DnfPackageManager]
+
+
+def normalize(packages: Union[Mapping[str, str], Iterable[str], str], state: str=STATE_PRESENT) -> Dict[str, str]:
+    """ Normalizes the accepted package spec forms into a mapping of
+        package name to desired state.
+    """
+
+    if isinstance(packages, str):
+        packages = [p.strip() for p in packages.split(",") if p.strip()]
+
+    if isinstance(packages, Mapping):
+        desired = dict(packages)
+    else:
+        desired = {name: state for name in packages}
+
+    return {name: _STATE_ALIASES.get(str(want).lower(), str(want)) for name, want in desired.items()}
+
+
+def plan(desired: Mapping[str, str], installed: Mapping[str, str]) -> Tuple[List[Tuple[str, Optional[str]]], List[str], List[str]]:
+    """ Compares desired package states with what is installed and
+        returns the (install, upgrade, remove) sets needed to converge.
+        Any state that isn't present/absent/latest is treated as a version pin.
+    """
+
+    install: List[Tuple[str, Optional[str]]] = []
+    upgrade: List[str] = []
+    remove: List[str] = []
+
+    for name, want in sorted(desired.items()):
+        have = installed.get(name)
+        if want == STATE_PRESENT:
+            if have is None:
+                install.append((name, None))
+        elif want == STATE_ABSENT:
+            if have is not None:
+                remove.append(name)
+        elif want == STATE_LATEST:
+            if have is None:
+                install.append((name, None))
+            else:
+                upgrade.append(name)
+        elif have != want:
+            install.append((name, want))
+
+    return install, upgrade, remove
+
+
+def _get_installed(manager: PackageManager, refresh: bool=False) -> Dict[str, str]:
+    with _cache_lock:
+        if refresh or manager.TYPE not in _installed_cache:
+            _installed_cache[manager.TYPE] = manager.query()
+
+        return _installed_cache[manager.TYPE]
+
+
+def _invalidate(manager: PackageManager):
+    with _cache_lock:
+        _installed_cache.pop(manager.TYPE, None)
+
+
+def installed(*, names: Optional[Union[Iterable[str], str]]=None, refresh: bool=False) -> Dict[str, Optional[str]]:
+    """ Returns installed versions of packages, queried in a single call.
+        Returns all installed packages if `names` is not given.
+    """
+
+    current = _get_installed(PackageManager.detect(), refresh=refresh)
+    if names is None:
+        return dict(current)
+
+    return {name: current.get(name) for name in normalize(names)}
+
+
+def ensure(*, packages: Union[Mapping[str, str], Iterable[str], str], state: str=STATE_PRESENT, refresh: bool=False) -> bool:
+    """ Converges a batch of packages to their desired states in one
+        package manager transaction. Returns true if anything changed.
+    """
+
+    manager = PackageManager.detect()
+    desired = normalize(packages, state=state)
+    install, upgrade, remove = plan(desired, _get_installed(manager, refresh=refresh))
+
+    if upgrade and not install and not remove:
+        # `latest` can't be decided from the local database alone, so compare
+        # versions before and after the upgrade to know if anything happened.
+        before = {name: _get_installed(manager)[name] for name in upgrade}
+    elif not install and not upgrade and not remove:
+        logger.debug(f"Packages already converged: {desired}")
+        return False
+    else:
+        before = None
+
+    try:
+        result = manager.apply(install, upgrade, remove)
+        logger.debug(f"{manager} transaction result: {result}")
+    finally:
+        _invalidate(manager)
+
+    if before is not None:
+        after = _get_installed(manager)
+        return any(after.get(name) != version for name, version in before.items())
+
+    return True
+
+
+def install(*, packages: Union[Iterable[str], str], refresh: bool=False) -> bool:
+    """ Ensures all of `packages` are installed.
+    """
+
+    return ensure(packages=packages, state=STATE_PRESENT, refresh=refresh)
+
+
+def remove(*, packages: Union[Iterable[str], str], refresh: bool=False) -> bool:
+    """ Ensures all of `packages` are removed.
+    """
+
+    return ensure(packages=packages, state=STATE_ABSENT, refresh=refresh)
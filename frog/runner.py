@@ -2,173 +2,1123 @@
 
 from __future__ import annotations
 
+import abc
+import contextlib
+import copy
 import logging
-import os
+import math
 import pathlib
-import subprocess
-import sys
+import re
 import threading
+import time
 from collections import deque
-from typing import Any, Callable, Iterable, List, Mapping, Optional
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, Union
 
-from mitogen.core import CallError, Context, StreamError
+from mitogen.core import CallError, ChannelError, Context, StreamError, TimeoutError
 from mitogen.master import Broker, Router
-from mitogen.select import Select
-from mitogen.service import FileService, get_or_create_pool
+from mitogen.service import FileService, Pool
 
-from frog import context, facts, package_root
-from frog.errors import ConnectionError
+from frog import context, metrics, package_root, recipes
+from frog.connection import SshConnectionMethod, SshMultiplexer
+from frog.connection_pool import ConnectionPool, ConnectThrottle, PoolStats
+from frog.errors import ConnectionError, DeadlineExceeded, HostUnreachable, RolloutAborted
 from frog.fact_cache import FactCache, MemoryFactCache
+from frog.history import DurationHistory, predict_makespan
 from frog.inventory import Inventory, InventoryItem
-from frog.remoteenv import bootstrapper
+from frog.outcome_cache import DEFAULT_OUTCOME_TTL, OutcomeCache
+from frog.precheck import DEFAULT_CACHE_TTL, DEFAULT_PROBE_TIMEOUT, Prober, ProbeCache
+from frog.remoteenv import bootstrapper, bundle, relay
+from frog.templating import HostParameters, TemplateService
+from frog.tracing import Tracer
+from frog.util import Latencies, Timer
+from frog.util.concurrency import AdaptiveLimit, ConcurrencyGate
 from frog.util.dictser import DictSerializable
 
+if TYPE_CHECKING:
+    from frog.journal import Journal
+
 logger = logging.getLogger(__name__)
 
+FACTS_TARGET = "facts.gather"
+
+""" Failures that suggest we are connecting to or running on too many hosts at once. """
+OVERLOAD_ERRORS = {"ConnectionError", "DeadlineExceeded", "ChannelError"}
+
+""" What runners do, kept in frog's metrics registry. """
+CONNECTIONS_OPENED = metrics.REGISTRY.counter("frog_connections_opened_total", "Connections opened to hosts, by outcome")
+CONNECT_SECONDS = metrics.REGISTRY.histogram("frog_connect_seconds", "Time taken to open and bring up a connection to a host")
+BOOTSTRAPS = metrics.REGISTRY.counter("frog_bootstraps_total", "Connections by whether the bootstrapped environment was started directly (fast) or bootstrapped into")
+BOOTSTRAP_SECONDS = metrics.REGISTRY.histogram("frog_bootstrap_seconds", "Time taken bootstrapping into a host's environment")
+BUNDLE_INSTALLS = metrics.REGISTRY.counter("frog_cookbook_bundle_installs_total", "Cookbook bundle installs, by whether the bundle was fetched")
+CALLS = metrics.REGISTRY.counter("frog_calls_total", "Calls on hosts, by target and outcome")
+CALL_SECONDS = metrics.REGISTRY.histogram("frog_call_seconds", "Time taken by calls on hosts, by target")
+MODULE_BYTES = metrics.REGISTRY.counter("frog_module_bytes_sent_total", "Bytes of Python modules sent to hosts")
+
+""" Phases that add up to the time spent working on a host, the rest are either part of these or waiting. """
+WORK_PHASES = {"connect", "serialize", "call"}
+
 
 class Runner:
 
-    def __init__(self):
+    def __init__(self, template_cache_dir: Optional[pathlib.Path]=None, max_connections: Optional[int]=None,
+                 connection_idle_timeout: Optional[float]=None, connect_throttle: Optional[ConnectThrottle]=None,
+                 fused_connect: bool=True, call_timeout: Optional[float]=None, run_timeout: Optional[float]=None,
+                 prober: Optional[Prober]=None, concurrency: Optional[AdaptiveLimit]=None,
+                 history: Optional[DurationHistory]=None, strategy: Optional[Strategy]=None, journal: Optional[Journal]=None,
+                 outcome_cache: Optional[OutcomeCache]=None, tracer: Optional[Tracer]=None, remote_profiling: bool=False):
         self._broker = Broker()
         self._router = Router(broker=self._broker)
-        self._connections = {}
+        self._connections = ConnectionPool(
+            self._router,
+            max_size=max_connections,
+            idle_timeout=connection_idle_timeout,
+        )
+        self._connect_throttle = connect_throttle or ConnectThrottle()
+        self.latencies = Latencies()
 
         self._file_service = FileService(self._router)
         self._file_service.register_prefix(package_root())
 
-        self._pool = get_or_create_pool(router=self._router)
-        self._pool.add(self._file_service)
+        self._template_service = TemplateService(self._router, cache_dir=template_cache_dir)
 
-        self.bootstrap_settings = None
+        # Our own pool rather than the process-wide one, which stays bound
+        # to the first router it was created with.
+        self._pool = Pool(self._router, services=[self._file_service, self._template_service], size=2)
+
+        self.bootstrap_settings = bootstrapper.Settings()
         self.fact_cache = MemoryFactCache()
 
+        self._fused_connect = fused_connect
+        self._call_timeout = call_timeout or None
+        self._run_timeout = run_timeout or None
+        self._prober = prober
+        self._gate = None if concurrency is None else ConcurrencyGate(concurrency)
+        self._history = history
+        self.strategy = strategy or LinearStrategy()
+        self.journal = journal
+        self.outcome_cache = outcome_cache
+        self.tracer = tracer
+        # Passed on to every connection, so mitogen profiles each context it
+        # starts on the hosts.
+        self._hop_options = {"profiling": True} if remote_profiling else {}
+        self._cookbook_bundle: Optional[pathlib.Path] = None
+        self.bundle_stats: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+        self._gateways: Dict[str, Context] = {}
+        self._gateway_locks: Dict[str, threading.Lock] = {}
+        self.makespans: Dict[str, Dict[str, float]] = {}
+        self._fingerprint = bootstrapper.requirements_fingerprint()
+        self._wants_facts: Set[str] = set()
+        self._fresh_facts: Dict[str, dict] = {}
+        self._facts_lock = threading.Lock()
+
     __all__ = ["execute", "close", "gather_facts", "execute_on_host"]
 
+    @property
+    def concurrency(self) -> Optional[int]:
+        """ How many hosts may currently be worked on at once, if limited.
+        """
+
+        return None if self._gate is None else self._gate.limit.current
+
+    @property
+    def connection_stats(self) -> PoolStats:
+        return self._connections.stats
+
     def register_fs_prefix(self, prefix: str):
         self._file_service.register_prefix(prefix)
 
-    def gather_facts(self, hosts: Inventory, fact_cache: Optional[FactCache]=None):
+    def register_template_prefix(self, prefix: str):
+        self._template_service.register_prefix(prefix)
+
+    def use_cookbooks(self, paths: List[str], bundle_dir: pathlib.Path):
+        """ Packs the cookbooks in `paths` into a bundle every host installs
+            when it is connected to, instead of importing them module by
+            module from us.
+        """
+
+        self._cookbook_bundle = bundle.build(paths, bundle_dir)
+        if self._cookbook_bundle is not None:
+            self._file_service.register(str(self._cookbook_bundle))
+            logger.info(f"Cookbook bundle {bundle.digest_of(str(self._cookbook_bundle))}")
+
+    def gather_facts(self, hosts: Inventory, fact_cache: Optional[FactCache]=None, deadline: Optional[float]=None) -> List[ExecutionResult]:
+        """ Fills in the facts of `hosts`, from the fact cache where it can.
+            Returns the failed results of hosts whose facts couldn't be
+            gathered.
+        """
+
         _fact_cache = fact_cache or self.fact_cache
         logger.debug(f"Gathering via {_fact_cache}")
 
+        stale = set()
         for host in hosts:
             try:
                 host.update_facts(_fact_cache.get(host.host))
             except FactCache.NeedsUpdate:
                 logger.debug(f"Host {host.host} fact cache data is invalid, updating")
+                stale.add(host.host)
 
-                subset = hosts.select(host.host)
-                result = self.execute(subset, "facts.gather").pop()
-                host = result["host"]
-                facts = result["result"]
-                host.update_facts(facts)
-                _fact_cache.update(host.host, facts)
+        if not stale:
+            return []
 
-    def execute(self, hosts: Inventory, target: str, kw: Optional[dict]=None) -> Iterable[ExecutionResult]:
-        if kw is None:
-            kw = {}
+        # Hosts that still have to be connected to gather their facts as
+        # part of bringing the connection up.
+        with self._facts_lock:
+            self._wants_facts.update(stale)
+
+        failed = []
+        try:
+            for result in self.execute(hosts.where(lambda item: item.host in stale), FACTS_TARGET, deadline=deadline, record=False):
+                if result.success is None:
+                    logger.error(f"Could not gather facts for {result.host}: {result.failure}")
+                    failed.append(result)
+                    continue
+
+                gathered = result.success["changed"]
+                for host in hosts:
+                    if host.host == result.host:
+                        host.update_facts(gathered)
+                _fact_cache.update(result.host, gathered)
+        finally:
+            with self._facts_lock:
+                self._wants_facts.difference_update(stale)
+
+        return failed
+
+    def run(self, hosts: Inventory, target: str, kw: Optional[dict]=None, fact_cache: Optional[FactCache]=None) -> List[ExecutionResult]:
+        """ Gathers facts for `hosts` and executes `target` on them.
+        """
+
+        return self.run_steps(hosts, [Step(target, kw)], fact_cache=fact_cache)
+
+    def run_steps(self, hosts: Inventory, steps: List[Step], fact_cache: Optional[FactCache]=None) -> List[ExecutionResult]:
+        """ Gathers facts for `hosts` and works through `steps` on them,
+            as the runner's strategy sees fit. Hosts that are down or whose
+            facts couldn't be gathered are failed without running steps.
+        """
+
+        deadline = None if self._run_timeout is None else time.monotonic() + self._run_timeout
+        hosts, unreachable = self.precheck(hosts)
+        unreachable += self.gather_facts(hosts, fact_cache=fact_cache, deadline=deadline)
+        if unreachable:
+            failed = {result.host for result in unreachable}
+            hosts = hosts.where(lambda item: item.host not in failed)
+        self.record(unreachable)
+        return unreachable + self.strategy.run(self, hosts, steps, deadline=deadline)
 
-        results: Iterable[ExecutionResult] = deque([])
+    def record(self, results: List[ExecutionResult]):
+        """ Journals results that weren't produced by executing on a host,
+            eg. hosts that were skipped.
+        """
+
+        if self.journal is not None:
+            self.journal.append(results)
+
+    def precheck(self, hosts: Inventory) -> Tuple[Inventory, List[ExecutionResult]]:
+        """ Probes whether hosts are reachable before connecting to them, if
+            a prober is configured. Returns the hosts that should be connected
+            to and failed results for the ones that are down.
+        """
+
+        if self._prober is None:
+            return hosts, []
+
+        unreachable = self._prober.check(hosts)
+        for host, reason in unreachable.items():
+            logger.error(f"Skipping unreachable host {host}: {reason}")
+
+        results = [ExecutionResult.fail(host, HostUnreachable(host, reason)) for host, reason in unreachable.items()]
+        return hosts.where(lambda item: item.host not in unreachable), results
+
+    def execute(self, hosts: Inventory, target: str, kw: Optional[dict]=None, deadline: Optional[float]=None,
+                record: bool=True) -> Iterable[ExecutionResult]:
+        """ Executes `target` on every host. Hosts still running at `deadline`,
+            or after the run timeout if no deadline is given, are given up on.
+        """
+
+        return self.execute_steps(hosts, [Step(target, kw)], deadline=deadline, record=record)
+
+    def execute_steps(self, hosts: Inventory, steps: List[Step], deadline: Optional[float]=None,
+                      record: bool=True) -> Iterable[ExecutionResult]:
+        """ Works through `steps` on every host, each host on its own as
+            soon as it is admitted, stopping at its first failed step.
+            Results are journaled as they come in if `record` is set.
+        """
+
+        if deadline is None and self._run_timeout is not None:
+            deadline = time.monotonic() + self._run_timeout
+            budget = self._run_timeout
+        else:
+            # The deadline may be shared with steps or batches run before.
+            budget = None if deadline is None else round(max(0.0, deadline - time.monotonic()), 3)
+
+        self._template_service.set_inventory(hosts)
+        params = [HostParameters(step.kw) for step in steps]
+        targets = [step.target for step in steps]
+        root = hosts.root()
+
+        items = list(hosts)
+        if self._history is not None and self._gate is not None:
+            # With limited concurrency, hosts expected to take the longest
+            # should start first rather than end up setting the makespan.
+            items = self._history.longest_first(items, targets)
+        predicted = self.predict_makespan(hosts, items, targets)
+
+        started = time.monotonic()
+        results = RunResults(journal=self.journal if record else None)
         pool = []
-        for item in hosts:
-            logger.info(f"Enqueue host {item.host} to run {target}({kw})")
+        for item in items:
+            try:
+                host_steps = [Step(step.target, step_params.for_host(item, root)) for step, step_params in zip(steps, params)]
+            except Exception as err:
+                # Expressions can fail any way Python can, eg. a TypeError
+                # adding to a fact that's missing on this host.
+                logger.error(f"Could not evaluate parameters for host {item.host}: {err!r}")
+                results.append(ExecutionResult.fail(item.host, err))
+                continue
+
+            if self._gate is not None and not self._gate.acquire(deadline):
+                self.give_up(results, item, "admission", budget)
+                continue
+
+            logger.info(f"Enqueue host {item.host} to run {', '.join(map(str, host_steps))}")
             # Create a new local context for each of the hosts we should run on
-            # TODO: Ideally, chunk this out into more reasonable, parallelizable chunks.
             child = threading.Thread(
                 name=f"runner[{item.host}]",
                 daemon=True,
-                target=self.execute_on_host,
-                args=(results, item, hosts, target),
-                kwargs={"kw": kw},
+                target=self.execute_steps_on_host if self._gate is None else self.execute_admitted,
+                args=(results, item, hosts, host_steps),
+                kwargs={"deadline": deadline},
             )
             child.start()
-            pool.append(child)
+            pool.append((item, child))
 
-        while True:
-            if not pool:
-                # Pool's closed, go away
-                break
+        for item, thread in pool:
+            thread.join(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                self.give_up(results, item, "run", budget)
 
-            done_idxs = []
-            for idx in range(len(pool)):
-                thread = pool[idx]
-                thread.join(timeout=1)
-                if not thread.is_alive():
-                    done_idxs.append(idx)
+        if predicted is not None:
+            name = " -> ".join(targets)
+            self.makespans[name] = dict(predicted, actual=time.monotonic() - started)
+            logger.info(f"Makespan of {name} on {len(items)} hosts: {self.makespans[name]}")
+            self._history.save()
+        if self.outcome_cache is not None:
+            self.outcome_cache.save()
 
-            for idx in reversed(done_idxs):
-                pool.pop(idx)
+        return results.collected()
 
-        return results
+    def predict_makespan(self, hosts: Inventory, order: List[InventoryItem], targets: List[str]) -> Optional[Dict[str, float]]:
+        """ Predicts, from history, how long running `targets` on hosts in
+            `order` takes, and how long it would in inventory order.
+        """
+
+        if self._history is None:
+            return None
 
-    def get_or_create_connection(self, item: InventoryItem) -> Context:
-        if str(item) in self._connections:
-            return self._connections[str(item)]
+        estimates = self._history.estimates(order, targets)
+        slots = None if self._gate is None else self._gate.limit.current
+        return {
+            "predicted": predict_makespan([estimates[item.host] for item in order], slots),
+            "inventory_order": predict_makespan([estimates[item.host] for item in hosts], slots),
+        }
+
+    def give_up(self, results: RunResults, item: InventoryItem, phase: str, seconds: float):
+        """ Records `item` as timed out in `phase`, either "admission" when it
+            was never let in to run or "run" when it didn't finish, after
+            `seconds`. Tears down its connection, so a call it is stuck in
+            fails instead of lingering.
+        """
+
+        if phase == "admission":
+            logger.error(f"Host {item.host} was not admitted to run within {seconds}s")
+        else:
+            logger.error(f"Host {item.host} did not finish within {seconds}s")
+        results.give_up(ExecutionResult.fail(item.host, DeadlineExceeded(item.host, phase, seconds)))
+        self._connections.discard(str(item), force=True)
+
+    @contextlib.contextmanager
+    def span(self, host: str, phase: str, timings: Optional[Dict[str, float]]=None) -> Iterator[None]:
+        """ Times a phase of working on `host`, adding it to `timings` if
+            given, or to the latencies directly otherwise, and tracing it.
+        """
 
+        started = time.time()
+        timer = Timer()
         try:
-            ctx = item.open_connection(self._router)
-            ctx = self.into_bootstrap(ctx)
-            self._connections[str(item)] = ctx
-            return ctx
+            with timer:
+                yield
+        finally:
+            if timings is None:
+                self.latencies.record(phase, timer.time_taken)
+            else:
+                timings[phase] = timings.get(phase, 0.0) + timer.time_taken
+            if self.tracer is not None:
+                self.tracer.add(host, phase, started, timer.time_taken)
+
+    @contextlib.contextmanager
+    def connection(self, item: InventoryItem, timings: Optional[Dict[str, float]]=None) -> Iterator[Context]:
+        """ Leases a bootstrapped connection to `item` from the connection pool,
+            opening one if needed. Time spent waiting to connect and connecting
+            is recorded into `timings`. Once done with it, connections that
+            have been idle for longer than the idle timeout are closed, so
+            they don't stay open until the pool is next short of room.
+        """
+
+        try:
+            with self._connections.lease(str(item), lambda: self.open_connection(item, timings)) as ctx:
+                self._template_service.register_context(ctx.context_id, item.host)
+                yield ctx
+        finally:
+            self._connections.reap()
+
+    def open_connection(self, item: InventoryItem, timings: Optional[Dict[str, float]]=None) -> List[Context]:
+        """ Opens the chain of contexts leading into the host's bootstrapped venv.
+        """
+
+        if timings is None:
+            timings = {}
+
+        with self._facts_lock:
+            gather_facts = item.host in self._wants_facts
+
+        started = time.time()
+        with self._connect_throttle.slot(item.destination) as waited:
+            timings["connect_wait"] = waited.time_taken
+            if self.tracer is not None:
+                self.tracer.add(item.host, "connect_wait", started, waited.time_taken)
+
+            try:
+                with self.span(item.host, "connect", timings):
+                    if not item.connection_method.bootstraps():
+                        # Calls run in the interpreter connected to, as is.
+                        with self.span(item.host, f"connect.{item.connection_method.type()}", timings):
+                            chain = item.open_connection_chain(self._router, via=self.gateway(item), **self._hop_options)
+                        self.bring_up(item, chain[-1], gather_facts, timings, bootstrapped=True)
+                    elif self._fused_connect:
+                        chain = self.open_fused(item, gather_facts, timings)
+                    else:
+                        gateway = self.gateway(item)
+                        with self.span(item.host, f"connect.{item.connection_method.type()}", timings):
+                            chain = item.open_connection_chain(self._router, via=gateway, **self._hop_options)
+                        chain.append(self.into_bootstrap(chain[-1], relay_ctx=gateway, host=item.host, timings=timings))
+                        self.bring_up(item, chain[-1], gather_facts, timings)
+            except (StreamError, CallError) as err:
+                CONNECTIONS_OPENED.inc(outcome="error")
+                raise ConnectionError(item).with_cause(err)
+
+        CONNECTIONS_OPENED.inc(outcome="ok")
+        CONNECT_SECONDS.observe(timings["connect"])
+        return chain
+
+    def open_fused(self, item: InventoryItem, gather_facts: bool, timings: Optional[Dict[str, float]]=None) -> List[Context]:
+        """ Opens a connection whose last hop optimistically starts the
+            bootstrapped venv interpreter directly, and checks it is up to
+            date in the same call that gathers facts. Falls back to
+            bootstrapping if the venv is missing or out of date.
+        """
+
+        gateway = self.gateway(item)
+        hop = dict(self._hop_options) if gateway is None else dict(self._hop_options, via=gateway)
+        if item.escalates:
+            with self.span(item.host, f"connect.{item.connection_method.type()}", timings):
+                chain = [item.connection_method.connect(self._router, **hop)]
+
+            def launch(**kw) -> Context:
+                with self.span(item.host, "connect.sudo", timings):
+                    return item.escalate(self._router, chain[0], **self._hop_options, **kw)
+        else:
+            chain = []
+
+            def launch(**kw) -> Context:
+                with self.span(item.host, f"connect.{item.connection_method.type()}", timings):
+                    return item.connection_method.connect(self._router, **hop, **kw)
+
+        try:
+            ctx = launch(python_path=[self.bootstrap_settings.python_path])
+            if self.bring_up(item, ctx, gather_facts, timings):
+                BOOTSTRAPS.inc(path="fast")
+                return chain + [ctx]
+
+            logger.debug(f"Bootstrapped environment on {item.host} is out of date, bootstrapping")
+            ctx.shutdown()
         except StreamError as err:
-            raise ConnectionError(item).with_cause(err)
+            logger.debug(f"No bootstrapped interpreter on {item.host}, bootstrapping: {err}")
+
+        ctx = launch()
+        chain.append(ctx)
+        chain.append(self.into_bootstrap(ctx, relay_ctx=gateway, host=item.host, timings=timings))
+        self.bring_up(item, chain[-1], gather_facts, timings)
+        return chain
+
+    def gateway(self, item: InventoryItem) -> Optional[Context]:
+        """ Returns the context on the jump host `item` is reached through, if
+            any. It is opened once and shared by every host behind it, and
+            relays payloads to them so each crosses our uplink only once.
+        """
+
+        jump = item.jump_item()
+        if jump is None:
+            return None
+
+        with self._stats_lock:
+            lock = self._gateway_locks.setdefault(jump.host, threading.Lock())
+
+        with lock:
+            gateway = self._gateways.get(jump.host)
+            if gateway is None:
+                logger.debug(f"Opening jump host {jump.host}")
+                gateway = jump.connection_method.connect(self._router, **self._hop_options)
+                # We're its parent, so this activates the relay there.
+                gateway.call_service(relay.RelayCache.name(), "stats")
+                self._gateways[jump.host] = gateway
+
+        return gateway
+
+    def relay_stats(self) -> Dict[str, dict]:
+        """ Transfer counters of the relay on each jump host.
+        """
+
+        stats = {}
+        for host, gateway in list(self._gateways.items()):
+            try:
+                stats[host] = gateway.call_service(relay.RelayCache.name(), "stats")
+            except (CallError, ChannelError, StreamError) as err:
+                logger.debug(f"Could not get relay counters from {host}: {err}")
+
+        return stats
+
+    def bring_up(self, item: InventoryItem, ctx: Context, gather_facts: bool, timings: Optional[Dict[str, float]]=None,
+                 bootstrapped: bool=False) -> bool:
+        """ Makes the first call on a new connection, collecting facts if
+            they were asked for. Returns whether the host is bootstrapped,
+            which it is taken to be if `bootstrapped` is set.
+        """
+
+        with self.span(item.host, "connect.bring_up", timings):
+            state = ctx.call(
+                bootstrapper.bring_up,
+                self.bootstrap_settings.asdict(),
+                self._fingerprint,
+                gather_facts,
+                self._router.myself(),
+                None if self._cookbook_bundle is None else str(self._cookbook_bundle),
+                self.gateway(item),
+                bootstrapped,
+            )
+        if state["facts"] is not None:
+            with self._facts_lock:
+                self._fresh_facts[item.host] = state["facts"]
+        if state["bundle_fetched"] is not None:
+            outcome = "fetched" if state["bundle_fetched"] else "cached"
+            BUNDLE_INSTALLS.inc(outcome=outcome)
+            with self._stats_lock:
+                self.bundle_stats[outcome] = self.bundle_stats.get(outcome, 0) + 1
 
-    def into_bootstrap(self, ctx: Context) -> Context:
+        return state["bootstrapped"]
+
+    def into_bootstrap(self, ctx: Context, relay_ctx: Optional[Context]=None, host: Optional[str]=None,
+                       timings: Optional[Dict[str, float]]=None) -> Context:
         """ Wraps a connection context into another connection
             context inside of a bootstrapped venv.
             If the venv is not available, it will be created.
         """
 
-        bin_path = ctx.call(bootstrapper.bootstrap, self._router.myself(), self.bootstrap_settings)
-        return self._router.local(
-            python_path=[bin_path],
-            via=ctx,
-        )
+        timer = Timer()
+        with self.span(host or str(ctx), "connect.bootstrap", timings), timer:
+            bin_path = ctx.call(bootstrapper.bootstrap, self._router.myself(), self.bootstrap_settings.asdict(), self._fingerprint, relay_ctx)
+            bootstrapped = self._router.local(
+                python_path=[bin_path],
+                via=ctx,
+                **self._hop_options,
+            )
 
-    def execute_on_host(self, results: deque, item: InventoryItem, source: Inventory, target: str, kw: Optional[dict]=None):
-        ctx = self.get_or_create_connection(item)
-        payload_args = (
-            source.serialize(deepcopy=True),  # the inventory the host was sourced from
-            item.serialize(deepcopy=True),    # the details about the host itself
-            ctx,                              # the remote host's context
-            self._router.myself(),            # the parent/controller's context
-            target,                           # the resource function to call
-        )
+        BOOTSTRAPS.inc(path="bootstrap")
+        BOOTSTRAP_SECONDS.observe(timer.time_taken)
+        return bootstrapped
+
+    def execute_admitted(self, results: RunResults, item: InventoryItem, *args, **kw):
+        """ Runs execute_steps_on_host for a host admitted through the
+            concurrency gate, and reports how it went back to the gate.
+        """
+
+        timer = Timer()
+        result = None
+        try:
+            with timer:
+                result = self.execute_steps_on_host(results, item, *args, **kw)
+        finally:
+            if result is None or (result.success is not None and result.success.get("skipped")):
+                # Nothing ran on the host, which says nothing about load.
+                self._gate.release()
+            elif result.failure is not None and result.failure["exception"] == "ConnectionError":
+                # How quickly a host failed to connect isn't how long work
+                # takes, only that it failed is.
+                self._gate.release(ok=False)
+            else:
+                ok = result.success is not None or result.failure["exception"] not in OVERLOAD_ERRORS
+                self._gate.release(timer.time_taken, ok=ok)
+
+    def execute_steps_on_host(self, results: RunResults, item: InventoryItem, source: Inventory, steps: List[Step],
+                              deadline: Optional[float]=None) -> Optional[ExecutionResult]:
+        """ Works through `steps` on one host, reusing its connection, until
+            one fails. Returns the result of the last step run.
+        """
+
+        result = None
+        for step in steps:
+            result = self.execute_on_host(results, item, source, step.target, kw=step.kw, deadline=deadline)
+            if result is None or result.failure:
+                break
+
+        return result
+
+    def execute_on_host(self, results: RunResults, item: InventoryItem, source: Inventory, target: str, kw: Optional[dict]=None,
+                        deadline: Optional[float]=None) -> Optional[ExecutionResult]:
+        outcome_key = None
+        if self.outcome_cache is not None and target != FACTS_TARGET:
+            outcome_key = OutcomeCache.key(item.host, target, kw, item.facts)
+            if self.outcome_cache.is_unchanged(outcome_key):
+                logger.debug(f"{target} changed nothing on {item.host} recently, skipping it")
+                CALLS.inc(target=target, outcome="skipped")
+                result = ExecutionResult.ok(item.host, changed=False, skipped=True)
+                results.append(result)
+                return result
+
+        timings: Dict[str, float] = {}
+        try:
+            with self.connection(item, timings) as ctx:
+                with self._facts_lock:
+                    fresh_facts = self._fresh_facts.pop(item.host, None)
+
+                if results.given_up(item.host):
+                    # Took too long connecting, don't start the call anymore.
+                    return None
+                elif target == FACTS_TARGET and fresh_facts is not None:
+                    result = ExecutionResult.ok(item.host, changed=fresh_facts)
+                else:
+                    result = self.call_on_host(ctx, item, source, target, kw=kw, timings=timings, deadline=deadline)
+        except ConnectionError as err:
+            logger.error(f"{err}")
+            result = ExecutionResult.fail(item.host, err)
+
+        self.latencies.record_all(timings)
+        if "call" in timings:
+            CALL_SECONDS.observe(timings["call"], target=target)
+        if result is not None:
+            CALLS.inc(target=target, outcome="success" if result.success is not None else "failure")
+            with self.span(item.host, "result"):
+                if self._history is not None:
+                    self._history.record(item.host, target, sum(seconds for phase, seconds in timings.items() if phase in WORK_PHASES))
+                if outcome_key is not None:
+                    self.outcome_cache.record(outcome_key, result)
+                results.append(result.with_timings(timings))
+
+        return result
+
+    def call_on_host(self, ctx: Context, item: InventoryItem, source: Inventory, target: str, kw: Optional[dict]=None,
+                     timings: Optional[Dict[str, float]]=None, deadline: Optional[float]=None) -> Optional[ExecutionResult]:
+        """ Calls `target` on the host. The call is given up on after the
+            call timeout or at `deadline`, whichever comes first, in which
+            case the host's connection is torn down.
+        """
+
+        if kw is None:
+            kw = {}
+        if timings is None:
+            timings = {}
+
+        timeout = self._call_timeout
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        with self.span(item.host, "serialize", timings):
+            payload_args = (
+                source.serialize(deepcopy=True),  # the inventory the host was sourced from
+                item.serialize(deepcopy=True),    # the details about the host itself
+                ctx,                              # the remote host's context
+                self._router.myself(),            # the parent/controller's context
+                target,                           # the resource function to call
+            )
 
         try:
-            results.append(ExecutionResult.ok(
-                item.host,
-                changed=ctx.call(
+            with self.span(item.host, "call", timings):
+                receiver = ctx.call_async(
                     context.call_with_context, # creates a "context" module the remote can pull info from
                     *payload_args,             # arguments specifically describing the where, whomst'd've, and what of the call
                     **kw,                      # arguments to the resource function
-                ),
-            ))
+                )
+                changed = receiver.get(timeout=timeout).unpickle(throw_dead=False)
+            return ExecutionResult.ok(item.host, changed=changed)
+        except TimeoutError:
+            logger.error(f"Call to {target} on {item.host} did not finish within {timeout}s, disconnecting")
+            self._connections.discard(str(item), force=True)
+            return ExecutionResult.fail(item.host, DeadlineExceeded(item.host, "call", timeout))
+        except ChannelError as err:
+            # The connection went away under the call, eg. it was torn down
+            # because the run timed out.
+            return ExecutionResult.fail(item.host, err)
         except CallError as err:
             if "cannot unpickle" in str(err):
                 logger.exception(f"Error unpickling payload (target={target}, item={item}) (args={payload_args}, kw={kw})")
-            else:
-                results.append(ExecutionResult.fail(item.host, err))
+                return None
+
+            return ExecutionResult.fail(item.host, err)
         except Exception as err:
             logger.exception(f"Unhandled exception during call to {item}")
-            results.append(ExecutionResult.fail(item.host, err))
+            return ExecutionResult.fail(item.host, err)
 
     def close(self):
+        logger.debug(f"Closing connections, pool stats: {self.connection_stats}")
+        MODULE_BYTES.inc(self._router.get_stats()["good_load_module_size"])
+        self._connections.close()
         self._pool.stop()
         self._broker.shutdown()
         self._broker.join()
 
 
+class Step:
+    """ A target to execute and the parameters to execute it with.
+    """
+
+    def __init__(self, target: str, kw: Optional[dict]=None):
+        self.target = target
+        self.kw = kw or {}
+
+    def __repr__(self) -> str:
+        return f"{self.target}({self.kw})"
+
+
+class Strategy(metaclass=abc.ABCMeta):
+    """ Decides how hosts work through the steps of a run.
+    """
+
+    NAME: str
+
+    @classmethod
+    def load(cls, name: str, **options) -> Strategy:
+        strategy = STRATEGY_MAP.get(name.lower())
+        if strategy is None:
+            raise ValueError(f"Unknown strategy: {name}")
+
+        return strategy(**options)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}>"
+
+    @abc.abstractmethod
+    def run(self, runner: Runner, hosts: Inventory, steps: List[Step], deadline: Optional[float]=None) -> List[ExecutionResult]:
+        raise NotImplementedError
+
+
+class LinearStrategy(Strategy):
+    """ Every host finishes a step before any host starts the next one.
+        Hosts that fail a step don't go on to the next.
+    """
+
+    NAME = "linear"
+
+    def run(self, runner: Runner, hosts: Inventory, steps: List[Step], deadline: Optional[float]=None) -> List[ExecutionResult]:
+        results: List[ExecutionResult] = []
+        for step in steps:
+            step_results = list(runner.execute_steps(hosts, [step], deadline=deadline))
+            results.extend(step_results)
+
+            failed = {result.host for result in step_results if result.failure}
+            hosts = hosts.where(lambda item: item.host not in failed)
+            if len(hosts) == 0:
+                break
+
+        return results
+
+
+class FreeStrategy(Strategy):
+    """ Every host works through all of the steps on its own, without
+        waiting for slower hosts to finish a step.
+    """
+
+    NAME = "free"
+
+    def run(self, runner: Runner, hosts: Inventory, steps: List[Step], deadline: Optional[float]=None) -> List[ExecutionResult]:
+        return list(runner.execute_steps(hosts, steps, deadline=deadline))
+
+
+class SerialStrategy(Strategy):
+    """ Runs hosts in batches of `batch` hosts, or a percentage of them if
+        given as eg. "25%", each batch using the `within` strategy. If more
+        than `max_fail_percentage` of a batch fails, the remaining batches
+        are aborted. Connections stay open between batches.
+    """
+
+    NAME = "serial"
+
+    def __init__(self, batch: Union[int, str]=1, max_fail_percentage: Optional[float]=None, within: Optional[Strategy]=None):
+        if not re.fullmatch(r"[1-9][0-9]*%?", str(batch)):
+            raise ValueError(f"Batch size must be a count or a percentage, not {batch!r}")
+
+        self._batch = batch
+        self._max_fail_percentage = max_fail_percentage
+        self._within = within or LinearStrategy()
+
+    def __repr__(self) -> str:
+        return f"<SerialStrategy batch={self._batch} max_fail_percentage={self._max_fail_percentage} within={self._within}>"
+
+    def batch_size(self, total: int) -> int:
+        if str(self._batch).endswith("%"):
+            return max(1, math.ceil(total * int(self._batch[:-1]) / 100))
+
+        return int(self._batch)
+
+    def batches(self, hosts: Inventory) -> List[Inventory]:
+        items = list(hosts)
+        size = self.batch_size(len(items))
+        batches = []
+        for offset in range(0, len(items), size):
+            batch = {id(item) for item in items[offset:offset + size]}
+            batches.append(hosts.where(lambda item, batch=batch: id(item) in batch))
+
+        return batches
+
+    def run(self, runner: Runner, hosts: Inventory, steps: List[Step], deadline: Optional[float]=None) -> List[ExecutionResult]:
+        results: List[ExecutionResult] = []
+        batches = self.batches(hosts)
+        for number, batch in enumerate(batches, start=1):
+            logger.info(f"Starting batch {number}/{len(batches)} of {len(batch)} hosts")
+            batch_results = self._within.run(runner, batch, steps, deadline=deadline)
+            results.extend(batch_results)
+
+            failed = {result.host for result in batch_results if result.failure}
+            failed_percentage = 100 * len(failed) / len(batch)
+            if self._max_fail_percentage is not None and failed_percentage > self._max_fail_percentage:
+                reason = f"{failed_percentage:.0f}% of batch {number} failed, more than the allowed {self._max_fail_percentage}%"
+                logger.error(f"Aborting rollout: {reason}")
+                aborted = [ExecutionResult.fail(item.host, RolloutAborted(item.host, reason)) for remaining in batches[number:] for item in remaining]
+                runner.record(aborted)
+                results.extend(aborted)
+                break
+
+        return results
+
+
+class GroupOrderStrategy(Strategy):
+    """ Works on each inventory group with the `within` strategy as soon as
+        every group it depends on, in `dependencies`, has converged without
+        failures, so independent groups run side by side. A group has only
+        converged once every host the inventory declares in it succeeded, so
+        hosts that were down, couldn't be gathered facts for or were left
+        out of the run hold up the groups depending on theirs. Groups after
+        one that failed aren't worked on.
+    """
+
+    NAME = "groups"
+
+    def __init__(self, dependencies: Mapping[str, Sequence[str]], within: Optional[Strategy]=None):
+        self._dependencies = {group: list(deps) for group, deps in dependencies.items()}
+        self._within = within or LinearStrategy()
+        self.order()
+
+    def __repr__(self) -> str:
+        return f"<GroupOrderStrategy dependencies={self._dependencies} within={self._within}>"
+
+    def order(self) -> List[str]:
+        """ Returns every group named in the dependencies, each after the
+            groups it depends on. Raises ValueError on a cycle.
+        """
+
+        ordered: List[str] = []
+        visiting: Set[str] = set()
+
+        def visit(group: str, path: List[str]):
+            if group in ordered:
+                return
+            if group in visiting:
+                raise ValueError(f"Group dependency cycle: {' -> '.join(path + [group])}")
+
+            visiting.add(group)
+            for dependency in self._dependencies.get(group, []):
+                visit(dependency, path + [group])
+            visiting.discard(group)
+            ordered.append(group)
+
+        for group in self._dependencies:
+            visit(group, [])
+
+        return ordered
+
+    def run(self, runner: Runner, hosts: Inventory, steps: List[Step], deadline: Optional[float]=None) -> List[ExecutionResult]:
+        declared = hosts.root().hosts
+        groups = {group: items for group, items in hosts.hosts.items() if items}
+        results: List[ExecutionResult] = []
+        passed: Dict[str, bool] = {}
+        cond = threading.Condition()
+
+        def run_group(group: str):
+            # Every group gets a turn, even one without hosts in the run, so
+            # that whether it converged is known to the groups after it.
+            items = groups.get(group, [])
+            group_results: List[ExecutionResult] = []
+            failed: List[str] = []
+            try:
+                prerequisites = self._dependencies.get(group, [])
+                with cond:
+                    cond.wait_for(lambda: all(dep in passed for dep in prerequisites))
+                    failed = [dep for dep in prerequisites if not passed[dep]]
+
+                if items and failed:
+                    reason = f"group {group} depends on {', '.join(failed)}, which did not converge"
+                    group_results = [ExecutionResult.fail(item.host, RolloutAborted(item.host, reason)) for item in items]
+                    runner.record(group_results)
+                elif items:
+                    logger.info(f"Starting group {group} of {len(items)} hosts")
+                    group_results = self._within.run(runner, Inventory({group: items}, parent=hosts), steps, deadline=deadline)
+            except Exception as err:
+                logger.exception(f"Group {group} failed")
+                group_results = [ExecutionResult.fail(item.host, err) for item in items]
+                runner.record(group_results)
+            finally:
+                # Set even if the group blew up, so the groups after it
+                # don't wait on it forever.
+                succeeded = {result.host for result in group_results if not result.failure}
+                with cond:
+                    results.extend(group_results)
+                    passed[group] = not failed and all(item.host in succeeded for item in declared.get(group, []))
+                    cond.notify_all()
+
+        names = list(dict.fromkeys([*declared, *groups, *self.order()]))
+        threads = [threading.Thread(name=f"group[{group}]", daemon=True, target=run_group, args=(group,)) for group in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+
+STRATEGY_MAP = {
+    FreeStrategy.NAME: FreeStrategy,
+    LinearStrategy.NAME: LinearStrategy,
+    SerialStrategy.NAME: SerialStrategy,
+}
+
+
+class RunResults:
+    """ Collects the results of one run. Hosts that were given up on
+        don't get to report a result afterwards. Results that are journaled
+        are only kept brief, as the journal holds the rest of them.
+    """
+
+    def __init__(self, journal: Optional[Journal]=None):
+        self._results: deque = deque([])
+        self._given_up: Set[str] = set()
+        self._lock = threading.Lock()
+        self._journal = journal
+
+    def _keep(self, result: ExecutionResult) -> ExecutionResult:
+        return result if self._journal is None else result.brief()
+
+    def append(self, result: ExecutionResult):
+        with self._lock:
+            if result.host in self._given_up:
+                return
+            self._results.append(self._keep(result))
+
+        if self._journal is not None:
+            self._journal.append([result])
+
+    def give_up(self, result: ExecutionResult):
+        with self._lock:
+            self._given_up.add(result.host)
+            self._results.append(self._keep(result))
+
+        if self._journal is not None:
+            self._journal.append([result])
+
+    def given_up(self, host: str) -> bool:
+        with self._lock:
+            return host in self._given_up
+
+    def collected(self) -> deque:
+        with self._lock:
+            return deque(self._results)
+
+
+class RunnerOptions:
+    """ Everything needed to build a Runner, as plain data so it can be
+        handed to another process.
+    """
+
+    def __init__(self, template_cache_dir: Optional[pathlib.Path]=None, max_connections: Optional[int]=None,
+                 connection_idle_timeout: Optional[float]=None, max_concurrent_connects: Optional[int]=None,
+                 max_connects_per_destination: Optional[int]=None, connect_rate: Optional[float]=None,
+                 connect_burst: Optional[int]=None, fused_connect: bool=True,
+                 call_timeout: Optional[float]=None, run_timeout: Optional[float]=None,
+                 max_concurrency: Optional[int]=None, adaptive_concurrency: bool=False, initial_concurrency: int=8,
+                 history_path: Optional[pathlib.Path]=None, precheck: bool=False, probe_timeout: float=DEFAULT_PROBE_TIMEOUT,
+                 probe_cache_path: Optional[pathlib.Path]=None, probe_cache_ttl: float=DEFAULT_CACHE_TTL,
+                 bootstrap_settings: Optional[dict]=None, template_prefixes: Optional[List[str]]=None,
+                 ssh_control_dir: Optional[pathlib.Path]=None, ssh_control_persist: int=SshMultiplexer.DEFAULT_PERSIST,
+                 strategy: str=LinearStrategy.NAME, serial: Optional[Union[int, str]]=None, max_fail_percentage: Optional[float]=None,
+                 group_dependencies: Optional[Dict[str, List[str]]]=None, cookbook_paths: Optional[List[str]]=None,
+                 cookbook_bundle_dir: Optional[pathlib.Path]=None, outcome_cache_path: Optional[pathlib.Path]=None,
+                 outcome_cache_ttl: float=DEFAULT_OUTCOME_TTL, skip_unchanged: bool=False, trace: bool=False,
+                 remote_profiling: bool=False):
+        self.template_cache_dir = template_cache_dir
+        self.max_connections = max_connections or None
+        self.connection_idle_timeout = connection_idle_timeout
+        self.max_concurrent_connects = max_concurrent_connects or None
+        self.max_connects_per_destination = max_connects_per_destination
+        self.connect_rate = connect_rate or None
+        self.connect_burst = connect_burst
+        self.fused_connect = fused_connect
+        self.call_timeout = call_timeout or None
+        self.run_timeout = run_timeout or None
+        self.max_concurrency = max_concurrency or None
+        self.adaptive_concurrency = adaptive_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.history_path = history_path
+        self.precheck = precheck
+        self.probe_timeout = probe_timeout
+        self.probe_cache_path = probe_cache_path
+        self.probe_cache_ttl = probe_cache_ttl
+        self.bootstrap_settings = bootstrap_settings or {}
+        self.template_prefixes = template_prefixes or []
+        self.ssh_control_dir = ssh_control_dir
+        self.ssh_control_persist = ssh_control_persist
+        self.strategy = strategy
+        self.serial = serial or None
+        self.max_fail_percentage = max_fail_percentage
+        self.group_dependencies = group_dependencies or {}
+        self.cookbook_paths = cookbook_paths or []
+        self.cookbook_bundle_dir = cookbook_bundle_dir
+        self.outcome_cache_path = outcome_cache_path
+        self.outcome_cache_ttl = outcome_cache_ttl
+        self.skip_unchanged = skip_unchanged
+        self.trace = trace
+        self.remote_profiling = remote_profiling
+
+    def split(self, count: int) -> RunnerOptions:
+        """ Returns options for one of `count` runners sharing these limits.
+            Per-destination limits are kept as-is, since every host behind a
+            destination is given to the same runner.
+        """
+
+        split = copy.copy(self)
+        if self.max_connections:
+            split.max_connections = max(1, math.ceil(self.max_connections / count))
+        if self.max_concurrent_connects:
+            split.max_concurrent_connects = max(1, math.ceil(self.max_concurrent_connects / count))
+        if self.connect_rate:
+            split.connect_rate = self.connect_rate / count
+        if self.max_concurrency:
+            split.max_concurrency = max(1, math.ceil(self.max_concurrency / count))
+        split.initial_concurrency = max(1, math.ceil(self.initial_concurrency / count))
+
+        return split
+
+    def configure_ssh(self) -> Optional[SshMultiplexer]:
+        """ Sets up SSH multiplexing for this process if it was asked for.
+        """
+
+        if self.ssh_control_dir is None:
+            return None
+
+        SshConnectionMethod.multiplexer = SshMultiplexer(self.ssh_control_dir, persist=self.ssh_control_persist)
+        return SshConnectionMethod.multiplexer
+
+    def concurrency(self) -> Optional[AdaptiveLimit]:
+        """ Limit on hosts worked on at once: adaptive up to the maximum, or
+            fixed at the maximum.
+        """
+
+        if self.adaptive_concurrency:
+            return AdaptiveLimit(initial=self.initial_concurrency, maximum=self.max_concurrency)
+        elif self.max_concurrency:
+            return AdaptiveLimit(initial=self.max_concurrency, minimum=self.max_concurrency, maximum=self.max_concurrency)
+
+        return None
+
+    def prober(self) -> Optional[Prober]:
+        if not self.precheck:
+            return None
+
+        cache = None
+        if self.probe_cache_path is not None and self.probe_cache_ttl:
+            cache = ProbeCache(self.probe_cache_path, ttl=self.probe_cache_ttl)
+
+        return Prober(timeout=self.probe_timeout, cache=cache)
+
+    def outcome_cache(self) -> Optional[OutcomeCache]:
+        """ Cache of calls that changed nothing. Outcomes are recorded
+            whenever it has a path, but only skipped on if asked to.
+        """
+
+        if self.outcome_cache_path is None or not self.outcome_cache_ttl:
+            return None
+
+        return OutcomeCache(self.outcome_cache_path, ttl=self.outcome_cache_ttl, skip=self.skip_unchanged)
+
+    def build_strategy(self) -> Strategy:
+        strategy = Strategy.load(self.strategy)
+        if self.serial is not None or self.max_fail_percentage is not None:
+            strategy = SerialStrategy(self.serial or "100%", max_fail_percentage=self.max_fail_percentage, within=strategy)
+        if self.group_dependencies:
+            strategy = GroupOrderStrategy(self.group_dependencies, within=strategy)
+
+        return strategy
+
+    def build(self, journal: Optional[Journal]=None) -> Runner:
+        runner = Runner(
+            template_cache_dir=self.template_cache_dir,
+            max_connections=self.max_connections,
+            connection_idle_timeout=self.connection_idle_timeout,
+            connect_throttle=ConnectThrottle(
+                max_concurrent=self.max_concurrent_connects,
+                max_per_destination=self.max_connects_per_destination,
+                rate=self.connect_rate,
+                burst=self.connect_burst,
+            ),
+            fused_connect=self.fused_connect,
+            call_timeout=self.call_timeout,
+            run_timeout=self.run_timeout,
+            prober=self.prober(),
+            concurrency=self.concurrency(),
+            history=None if self.history_path is None else DurationHistory(self.history_path),
+            strategy=self.build_strategy(),
+            journal=journal,
+            outcome_cache=self.outcome_cache(),
+            tracer=Tracer() if self.trace else None,
+            remote_profiling=self.remote_profiling,
+        )
+        runner.bootstrap_settings = bootstrapper.Settings.load(self.bootstrap_settings)
+        for prefix in self.template_prefixes:
+            runner.register_template_prefix(prefix)
+        # Shard workers are started afresh, and have to be able to import
+        # cookbooks to serve them to hosts when they aren't bundled.
+        recipes.load_cookbooks(self.cookbook_paths)
+        if self.cookbook_paths and self.cookbook_bundle_dir is not None:
+            runner.use_cookbooks(self.cookbook_paths, self.cookbook_bundle_dir)
+
+        return runner
+
+
 class ExecutionResult(DictSerializable):
 
     host: str
     success: Optional[Mapping[str, Any]] = None
     failure: Optional[Mapping[str, Any]] = None
+    timings: Optional[Mapping[str, float]] = None
 
     @classmethod
     def ok(cls, host: str, **kw) -> ExecutionResult:
         return ExecutionResult(host, success=kw)
 
+    @classmethod
+    def fromdict(cls, data: dict) -> ExecutionResult:
+        result = cls(data["host"], success=data.get("success"), failure=data.get("failure"))
+        return result.with_timings(data.get("timings"))
+
     @classmethod
     def fail(cls, host: str, exc: Exception) -> ExecutionResult:
         return ExecutionResult(host, failure={
@@ -184,6 +1134,12 @@ class ExecutionResult(DictSerializable):
         self.host = host
         self.success = success
         self.failure = failure
+        self.timings = None
+
+    def with_timings(self, timings: Optional[Mapping[str, float]]) -> ExecutionResult:
+        self.timings = dict(timings) if timings else None
+
+        return self
 
     def asdict(self):
         out = {"host": self.host}
@@ -192,7 +1148,24 @@ class ExecutionResult(DictSerializable):
         elif self.failure:
             out["failure"] = self.failure
 
+        if self.timings:
+            out["timings"] = self.timings
+
         return out
 
+    def brief(self) -> ExecutionResult:
+        """ Only whether this result failed, and with what, for keeping track
+            of a result that was journaled without holding on to all of it.
+        """
+
+        if self.failure:
+            return ExecutionResult(self.host, failure={"exception": self.failure["exception"]})
+
+        return ExecutionResult(self.host, success={"journaled": True})
+
+    @property
+    def timed_out(self) -> bool:
+        return bool(self.failure) and self.failure["exception"] == DeadlineExceeded.__name__
+
     def outcome(self) -> Optional[Mapping[str, Any]]:
         return self.success or self.failure
\ No newline at end of file
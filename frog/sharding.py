@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import heapq
+import logging
+import multiprocessing
+import pickle
+import queue
+import sys
+from typing import Dict, List, Optional, Set
+
+from frog import metrics
+from frog.connection_pool import PoolStats
+from frog.errors import ShardError
+from frog.fact_cache import FactCache
+from frog.inventory import Inventory, InventoryItem
+from frog.journal import Journal
+from frog.runner import ExecutionResult, RunnerOptions
+from frog.tracing import Tracer
+from frog.util import Latencies
+
+logger = logging.getLogger(__name__)
+
+""" How long the aggregator waits for a message before checking on its workers. """
+POLL_INTERVAL = 1.0
+
+
+def partition(inventory: Inventory, count: int) -> List[Inventory]:
+    """ Splits `inventory` into at most `count` inventories of about the same
+        size. Hosts reached through the same destination (eg. a jump host)
+        always end up together, so per-destination limits still hold.
+        Each part keeps `inventory` as its parent.
+    """
+
+    by_destination: Dict[str, List[InventoryItem]] = {}
+    for item in inventory:
+        by_destination.setdefault(item.destination, []).append(item)
+
+    # Biggest destinations first, each onto the currently smallest shard.
+    shards = [(0, idx) for idx in range(max(1, min(count, len(by_destination))))]
+    assigned: Dict[int, int] = {}
+    for items in sorted(by_destination.values(), key=len, reverse=True):
+        size, idx = heapq.heappop(shards)
+        for item in items:
+            assigned[id(item)] = idx
+        heapq.heappush(shards, (size + len(items), idx))
+
+    parts: List[Dict[str, List[InventoryItem]]] = [{} for _ in shards]
+    for group, items in inventory.hosts.items():
+        for item in items:
+            parts[assigned[id(item)]].setdefault(group, []).append(item)
+
+    return [Inventory(hosts, parent=inventory) for hosts in parts if hosts]
+
+
+class ShardFactCache(FactCache):
+    """ Fact cache used inside a shard worker. Starts with the facts the
+        parent already had cached and sends every update back to the parent.
+    """
+
+    def __init__(self, cached: Dict[str, dict], updates: multiprocessing.Queue):
+        self._cache = cached
+        self._updates = updates
+
+    def get(self, hostname: str) -> dict:
+        try:
+            return self._cache[hostname]
+        except KeyError:
+            raise FactCache.NeedsUpdate(hostname)
+
+    def update(self, hostname: str, data: dict):
+        self._cache[hostname] = data
+        self._updates.put(("facts", hostname, data))
+
+
+def _portable(result: ExecutionResult) -> ExecutionResult:
+    """ Makes sure a result can be pickled back to the parent. Failures may
+        carry exceptions that can't be, in which case only their repr is kept.
+    """
+
+    try:
+        pickle.dumps(result)
+        return result
+    except Exception:
+        result.failure = dict(result.failure, args=tuple(repr(arg) for arg in result.failure["args"]))
+        return result
+
+
+def _run_shard(index: int, hosts: Inventory, target: str, kw: dict, options: RunnerOptions,
+               cached_facts: Dict[str, dict], messages: multiprocessing.Queue, log_config: dict):
+    """ Entrypoint of a shard worker process.
+    """
+
+    logging.basicConfig(level=log_config["level"], stream=sys.stdout, format=log_config["format"])
+    logging.getLogger("mitogen").setLevel(log_config["mitogen_level"])
+
+    multiplexer = options.configure_ssh()
+    runner = options.build()
+    try:
+        for result in runner.run(hosts, target, kw, fact_cache=ShardFactCache(cached_facts, messages)):
+            messages.put(("result", _portable(result)))
+        relays = runner.relay_stats()
+    finally:
+        runner.close()
+
+    messages.put(("done", index, {
+        "latencies": runner.latencies.samples(),
+        "connections": runner.connection_stats.asdict(),
+        "ssh": multiplexer.stats() if multiplexer is not None else {},
+        "makespans": runner.makespans,
+        "bundles": runner.bundle_stats,
+        "relays": relays,
+        "trace": [] if runner.tracer is None else runner.tracer.events(),
+        "metrics": metrics.REGISTRY.samples(),
+    }))
+
+
+class ShardedRunner:
+    """ Runs across `shards` worker processes, each with its own mitogen
+        broker and Runner, so serializing and handling results for large
+        inventories isn't bound to a single core. Results, fact updates and
+        statistics are sent back to and merged by this process.
+    """
+
+    def __init__(self, options: RunnerOptions, shards: int, log_format: Optional[str]=None, journal: Optional[Journal]=None):
+        self._options = options
+        self.journal = journal
+        self._shards = shards
+        # Workers log the same way this process was set up to.
+        self._log_config = {
+            "level": logging.getLogger().getEffectiveLevel(),
+            "format": log_format or logging.BASIC_FORMAT,
+            "mitogen_level": logging.getLogger("mitogen").getEffectiveLevel(),
+        }
+        self._mp = multiprocessing.get_context("spawn")
+        self.latencies = Latencies()
+        self.connection_stats = PoolStats()
+        self.ssh_stats: Dict[str, int] = {}
+        self.makespans: Dict[str, Dict[str, float]] = {}
+        self.bundle_stats: Dict[str, int] = {}
+        self._relay_stats: Dict[str, dict] = {}
+        self.tracer = Tracer() if options.trace else None
+
+    def __repr__(self) -> str:
+        return f"<ShardedRunner shards={self._shards}>"
+
+    def run(self, hosts: Inventory, target: str, kw: Optional[dict]=None, fact_cache: Optional[FactCache]=None) -> List[ExecutionResult]:
+        if kw is None:
+            kw = {}
+
+        parts = partition(hosts, self._shards)
+        options = self._options.split(len(parts))
+        messages = self._mp.Queue()
+
+        workers = []
+        for index, part in enumerate(parts):
+            worker = self._mp.Process(
+                name=f"shard[{index}]",
+                target=_run_shard,
+                args=(index, part, target, kw, options, self._cached_facts(part, fact_cache),
+                      messages, self._log_config),
+            )
+            worker.start()
+            workers.append(worker)
+
+        logger.info(f"Started {len(workers)} shards for {len(hosts)} hosts")
+
+        try:
+            results = self._aggregate(parts, workers, messages, fact_cache)
+        finally:
+            for worker in workers:
+                worker.join()
+
+        return results
+
+    def _cached_facts(self, hosts: Inventory, fact_cache: Optional[FactCache]) -> Dict[str, dict]:
+        cached = {}
+        if fact_cache is None:
+            return cached
+
+        for item in hosts:
+            try:
+                cached[item.host] = fact_cache.get(item.host)
+            except FactCache.NeedsUpdate:
+                pass
+
+        return cached
+
+    def _aggregate(self, parts: List[Inventory], workers: list, messages: multiprocessing.Queue,
+                   fact_cache: Optional[FactCache]) -> List[ExecutionResult]:
+        results: List[ExecutionResult] = []
+        reported: Set[str] = set()
+        running = set(range(len(workers)))
+        exited: Set[int] = set()
+
+        while running:
+            try:
+                message = messages.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A worker that was already gone the last time we looked and
+                # still hasn't reported, never will.
+                for index in list(running):
+                    if workers[index].exitcode is None:
+                        continue
+                    if index not in exited:
+                        exited.add(index)
+                        continue
+
+                    running.discard(index)
+                    error = ShardError(index, workers[index].exitcode)
+                    logger.error(f"{error}")
+                    lost = [ExecutionResult.fail(item.host, error) for item in parts[index] if item.host not in reported]
+                    results.extend(self._record(lost))
+                continue
+
+            kind = message[0]
+            if kind == "result":
+                results.extend(self._record([message[1]]))
+                reported.add(message[1].host)
+            elif kind == "facts":
+                if fact_cache is not None:
+                    fact_cache.update(message[1], message[2])
+            elif kind == "done":
+                _, index, stats = message
+                running.discard(index)
+                self.latencies.merge(stats["latencies"])
+                self.connection_stats.merge(stats["connections"])
+                for name, value in stats["ssh"].items():
+                    self.ssh_stats[name] = self.ssh_stats.get(name, 0) + value
+                for name, value in stats["bundles"].items():
+                    self.bundle_stats[name] = self.bundle_stats.get(name, 0) + value
+                # Hosts behind a jump host all land in the same shard.
+                self._relay_stats.update(stats["relays"])
+                if self.tracer is not None:
+                    self.tracer.merge(stats["trace"])
+                metrics.REGISTRY.merge(stats["metrics"])
+                # Shards run side by side, so the slowest one sets the makespan.
+                for target, makespan in stats["makespans"].items():
+                    merged = self.makespans.setdefault(target, {})
+                    for name, value in makespan.items():
+                        merged[name] = max(merged.get(name, 0.0), value)
+
+        return results
+
+    def _record(self, results: List[ExecutionResult]) -> List[ExecutionResult]:
+        """ Journals results as they arrive, as workers don't, and returns
+            what of them to keep: only brief results once journaled.
+        """
+
+        if self.journal is None:
+            return results
+
+        self.journal.append(results)
+        return [result.brief() for result in results]
+
+    def relay_stats(self) -> Dict[str, dict]:
+        return dict(self._relay_stats)
+
+    def close(self):
+        """ Nothing to do, each worker closes its own Runner.
+        """
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import pathlib
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import jinja2
+from jinja2.bccache import Bucket
+from mitogen.core import Message
+from mitogen.master import Router
+from mitogen.service import AllowAny, Service, arg_spec, expose
+
+from frog.inventory import Inventory, InventoryItem
+
+logger = logging.getLogger(__name__)
+
+
+_expression_pattern = re.compile(r"^\s*{{(?P<expr>(?:(?!{{|}}).)*)}}\s*$", re.DOTALL)
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_templated(value: str) -> bool:
+    return "{{" in value or "{%" in value
+
+
+def host_variables(item: InventoryItem, inventory: Optional[Inventory]) -> dict:
+    """ Variables exposed to templates rendered for `item`.
+    """
+
+    return {
+        "host": item,
+        "facts": item.facts,
+        "inventory": inventory,
+    }
+
+
+class ContentHashBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """ Jinja bytecode cache keyed by the hash of the template source, so the
+        same template is only ever compiled once no matter where it lives.
+    """
+
+    def get_bucket(self, environment: jinja2.Environment, name: str, filename: Optional[str], source: str) -> Bucket:
+        key = self.get_source_checksum(source)
+        bucket = Bucket(environment, key, key)
+        self.load_bytecode(bucket)
+        return bucket
+
+
+class TemplateService(Service):
+    """ Renders templates on the controller on behalf of remote hosts.
+        Templates are parsed and compiled once per run and rendered against
+        the facts of the requesting host.
+    """
+
+    def __init__(self, router: Router, cache_dir: Optional[pathlib.Path]=None):
+        super().__init__(router)
+        self._hosts: Dict[str, InventoryItem] = {}
+        # context id -> the host it is the connection to
+        self._contexts: Dict[int, str] = {}
+        self._inventory: Optional[Inventory] = None
+        self._lock = threading.Lock()
+
+        bytecode_cache = None
+        if cache_dir is not None:
+            cache_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+            bytecode_cache = ContentHashBytecodeCache(str(cache_dir))
+
+        self._env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader([]),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False,
+            cache_size=-1,
+            keep_trailing_newline=True,
+            undefined=jinja2.StrictUndefined,
+        )
+
+    def register_prefix(self, path: str):
+        """ Allows templates under `path` to be rendered.
+        """
+
+        search_paths = self._env.loader.searchpath
+        if path not in search_paths:
+            search_paths.append(path)
+
+    def set_inventory(self, inventory: Inventory):
+        root = inventory.root()
+        with self._lock:
+            self._inventory = root
+            self._hosts = {item.host: item for item in root}
+
+    def register_context(self, context_id: int, hostname: str):
+        """ Records that calls on `context_id` are made for `hostname`, so
+            templates it asks for are rendered for that host.
+        """
+
+        with self._lock:
+            self._contexts[context_id] = hostname
+
+    def render_for(self, name: str, item: InventoryItem, variables: Optional[dict]=None) -> str:
+        template = self._env.get_template(name)
+        return template.render(
+            **host_variables(item, self._inventory),
+            **(variables or {}),
+        )
+
+    @expose(policy=AllowAny())
+    @arg_spec({
+        "name": str,
+        "variables": dict,
+    })
+    def render(self, name: str, variables: dict, checksum: Optional[str]=None, encoding: str="utf-8", msg: Message=None) -> dict:
+        """ Renders template `name` for the host asking for it, as known by
+            the context the request came from, so no host can render another
+            host's template. If the rendered output hashes to `checksum`, the
+            output is not sent back.
+        """
+
+        with self._lock:
+            hostname = self._contexts.get(msg.src_id)
+            item = self._hosts.get(hostname)
+        if item is None:
+            raise LookupError(f"Context {msg.src_id} is not connected to a host in the inventory being run")
+
+        rendered = self.render_for(name, item, variables)
+        rendered_checksum = digest(rendered.encode(encoding))
+        logger.debug(f"Rendered {name} for {hostname} ({rendered_checksum})")
+
+        return {
+            "checksum": rendered_checksum,
+            "contents": None if rendered_checksum == checksum else rendered,
+        }
+
+
+class HostParameters:
+    """ Resource parameters whose values may reference host facts and inventory
+        fields through templates. Every templated value is compiled once, up
+        front, and evaluated per host in the dispatch loop.
+        A value that is a single `{{ expression }}` keeps the type of the
+        expression's result; anything else renders to a string.
+    """
+
+    def __init__(self, params: dict, environment: Optional[jinja2.Environment]=None):
+        self._env = environment or jinja2.Environment(undefined=jinja2.StrictUndefined)
+        self._params = params
+        self._templated = False
+        self._compiled = self._compile(params)
+
+    def __repr__(self) -> str:
+        return f"<HostParameters {self._params} templated={self._templated}>"
+
+    @property
+    def templated(self) -> bool:
+        return self._templated
+
+    def _compile(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: self._compile(v) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [self._compile(v) for v in value]
+        elif isinstance(value, str) and is_templated(value):
+            self._templated = True
+            match = _expression_pattern.match(value)
+            if match is not None:
+                expression = self._env.compile_expression(match.group("expr"), undefined_to_none=False)
+                return _Compiled(lambda variables: expression(**variables))
+
+            template = self._env.from_string(value)
+            return _Compiled(lambda variables: template.render(variables))
+
+        return value
+
+    def _evaluate(self, value: Any, variables: dict) -> Any:
+        if isinstance(value, _Compiled):
+            return value.fn(variables)
+        elif isinstance(value, dict):
+            return {k: self._evaluate(v, variables) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [self._evaluate(v, variables) for v in value]
+
+        return value
+
+    def for_host(self, item: InventoryItem, inventory: Optional[Inventory]=None) -> dict:
+        """ Returns the parameters evaluated for `item`.
+        """
+
+        if not self._templated:
+            return self._params
+
+        return self._evaluate(self._compiled, host_variables(item, inventory))
+
+
+class _Compiled:
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable[[dict], Any]):
+        self.fn = fn
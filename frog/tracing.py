@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import pathlib
+import tempfile
+import threading
+from typing import Dict, List
+
+
+class Tracer:
+    """ Collects what each host spent its time on as spans, one timeline
+        per host, for export in Chrome's trace event format (chrome://tracing,
+        Perfetto). Phases are named like "connect.ssh", nested ones after
+        the phase they are part of.
+    """
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._events: List[dict] = []
+        self._threads: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<Tracer pid={self._pid} spans={len(self._events)}>"
+
+    def add(self, host: str, phase: str, started: float, seconds: float):
+        """ Records `host` spending `seconds` in `phase` from `started`, in
+            seconds since the epoch so spans from other processes line up.
+        """
+
+        with self._lock:
+            tid = self._threads.get(host)
+            if tid is None:
+                tid = self._threads[host] = len(self._threads) + 1
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": host}})
+
+            self._events.append({
+                "name": phase,
+                "cat": phase.partition(".")[0],
+                "ph": "X",
+                "ts": round(started * 1e6),
+                "dur": round(seconds * 1e6),
+                "pid": self._pid,
+                "tid": tid,
+            })
+
+    def events(self) -> List[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def merge(self, events: List[dict]):
+        """ Adds events traced elsewhere, eg. by another process.
+        """
+
+        with self._lock:
+            self._events.extend(events)
+
+    def write(self, path: pathlib.Path):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        with io.open(fd, "w") as trace_fp:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, trace_fp)
+        os.replace(tmp_path, path)
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import math
+import threading
 import time
+from typing import Dict, List, Sequence
 
-__all__ = ["deco", "dictser", "kvparse", "outputs", "packages"]
+__all__ = ["concurrency", "deco", "dictser", "kvparse", "outputs", "packages", "ratelimit"]
 
 
 class Timer:
@@ -31,4 +34,60 @@ class Timer:
         if self._time_taken is None:
             raise Exception("Nothing has been measured!")
 
-        return self._time_taken
\ No newline at end of file
+        return self._time_taken
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """ Returns the `pct`th percentile of already sorted `samples`,
+        using the nearest-rank method.
+    """
+
+    if not samples:
+        return 0.0
+
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+class Latencies:
+    """ Collects latency samples, in seconds, for named phases of work.
+    """
+
+    def __init__(self):
+        self._samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(phase, []).append(seconds)
+
+    def record_all(self, timings: Dict[str, float]):
+        for phase, seconds in timings.items():
+            self.record(phase, seconds)
+
+    def samples(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {phase: list(values) for phase, values in self._samples.items()}
+
+    def merge(self, samples: Dict[str, List[float]]):
+        """ Adds samples collected elsewhere, eg. by another process.
+        """
+
+        with self._lock:
+            for phase, values in samples.items():
+                self._samples.setdefault(phase, []).extend(values)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples = {phase: sorted(values) for phase, values in self._samples.items()}
+
+        return {
+            phase: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1],
+            }
+            for phase, values in samples.items()
+        }
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimit:
+    """ AIMD concurrency limit. Every healthy completion grows the limit by
+        1/limit, so about one per round of `limit` completions, and an
+        unhealthy one cuts it by `backoff`. After backing off, completions of
+        work that was already in flight are ignored.
+
+        A completion is unhealthy if the smoothed latency has grown past
+        `tolerance` times the lowest smoothed latency of the last `window`
+        completions, or the smoothed error rate is above `max_error_rate`.
+        The baseline only looks back so far so that a few unusually fast
+        completions can't hold the limit down for good. Doesn't keep time
+        itself, so it behaves the same given the same completions.
+    """
+
+    def __init__(self, initial: int=8, minimum: int=1, maximum: Optional[int]=None, backoff: float=0.5,
+                 tolerance: float=2.0, max_error_rate: float=0.1, smoothing: float=0.2, window: int=1000):
+        self._minimum = max(1, minimum)
+        self._maximum = maximum or None
+        self._backoff = backoff
+        self._tolerance = tolerance
+        self._max_error_rate = max_error_rate
+        self._smoothing = smoothing
+
+        self._limit = float(self._clamp(initial))
+        self._latency: Optional[float] = None
+        self._recent: deque = deque(maxlen=window)
+        self._error_rate = 0.0
+        self._since_backoff = 0
+        self._round = 0
+
+    def __repr__(self) -> str:
+        return f"<AdaptiveLimit current={self.current} latency={self._latency} baseline={self.baseline} error_rate={self._error_rate:.3f}>"
+
+    def _clamp(self, limit: float) -> float:
+        limit = max(self._minimum, limit)
+        return limit if self._maximum is None else min(self._maximum, limit)
+
+    @property
+    def current(self) -> int:
+        return int(self._limit)
+
+    @property
+    def baseline(self) -> Optional[float]:
+        return min(self._recent) if self._recent else None
+
+    def healthy(self) -> bool:
+        if self._error_rate > self._max_error_rate:
+            return False
+
+        return self._latency is None or self._latency <= self._tolerance * self.baseline
+
+    def record(self, latency: Optional[float], ok: bool=True) -> int:
+        """ Records a completion taking `latency` seconds, returning the new
+            limit. A completion whose latency says nothing about load, eg. a
+            host that could not be connected to, is recorded without one.
+        """
+
+        # Work started before the last backoff says nothing about the new
+        # limit, so wait for as much as was in flight then to finish.
+        self._since_backoff += 1
+        if self._since_backoff <= self._round:
+            return self.current
+
+        if latency is not None:
+            self._latency = latency if self._latency is None else self._latency + self._smoothing * (latency - self._latency)
+            self._recent.append(self._latency)
+        self._error_rate += self._smoothing * ((0.0 if ok else 1.0) - self._error_rate)
+
+        if self.healthy():
+            self._limit = self._clamp(self._limit + 1 / self._limit)
+        else:
+            self._round = self.current
+            self._since_backoff = 0
+            self._limit = self._clamp(self._limit * self._backoff)
+            self._latency = None
+            self._error_rate = 0.0
+
+        return self.current
+
+
+class ConcurrencyGate:
+    """ Admits work while fewer than `limit.current` items are in flight,
+        and feeds how each one went back into the limit.
+    """
+
+    def __init__(self, limit: AdaptiveLimit):
+        self.limit = limit
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def __repr__(self) -> str:
+        return f"<ConcurrencyGate in_flight={self._in_flight} {self.limit}>"
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, deadline: Optional[float]=None) -> bool:
+        """ Waits for room to start another item. Returns False if the
+            monotonic `deadline` passed first.
+        """
+
+        with self._cond:
+            while self._in_flight >= self.limit.current:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    return False
+
+                self._cond.wait(timeout)
+
+            self._in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float]=None, ok: bool=True):
+        """ Frees the slot of an item that finished. Items that completed
+            without a latency and without failing, eg. ones skipped, leave
+            the limit alone.
+        """
+
+        with self._cond:
+            self._in_flight -= 1
+            if latency is not None or not ok:
+                before = self.limit.current
+                after = self.limit.record(latency, ok)
+                if after != before:
+                    logger.debug(f"Concurrency limit {before} -> {after} ({self.limit})")
+            self._cond.notify_all()
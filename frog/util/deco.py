@@ -4,7 +4,9 @@ import functools
 import inspect
 import logging
 import typing
-from typing import Callable, List, Type
+from typing import Callable, List, Optional, Type
+
+from frog.recipes import Recipe
 
 logger = logging.getLogger(__name__)
 
@@ -47,13 +49,12 @@ def hydrate_from_dict(target_type: Type) -> Callable:
     return _hydrate_outer
 
 
-def recipe(desc: str, depends_on: List[Callable]):
+def recipe(desc: str, depends_on: Optional[List[Callable]]=None) -> Callable:
     """ Marks a function as a recipe to be run and assists in
         the creation of a dependency graph.
     """
 
     def _inner(fn: Callable) -> Callable:
-        logger.warning("@recipe is not actually implemented, fyi")
-        return fn
+        return Recipe(fn, desc, depends_on=depends_on)
 
-    return _inner
\ No newline at end of file
+    return _inner
@@ -1,83 +1,295 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import regex
-from typing import Dict, List, Optional
+import re
+from typing import Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
 QUOTES = "\"'"
+TEMPLATE_OPENERS = {"{{": "}}", "{%": "%}", "{#": "#}"}
+BOOLEANS = {"true": True, "false": False}
 
-_kvinline_pattern = regex.compile(
-    r"""(?:                # Begin non capturing group for whole pair.
-          (?P<key>         # Named capture for key
-            [\w]+          # Capture 1+ alphanumeric values
-          )                # End key capture
-          =                # Literal '='
-          (?P<value>       # Named capture for value
-            (?:            # Begin group for escaped values
-              (?P<subitem> #   Begin group for subparser groups
-                {          #   Literal '{'
-                  (?R)+?   #   Recursively match the whole thing
-                }          #   Literal '}'
-              )            #   End group for subparser groups
-              |            # -OR-
-              (?:          #  Begin group for quoted values
-                '.+?'      #  Capture between two single quotes lazily.
-              )            #  End capture for quoted values
-              |            # -OR-
-              (?:          #  Begin group for quoted values
-                ".+?"      #  Capture between two double quotes lazily.
-              )            #  End group for quoted values
-              |            # -OR-
-              (?:          #  Begin group for unquoted values
-                [\w\s,-/]+ #  Capture 1+ non-whitespace character
-              )            #  End capture for unquoted values
-            )              # End capture for possibly escaped values
-          )                # End capture for value
-          (?:              # Group for whitespace between pairs
-            \s+            # Capture 1+ whitespace character
-          )?               # End whitespace capture, optional
-        )+?                # End pair capture, lazily capture 1+
-""",
-    regex.VERBOSE,
-)
-
-
-def _unpack(key: str, value: str, subitem: Optional[str] = None):
-    key = key.lstrip(QUOTES).rstrip(QUOTES)
-    if value == subitem:
-        # Parse the subitem with the outer braces removed
-        subitem = value[1:-1]
-        return {key: parse(subitem)}
-
-    return {key: value.lstrip(QUOTES).rstrip(QUOTES)}
-
-
-def parse_many(items: List[str]) -> Dict[str, str]:
-    """ Uses a regex to parse every item in a list.
+# Only ever matched against a single, already delimited unquoted value.
+_integer = re.compile(r"[-+]?(?P<digits>\d+)")
+_octal = re.compile(r"[-+]?0[oO][0-7]+")
+# Keys like `mode` and `create_mode`, whose leading zero values are octal.
+_mode_key = re.compile(r"(?:^|_)mode$")
+
+# Every pattern below is a single character class, so matching them never
+# backtracks; they only let the parser skip over runs of ordinary characters.
+_whitespace = re.compile(r"\s*")
+_key = re.compile(r"\w*")
+_pair_start = re.compile(r"\w+=")
+_bare_run = re.compile(r"[^\s{}\[\],]*")
+_quoted_run = {quote: re.compile(f"[^{quote}\\\\]*") for quote in QUOTES}
+
+
+class ParseError(ValueError):
+    """ Raised when parameters can't be parsed. Carries the position
+        in the input the error was found at.
     """
 
-    kvitems = {}
+    def __init__(self, message: str, data: str, position: int):
+        super().__init__(f"{message} at position {position}: {data!r}")
+        self.message = message
+        self.data = data
+        self.position = position
 
-    for item in items:
-        matches = _kvinline_pattern.finditer(item)
-        for match in matches:
-            logger.debug(f"Parsed parameter `{item}` => `{match.groups()}`")
-            kvitems.update(_unpack(*match.groups()))
 
-    return dict(kvitems.items())
+def coerce(value: str, key: Optional[str]=None) -> Any:
+    """ Converts an unquoted value to an int or bool if it looks like one,
+        otherwise returns it unchanged. Dotted values, like versions, are
+        always left as strings.
+
+        Octal is written with a `0o` prefix, eg. `0o640`. Values of mode-like
+        `key`s may leave it out, as file modes are written: `mode=0640` is
+        0o640. Any other integer with a leading zero, like an id, is left
+        as a string. Raises ValueError for a mode that isn't octal.
+    """
+
+    if _octal.fullmatch(value) is not None:
+        return int(value, 8)
 
+    integer = _integer.fullmatch(value)
+    if integer is not None:
+        digits = integer.group("digits")
+        if len(digits) == 1 or not digits.startswith("0"):
+            return int(value)
+        if key is None or _mode_key.search(key) is None:
+            return value
 
-def parse(data: str) -> Dict[str, str]:
-    """ Uses a regex to parse data in key=value format into a
-        dictionary.
+        try:
+            return int(value, 8)
+        except ValueError:
+            raise ValueError(f"`{key}={value}` has a leading zero but isn't an octal mode") from None
+
+    return BOOLEANS.get(value.lower(), value)
+
+
+class _Parser:
+    """ Single-pass parser for `key=value` parameters.
+
+        Values can be:
+          - nested pairs in braces: `key={a=1 b=2}`
+          - lists in brackets: `key=[1, two, 'three']`
+          - single or double quoted strings, where a backslash escapes the
+            quote character or another backslash
+          - unquoted values, which are coerced to ints and bools, with
+            modes and `0o` prefixed values read as octal (see `coerce`).
+            An unquoted value runs until the next `key=`, so
+            `contents=hello world` keeps its space. Jinja template tags
+            (`{{ ... }}`) are kept intact inside unquoted values.
     """
 
-    kvitems = {}
+    def __init__(self, data: str):
+        self.data = data
+        self.pos = 0
+        self.length = len(data)
+
+    def error(self, message: str, position: Optional[int]=None) -> ParseError:
+        return ParseError(message, self.data, self.pos if position is None else position)
+
+    def skip_whitespace(self):
+        self.pos = _whitespace.match(self.data, self.pos).end()
+
+    def peek(self) -> str:
+        return self.data[self.pos] if self.pos < self.length else ""
+
+    def at_pair_start(self, pos: int) -> bool:
+        """ Returns whether a `key=` starts at `pos`.
+        """
+
+        return _pair_start.match(self.data, pos) is not None
+
+    def parse_pairs(self, closer: Optional[str]=None) -> Dict[str, Any]:
+        items: Dict[str, Any] = {}
+
+        while True:
+            self.skip_whitespace()
+            char = self.peek()
+            if char == "":
+                if closer is not None:
+                    raise self.error(f"Expected `{closer}` before end of input")
+                return items
+            if closer is not None and char == closer:
+                self.pos += 1
+                return items
+
+            key = self.parse_key()
+            if self.peek() != "=":
+                raise self.error(f"Expected `=` after key `{key}`")
+            self.pos += 1
+
+            items[key] = self.parse_value(closer, key)
+
+    def parse_key(self) -> str:
+        char = self.peek()
+        if char and char in QUOTES:
+            return self.parse_quoted()
+
+        start = self.pos
+        self.pos = _key.match(self.data, self.pos).end()
+
+        if self.pos == start:
+            raise self.error(f"Expected a key, found `{char}`")
+
+        return self.data[start:self.pos]
+
+    def parse_value(self, closer: Optional[str], key: Optional[str]=None) -> Any:
+        char = self.peek()
+        if char == "{" and self.data[self.pos:self.pos + 2] not in TEMPLATE_OPENERS:
+            self.pos += 1
+            value = self.parse_pairs("}")
+        elif char == "[":
+            self.pos += 1
+            value = self.parse_list()
+        elif char and char in QUOTES:
+            value = self.parse_quoted()
+        else:
+            return self.parse_bare(closer, in_list=False, key=key)
+
+        self.expect_separator(closer)
+        return value
+
+    def expect_separator(self, closer: Optional[str]):
+        char = self.peek()
+        if char == "" or char.isspace() or (closer is not None and char == closer):
+            return
+
+        raise self.error(f"Unexpected `{char}` after value")
 
-    matches = _kvinline_pattern.finditer(data)
-    for match in matches:
-        kvitems.update(_unpack(*match.groups()))
+    def parse_list(self) -> List[Any]:
+        items: List[Any] = []
+
+        self.skip_whitespace()
+        if self.peek() == "]":
+            self.pos += 1
+            return items
+
+        while True:
+            self.skip_whitespace()
+            char = self.peek()
+            if char == "":
+                raise self.error("Expected `]` before end of input")
+
+            if char == "{" and self.data[self.pos:self.pos + 2] not in TEMPLATE_OPENERS:
+                self.pos += 1
+                items.append(self.parse_pairs("}"))
+            elif char == "[":
+                self.pos += 1
+                items.append(self.parse_list())
+            elif char in QUOTES:
+                items.append(self.parse_quoted())
+            else:
+                items.append(self.parse_bare("]", in_list=True))
+
+            self.skip_whitespace()
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+            elif char == "]":
+                self.pos += 1
+                return items
+            elif char == "":
+                raise self.error("Expected `]` before end of input")
+            else:
+                raise self.error(f"Expected `,` or `]` in list, found `{char}`")
+
+    def parse_quoted(self) -> str:
+        quote = self.data[self.pos]
+        start = self.pos
+        self.pos += 1
+
+        chunks = []
+        chunk_start = self.pos
+        run = _quoted_run[quote]
+        while self.pos < self.length:
+            self.pos = run.match(self.data, self.pos).end()
+            if self.pos == self.length:
+                break
+
+            char = self.data[self.pos]
+            if char == "\\" and self.pos + 1 < self.length and self.data[self.pos + 1] in (quote, "\\"):
+                chunks.append(self.data[chunk_start:self.pos])
+                chunk_start = self.pos + 1
+                self.pos += 2
+            elif char == quote:
+                chunks.append(self.data[chunk_start:self.pos])
+                self.pos += 1
+                return "".join(chunks)
+            else:
+                # A lone backslash is kept as-is.
+                self.pos += 1
+
+        raise self.error(f"Unterminated {quote} quote", position=start)
+
+    def skip_template_tag(self):
+        start = self.pos
+        end = TEMPLATE_OPENERS[self.data[self.pos:self.pos + 2]]
+        found = self.data.find(end, self.pos + 2)
+        if found == -1:
+            raise self.error(f"Unterminated template tag, expected `{end}`", position=start)
+
+        self.pos = found + 2
+
+    def parse_bare(self, closer: Optional[str], in_list: bool, key: Optional[str]=None) -> Any:
+        start = self.pos
+
+        while self.pos < self.length:
+            self.pos = _bare_run.match(self.data, self.pos).end()
+            if self.pos == self.length:
+                break
+
+            char = self.data[self.pos]
+            if char == "{" and self.data[self.pos:self.pos + 2] in TEMPLATE_OPENERS:
+                self.skip_template_tag()
+                continue
+            if closer is not None and char == closer:
+                break
+            if in_list and char == ",":
+                break
+            if char.isspace() and not in_list:
+                # Outside of lists, whitespace only ends the value when
+                # another `key=` or the closing brace follows it.
+                ws_end = _whitespace.match(self.data, self.pos).end()
+                if ws_end == self.length or self.data[ws_end] == closer or self.at_pair_start(ws_end):
+                    break
+
+                self.pos = ws_end
+                continue
+            if char in "{}" or (in_list and char == "["):
+                raise self.error(f"Unexpected `{char}` in unquoted value")
+
+            self.pos += 1
+
+        value = self.data[start:self.pos].rstrip()
+        if not value:
+            raise self.error("Expected a value")
+
+        try:
+            return coerce(value, key)
+        except ValueError as err:
+            raise self.error(str(err), position=start) from None
+
+
+def parse_many(items: List[str]) -> Dict[str, Any]:
+    """ Parses every item in a list, merging the results.
+    """
+
+    kvitems: Dict[str, Any] = {}
+
+    for item in items:
+        parsed = parse(item)
+        logger.debug(f"Parsed parameter `{item}` => `{parsed}`")
+        kvitems.update(parsed)
+
+    return kvitems
+
+
+def parse(data: str) -> Dict[str, Any]:
+    """ Parses data in key=value format into a dictionary.
+        Raises ParseError, with the offending position, on malformed input.
+    """
 
-    return dict(kvitems.items())
+    return _Parser(data).parse_pairs()
@@ -1,23 +1,53 @@
 # -*- coding: utf-8 -*-
 
+import bisect
+import hashlib
 import json
-from typing import List
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from texttable import Texttable
 
 from frog.runner import ExecutionResult
 
+""" Splits a host name into the part before its number, the number and the rest. """
+_NUMBERED_HOST = re.compile(r"^(?P<prefix>.*?)(?P<number>\d+)(?P<suffix>\D*)$")
 
-def as_json(results: List[ExecutionResult]) -> str:
-    out = {}
 
+def _latest(results: Iterable[ExecutionResult]) -> Iterable[ExecutionResult]:
+    latest = {}
     for result in results:
-        out.update({result.host: result.outcome()})
+        latest[result.host] = result
 
-    return json.dumps(out)
+    return latest.values()
 
 
-def as_texttable(results: List[ExecutionResult]) -> str:
+def stream_json(results: Iterable[ExecutionResult], indent: Optional[int]=None) -> Iterator[str]:
+    """ Renders results as a JSON object of host to outcome, in pieces as
+        results are read, so they never have to be held at once. Every
+        host must only have one result, eg. a journal's latest.
+    """
+
+    pad = "" if indent is None else "\n" + " " * indent
+    first = True
+    yield "{"
+    for result in results:
+        outcome = json.dumps(result.outcome(), indent=indent).replace("\n", pad)
+        pair = f"{json.dumps(result.host)}: {outcome}"
+        if indent is None:
+            yield pair if first else f", {pair}"
+        else:
+            yield f"{pad}{pair}" if first else f",{pad}{pair}"
+        first = False
+
+    yield "}" if first or indent is None else "\n}"
+
+
+def as_json(results: Iterable[ExecutionResult]) -> str:
+    return "".join(stream_json(_latest(results)))
+
+
+def as_texttable(results: Iterable[ExecutionResult]) -> str:
     result_rows = []
     for result in results:
         result_rows.append([result.host, result.outcome()])
@@ -31,10 +61,119 @@ def as_texttable(results: List[ExecutionResult]) -> str:
     return table.draw()
 
 
-def as_pretty_json(results: List[ExecutionResult]) -> str:
-    out = {}
+def as_pretty_json(results: Iterable[ExecutionResult]) -> str:
+    return "".join(stream_json(_latest(results), indent=2))
+
 
+def as_summary(results: Iterable[ExecutionResult]) -> str:
+    summary = Summary()
     for result in results:
-        out.update({result.host: result.outcome()})
+        summary.add(result)
+
+    return summary.draw()
+
+
+def _host_pattern(host: str) -> re.Pattern:
+    """ Matches `host` where it appears on its own. Host names run on with
+        dots and dashes, so eg. web-1 is not matched in web-10 or web-1.lan.
+    """
+
+    return re.compile(rf"(?<![\w.-]){re.escape(host)}(?![\w-]|\.\w)")
+
+
+def _normalize(value: Any, host: re.Pattern) -> Any:
+    """ Replaces the host's name in `value`, so outcomes that only differ by
+        which host they came from, eg. errors naming it, are the same.
+    """
+
+    if isinstance(value, str):
+        return host.sub("{host}", value)
+    elif isinstance(value, dict):
+        return {key: _normalize(item, host) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_normalize(item, host) for item in value]
+
+    return value
+
+
+class HostSet:
+    """ Host names kept as ranges of numbered names, eg. web-[001-250], so
+        hosts named in sequence take the space of one.
+    """
+
+    def __init__(self):
+        # (prefix, digits, suffix) -> sorted, disjoint [first, last] ranges
+        self._ranges: Dict[Tuple[str, int, str], List[List[int]]] = {}
+        self._names: List[str] = []
+        self.count = 0
+
+    def add(self, host: str):
+        self.count += 1
+        match = _NUMBERED_HOST.match(host)
+        if match is None:
+            bisect.insort(self._names, host)
+            return
+
+        number = int(match.group("number"))
+        ranges = self._ranges.setdefault((match.group("prefix"), len(match.group("number")), match.group("suffix")), [])
+        index = bisect.bisect(ranges, [number, number])
+        if index > 0 and ranges[index - 1][1] >= number - 1:
+            index -= 1
+            ranges[index][1] = max(ranges[index][1], number)
+        elif index < len(ranges) and ranges[index][0] <= number + 1:
+            ranges[index][0] = min(ranges[index][0], number)
+        else:
+            ranges.insert(index, [number, number])
+
+        # Joins up with the next range, if this filled the gap between them.
+        if index + 1 < len(ranges) and ranges[index + 1][0] <= ranges[index][1] + 1:
+            ranges[index][1] = max(ranges[index][1], ranges.pop(index + 1)[1])
+
+    def __str__(self) -> str:
+        parts = list(self._names)
+        for (prefix, digits, suffix), ranges in sorted(self._ranges.items()):
+            numbers = [
+                f"{first:0{digits}d}" if first == last else f"{first:0{digits}d}-{last:0{digits}d}"
+                for first, last in ranges
+            ]
+            if len(numbers) == 1 and "-" not in numbers[0]:
+                parts.append(f"{prefix}{numbers[0]}{suffix}")
+            else:
+                parts.append(f"{prefix}[{','.join(numbers)}]{suffix}")
+
+        return " ".join(parts)
+
+
+class Summary:
+    """ Results grouped by what they came out as, added one at a time, so
+        it grows with the number of distinct outcomes rather than hosts.
+    """
+
+    def __init__(self):
+        self._groups: Dict[str, Tuple[Any, HostSet]] = {}
+
+    def add(self, result: ExecutionResult):
+        outcome = _normalize(result.outcome(), _host_pattern(result.host))
+        key = hashlib.sha256(json.dumps(outcome, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = (outcome, HostSet())
+
+        group[1].add(result.host)
+
+    def groups(self) -> List[Tuple[int, str, Any]]:
+        """ (count, hosts, outcome) of each group, the largest first.
+        """
+
+        groups = [(hosts.count, str(hosts), outcome) for outcome, hosts in self._groups.values()]
+        return sorted(groups, key=lambda group: group[0], reverse=True)
+
+    def draw(self) -> str:
+        table = Texttable()
+        table.set_deco(Texttable.HEADER)
+        table.set_header_align(["r", "l", "l"])
+        table.set_cols_align(["r", "l", "l"])
+        table.set_cols_dtype(["i", "t", "t"])
+        table.add_rows([["count", "hosts", "response"], *self.groups()])
 
-    return json.dumps(out, indent=2)
\ No newline at end of file
+        return table.draw()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """ Allows `rate` acquisitions per second on average, with bursts of
+        up to `burst`. A rate of None or 0 means unlimited.
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[int]=None):
+        self._rate = rate or None
+        self._capacity = float(max(1, burst or 1))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<TokenBucket rate={self._rate}/s burst={int(self._capacity)}>"
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """ Takes a token if one is available and returns 0, otherwise
+            returns how long to wait before trying again.
+        """
+
+        if self._rate is None:
+            return 0.0
+
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+
+            return (1 - self._tokens) / self._rate
+
+    def acquire(self):
+        """ Blocks until a token is available.
+        """
+
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+
+            time.sleep(wait)
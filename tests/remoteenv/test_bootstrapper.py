@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from frog.remoteenv import bootstrapper
+
+
+def make_venv(tmp_path, fingerprint=None):
+    settings = bootstrapper.Settings(directory=str(tmp_path))
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "python3").touch()
+    if fingerprint is not None:
+        (tmp_path / bootstrapper.FINGERPRINT_FILE).write_text(fingerprint)
+
+    return settings
+
+
+def test_settings_round_trip_as_dict():
+    settings = bootstrapper.Settings(directory="/srv/env", clean=True)
+
+    loaded = bootstrapper.Settings.load(settings.asdict())
+    assert loaded.asdict() == settings.asdict()
+    assert loaded.python_path == "/srv/env/bin/python3"
+
+
+def test_is_bootstrapped_checks_fingerprint(tmp_path):
+    settings = make_venv(tmp_path, fingerprint="abc")
+
+    assert bootstrapper.is_bootstrapped(settings, "abc")
+    assert not bootstrapper.is_bootstrapped(settings, "def")
+    assert not bootstrapper.is_bootstrapped(settings, None)
+
+
+def test_is_bootstrapped_needs_fingerprint_file(tmp_path):
+    settings = make_venv(tmp_path)
+
+    assert not bootstrapper.is_bootstrapped(settings, "abc")
+
+
+def test_bring_up_skips_facts_when_stale(tmp_path):
+    settings = make_venv(tmp_path, fingerprint="old")
+
+    state = bootstrapper.bring_up(settings.asdict(), "new", gather_facts=True)
+    assert state == {"bootstrapped": False, "facts": None, "bundle_fetched": None}
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import sys
+import zipfile
+
+import pytest
+
+from frog.remoteenv import bundle, relay
+
+
+def make_cookbooks(path):
+    (path / "webserver").mkdir(parents=True)
+    (path / "webserver" / "__init__.py").write_text("SITE = 'up'\n")
+    (path / "webserver" / "__pycache__").mkdir()
+    (path / "webserver" / "__pycache__" / "x.pyc").write_bytes(b"junk")
+    (path / "frogtest_bundled.py").write_text("VALUE = 42\n")
+    return path
+
+
+def test_build_is_deterministic_and_content_addressed(tmp_path):
+    cookbooks = make_cookbooks(tmp_path / "cookbooks")
+
+    first = bundle.build([str(cookbooks)], tmp_path / "out")
+    (cookbooks / "frogtest_bundled.py").touch()
+    second = bundle.build([str(cookbooks)], tmp_path / "out2")
+
+    assert first.name == second.name
+    assert first.read_bytes() == second.read_bytes()
+    assert zipfile.ZipFile(first).namelist() == ["frogtest_bundled.py", "webserver/__init__.py"]
+
+    (cookbooks / "frogtest_bundled.py").write_text("VALUE = 43\n")
+    assert bundle.build([str(cookbooks)], tmp_path / "out").name != first.name
+    assert bundle.build([str(tmp_path / "empty")], tmp_path / "out") is None
+
+
+class FakeFileService:
+    def __init__(self):
+        self.fetched = []
+
+    def get(self, context, path, out_fp):
+        self.fetched.append(path)
+        with open(path, "rb") as bundle_fp:
+            out_fp.write(bundle_fp.read())
+        return True, {}
+
+
+def test_install_fetches_once_and_imports_from_the_zip(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    file_service = FakeFileService()
+    monkeypatch.setattr(relay, "FileService", file_service)
+    built = bundle.build([str(make_cookbooks(tmp_path / "cookbooks"))], tmp_path / "out")
+
+    assert bundle.install(None, str(tmp_path / "env"), str(built))
+    assert not bundle.install(None, str(tmp_path / "env"), str(built))
+    assert file_service.fetched == [str(built)]
+
+    module = importlib.import_module("frogtest_bundled")
+    try:
+        assert module.VALUE == 42
+        assert module.__file__.startswith(str(tmp_path / "env" / bundle.BUNDLE_DIRECTORY))
+    finally:
+        del sys.modules["frogtest_bundled"]
+
+
+def test_install_rejects_corrupted_bundles(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.setattr(relay, "FileService", FakeFileService())
+    built = bundle.build([str(make_cookbooks(tmp_path / "cookbooks"))], tmp_path / "out")
+    corrupted = built.with_name(f"{'0' * 64}.zip")
+    built.rename(corrupted)
+
+    with pytest.raises(RuntimeError):
+        bundle.install(None, str(tmp_path / "env"), str(corrupted))
+    assert list((tmp_path / "env" / bundle.BUNDLE_DIRECTORY).iterdir()) == []
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+import time
+
+import pytest
+
+from frog.remoteenv import relay
+
+
+class FakeFileService:
+    def __init__(self, files: dict):
+        self.files = files
+        self.fetched = []
+
+    def get(self, context, path, out_fp):
+        self.fetched.append(path)
+        time.sleep(0.05)
+        out_fp.write(self.files[path])
+        return True, {}
+
+
+def test_relay_fetches_each_payload_once(monkeypatch):
+    payload = b"x" * 1000
+    file_service = FakeFileService({"/bundle.zip": payload})
+    monkeypatch.setattr(relay, "FileService", file_service)
+    cache = relay.RelayCache(router=None)
+
+    served = []
+    threads = [
+        threading.Thread(target=lambda: served.append(cache.fetch(None, "/bundle.zip", hashlib.sha256(payload).hexdigest())))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert served == [payload] * 4
+    assert file_service.fetched == ["/bundle.zip"]
+    assert cache.stats() == {"hits": 3, "misses": 1, "bytes_fetched": 1000, "bytes_served": 4000}
+
+
+def test_relay_refuses_payloads_not_matching_their_digest(monkeypatch):
+    monkeypatch.setattr(relay, "FileService", FakeFileService({"/bundle.zip": b"tampered"}))
+    cache = relay.RelayCache(router=None)
+
+    with pytest.raises(RuntimeError):
+        cache.fetch(None, "/bundle.zip", hashlib.sha256(b"original").hexdigest())
+    assert cache.stats()["misses"] == 0
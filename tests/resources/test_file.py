@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from frog.resources import file
+from frog.util import kvparse
+
+
+def test_put_many_writes_every_file(tmp_path):
+    specs = [{"path": str(tmp_path / f"{i}.conf"), "contents": f"item {i}", "mode": 0o640} for i in range(3)]
+
+    changed = file.put_many(files=specs)
+
+    assert set(changed.keys()) == {spec["path"] for spec in specs}
+    for spec in specs:
+        assert file.get_contents(path=spec["path"]) == spec["contents"]
+        assert os.stat(spec["path"]).st_mode & 0o777 == 0o640
+
+
+def test_ensure_many_is_idempotent(tmp_path):
+    specs = [
+        {"path": str(tmp_path / f"{i}.conf"), "contents": f"item {i}", "mode": 0o600}
+        for i in range(file.BATCH_CONCURRENCY_THRESHOLD + 1)
+    ]
+
+    assert all(file.ensure_many(files=specs).values())
+    assert not any(file.ensure_many(files=specs).values())
+
+    os.chmod(specs[0]["path"], 0o644)
+    changed = file.ensure_many(files=specs[:2])
+
+    assert changed == {specs[0]["path"]: True, specs[1]["path"]: False}
+
+
+def test_batches_reject_duplicate_paths(tmp_path):
+    specs = [{"path": str(tmp_path / f"{i}.conf"), "contents": f"item {i}"} for i in range(file.BATCH_CONCURRENCY_THRESHOLD)]
+    specs.append({"path": specs[0]["path"], "contents": "again"})
+
+    with pytest.raises(ValueError, match="0.conf"):
+        file.put_many(files=specs)
+    with pytest.raises(ValueError, match="0.conf"):
+        file.ensure_many(files=specs)
+
+    assert not os.path.exists(specs[0]["path"])
+
+
+def test_put_parsed_parameters(tmp_path):
+    path = str(tmp_path / "counter")
+    kw = kvparse.parse(f"path={path} contents=123 mode=0640")
+
+    assert file.put(**kw)
+    assert file.get_contents(path=path) == "123"
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+
+def test_files_are_written_with_their_mode_and_moved_into_place(tmp_path, monkeypatch):
+    path = tmp_path / "secret"
+    modes = []
+    real_replace = os.replace
+
+    def replace(src, dst):
+        modes.append((os.stat(src).st_mode & 0o777, open(dst).read()))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace)
+    path.write_text("old")
+
+    assert file.put(path=str(path), contents="hunter2", mode=0o600, overwrite=True)
+    assert file.ensure_many(files=[{"path": str(path), "contents": "hunter3", "mode": 0o640}]) == {str(path): True}
+
+    assert modes == [(0o600, "old"), (0o640, "hunter2")]
+    assert path.read_text() == "hunter3"
+    assert os.listdir(tmp_path) == ["secret"]
+    with pytest.raises(FileExistsError):
+        file.put(path=str(path), contents="again")
+    assert os.listdir(tmp_path) == ["secret"]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from frog.resources import pkg
+
+
+def test_normalize_forms():
+    assert pkg.normalize("curl, nginx") == {"curl": "present", "nginx": "present"}
+    assert pkg.normalize(["curl"], state="removed") == {"curl": "absent"}
+    assert pkg.normalize({"curl": "installed", "nginx": "1.2-3"}) == {"curl": "present", "nginx": "1.2-3"}
+
+
+def test_plan_converges_in_one_pass():
+    desired = {
+        "curl": "present",
+        "nginx": "absent",
+        "git": "latest",
+        "vim": "latest",
+        "zsh": "5.8-1",
+        "htop": "present",
+    }
+    installed = {"nginx": "1.18", "git": "2.30", "zsh": "5.7-1", "htop": "3.0"}
+
+    install, upgrade, remove = pkg.plan(desired, installed)
+
+    assert install == [("curl", None), ("vim", None), ("zsh", "5.8-1")]
+    assert upgrade == ["git"]
+    assert remove == ["nginx"]
+
+
+def test_plan_nothing_to_do():
+    assert pkg.plan({"curl": "present", "nginx": "absent"}, {"curl": "7.0"}) == ([], [], [])
+
+
+def test_apt_transaction_is_single_command():
+    cmd = pkg.AptPackageManager().transaction([("curl", None), ("zsh", "5.8-1")], ["git"], ["nginx"])
+
+    assert cmd == ["apt-get", "install", "-y", "-q", "curl", "zsh=5.8-1", "git", "nginx-"]
+
+
+def test_dnf_transaction_script():
+    script = pkg.DnfPackageManager().script([("curl", None)], [], ["nginx"])
+
+    assert script == "install curl\nremove nginx\nrun\n"
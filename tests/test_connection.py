@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import sys
+
+from frog.connection import SshConnectionMethod, SshMultiplexer
+from frog.inventory import InventoryItem
+
+
+class FakeRouter:
+    def __init__(self):
+        self.calls = []
+
+    def ssh(self, **kw):
+        self.calls.append(kw)
+        return kw
+
+    def local(self, **kw):
+        self.calls.append(kw)
+        return kw
+
+
+def test_multiplexer_counts_reuse(tmp_path):
+    mux = SshMultiplexer(tmp_path / "control")
+    path = mux.control_path("root", "web-0", None)
+
+    assert "ControlMaster=auto" in mux.ssh_args("root", "web-0", None)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as master:
+        master.bind(str(path))
+        master.listen(1)
+        mux.ssh_args("root", "web-0", None)
+
+    assert mux.stats() == {"reused": 1, "created": 1}
+
+
+def test_multiplexer_prunes_stale_sockets(tmp_path):
+    mux = SshMultiplexer(tmp_path / "control")
+    path = mux.control_path(None, "web-0", 2222)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as dead:
+        dead.bind(str(path))
+
+    assert mux.prune() == 1
+    assert not path.exists()
+
+
+def test_ssh_connect_adds_control_options(tmp_path):
+    router = FakeRouter()
+    method = SshConnectionMethod(hostname="web-0", username="deploy")
+    SshConnectionMethod.multiplexer = SshMultiplexer(tmp_path / "control")
+    try:
+        method.connect(router)
+    finally:
+        SshConnectionMethod.multiplexer = None
+
+    ssh_args = router.calls[0]["ssh_args"]
+    assert f"ControlPath={tmp_path / 'control'}" in " ".join(ssh_args)
+    assert method.options["ssh_args"] == []
+
+
+def test_local_connections_can_skip_sudo_and_bootstrapping():
+    router = FakeRouter()
+    item = InventoryItem("sim-0", {"type": "local", "options": {"sudo": False, "bootstrap": False}})
+
+    assert item.open_connection_chain(router, profiling=True) == [router.calls[0]]
+    assert router.calls[0]["python_path"] == [sys.executable]
+    assert router.calls[0]["profiling"] is True
+    assert "sudo" not in router.calls[0] and "bootstrap" not in router.calls[0]
+    assert not item.escalates and not item.connection_method.bootstraps()
+    assert InventoryItem("sim-1", {"type": "local"}).escalates
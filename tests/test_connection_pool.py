@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from frog.connection_pool import ConnectionPool, ConnectThrottle
+from frog.util.ratelimit import TokenBucket
+
+
+class FakeLatch:
+    def get(self, timeout=None):
+        return None
+
+
+class FakeContext:
+    via = None
+
+    def __init__(self, name: str, log: list):
+        self.name = name
+        self.context_id = name
+        self.log = log
+
+    def shutdown(self):
+        self.log.append(f"shutdown {self.name}")
+        return FakeLatch()
+
+
+class FakeBroker:
+    def defer(self, fn, *args):
+        fn(*args)
+
+
+class FakeStream:
+    def __init__(self, ctx, log: list):
+        self.ctx = ctx
+        self.log = log
+        self.protocol = self
+        self.remote_id = ctx.context_id
+
+    def on_disconnect(self, broker):
+        self.log.append(f"disconnect {self.ctx.name}")
+
+
+class FakeRouter:
+    def __init__(self, log: list):
+        self.log = log
+        self.broker = FakeBroker()
+        self.contexts = {}
+
+    def stream_by_id(self, context_id):
+        return FakeStream(self.contexts[context_id], self.log)
+
+
+class FakeGateway(FakeContext):
+    """ A jump host, with a router of its own holding the streams to
+        contexts started through it.
+    """
+
+    def __init__(self, name: str, log: list):
+        super().__init__(name, log)
+        self.router = FakeRouter(log)
+
+    def call_no_reply(self, fn, *args):
+        fn(*args, router=self.router)
+
+
+def make_pool(jump_host: bool=False, **kw):
+    log = []
+    router = FakeRouter(log)
+    pool = ConnectionPool(router, **kw)
+    opened = []
+    via = FakeGateway("bastion", log) if jump_host else None
+
+    def factory(key):
+        def _open():
+            opened.append(key)
+            chain = [FakeContext(f"{key}/ssh", log), FakeContext(f"{key}/sudo", log), FakeContext(f"{key}/venv", log)]
+            if via is None:
+                router.contexts.update((ctx.context_id, ctx) for ctx in chain)
+            else:
+                chain[0].via = via
+                via.router.contexts[chain[0].context_id] = chain[0]
+            return chain
+        return _open
+
+    return pool, factory, opened, log
+
+
+def test_reuses_open_connections():
+    pool, factory, opened, _ = make_pool()
+
+    with pool.lease("a", factory("a")) as ctx:
+        assert ctx.name == "a/venv"
+    with pool.lease("a", factory("a")):
+        pass
+
+    assert opened == ["a"]
+    assert pool.stats.asdict()["hits"] == 1
+    assert pool.stats.asdict()["misses"] == 1
+
+
+def test_evicts_least_recently_used_chain_innermost_first():
+    pool, factory, opened, log = make_pool(max_size=2)
+
+    for key in ["a", "b", "a", "c"]:
+        with pool.lease(key, factory(key)):
+            pass
+
+    assert opened == ["a", "b", "c"]
+    assert len(pool) == 2
+    assert pool.stats.evictions == 1
+    assert log == ["shutdown b/venv", "shutdown b/sudo", "shutdown b/ssh", "disconnect b/ssh"]
+
+
+def test_forced_discard_disconnects_chains_through_their_jump_host():
+    pool, factory, _, log = make_pool(jump_host=True)
+
+    with pool.lease("a", factory("a")):
+        pass
+    pool.discard("a", force=True)
+
+    assert log == ["disconnect a/ssh"]
+    assert len(pool) == 0
+
+
+def test_waits_when_every_connection_is_leased():
+    pool, factory, opened, _ = make_pool(max_size=1)
+    entered = threading.Event()
+
+    def other():
+        with pool.lease("b", factory("b")):
+            entered.set()
+
+    with pool.lease("a", factory("a")):
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert not entered.wait(timeout=0.2)
+
+    thread.join(timeout=5)
+    assert entered.is_set()
+    assert opened == ["a", "b"]
+
+
+def test_expires_idle_connections():
+    pool, factory, _, _ = make_pool(idle_timeout=0.01)
+
+    with pool.lease("a", factory("a")):
+        pass
+    time.sleep(0.05)
+    pool.reap()
+
+    assert len(pool) == 0
+    assert pool.stats.expirations == 1
+    assert pool.stats.closed == 1
+
+
+def test_opens_each_key_once_under_contention():
+    pool, factory, opened, _ = make_pool()
+    gate = threading.Event()
+
+    def slow_factory():
+        gate.wait(timeout=5)
+        return factory("a")()
+
+    threads = [threading.Thread(target=lambda: pool.lease("a", slow_factory).__enter__()) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert opened == ["a"]
+    assert pool.stats.misses == 1
+    assert pool.stats.hits + pool.stats.coalesced == 7
+
+
+def test_throttle_limits_per_destination():
+    throttle = ConnectThrottle(max_per_destination=2)
+    active = {"bastion": 0, "other": 0}
+    peak = {"bastion": 0, "other": 0}
+    lock = threading.Lock()
+
+    def connect(destination):
+        with throttle.slot(destination):
+            with lock:
+                active[destination] += 1
+                peak[destination] = max(peak[destination], active[destination])
+            time.sleep(0.02)
+            with lock:
+                active[destination] -= 1
+
+    threads = [threading.Thread(target=connect, args=(d,)) for d in ["bastion"] * 6 + ["other"] * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert peak == {"bastion": 2, "other": 2}
+
+
+def test_token_bucket_spaces_out_acquisitions():
+    bucket = TokenBucket(rate=100, burst=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.01
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from frog.history import DurationHistory, predict_makespan
+from frog.inventory import InventoryItem
+
+
+def make_items(*hosts):
+    return [InventoryItem(host, {"type": "ssh", "options": {"hostname": host}}) for host in hosts]
+
+
+def test_predict_makespan():
+    assert predict_makespan([1, 1, 1, 1, 4], slots=2) == 6
+    assert predict_makespan([4, 1, 1, 1, 1], slots=2) == 4
+    assert predict_makespan([4, 1, 1], slots=None) == 4
+    assert predict_makespan([], slots=2) == 0
+
+
+def test_longest_first_with_median_for_unknown_hosts(tmp_path):
+    history = DurationHistory(tmp_path / "history.json")
+    for host, seconds in [("a", 1.0), ("b", 9.0), ("c", 3.0)]:
+        history.record(host, "pkg.ensure", seconds)
+
+    ordered = history.longest_first(make_items("a", "new", "b", "c"), ["pkg.ensure"])
+
+    assert [item.host for item in ordered] == ["b", "new", "c", "a"]
+    assert history.estimates(make_items("new"), ["other.target"]) == {"new": 0.0}
+    assert history.estimates(make_items("a"), ["pkg.ensure", "pkg.ensure"]) == {"a": 2.0}
+
+
+def test_durations_are_smoothed_and_merged_on_save(tmp_path):
+    path = tmp_path / "history.json"
+    first, second = DurationHistory(path), DurationHistory(path)
+    first.record("a", "test.ping", 2.0)
+    first.record("a", "test.ping", 4.0)
+    second.record("b", "test.ping", 1.0)
+
+    first.save()
+    second.save()
+
+    reloaded = DurationHistory(path)
+    assert reloaded.expected("a", "test.ping") == 3.0
+    assert reloaded.expected("b", "test.ping") == 1.0
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from frog.errors import DeadlineExceeded
+from frog.journal import Journal
+from frog.runner import ExecutionResult
+
+
+def test_results_survive_reopening_and_a_torn_last_line(tmp_path):
+    journal = Journal(tmp_path)
+    journal.start("pkg.ensure", {"packages": "nginx"})
+    journal.append([
+        ExecutionResult.fail("web-0", DeadlineExceeded("web-0", "call", 1.0)),
+        ExecutionResult.ok("web-1", changed=False).with_timings({"call": 0.5}),
+    ])
+    journal.close()
+    with open(journal.path, "a") as journal_fp:
+        journal_fp.write('{"result": {"host": "web-2", "succ')
+
+    reopened = Journal(tmp_path, journal.run_id)
+    reopened.start("pkg.ensure", {"packages": "nginx"})
+    reopened.append([ExecutionResult.ok("web-0", changed=True)])
+    reopened.close()
+
+    assert reopened.header()["target"] == "pkg.ensure"
+    assert [result.host for result in reopened.results()] == ["web-0", "web-1", "web-0"]
+    assert [result.host for result in reopened.results(latest_only=True)] == ["web-1", "web-0"]
+    assert reopened.succeeded() == {"web-0", "web-1"}
+    assert list(reopened.results())[1].timings == {"call": 0.5}
+
+
+def test_nothing_is_written_before_start(tmp_path):
+    journal = Journal(tmp_path, "run")
+    journal.append([ExecutionResult.ok("web-0", changed=True)])
+
+    assert not journal.exists()
+    assert journal.header() is None
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import urllib.request
+
+import pytest
+
+from frog import fact_cache, metrics
+
+
+def test_counters_and_histograms_render_and_merge():
+    registry = metrics.Registry()
+    calls = registry.counter("frog_calls_total", "Calls")
+    latency = registry.histogram("frog_call_seconds", "Call latency", buckets=[0.1, 1.0])
+    calls.inc(target="pkg.ensure", outcome="success")
+    latency.observe(0.05, target="pkg.ensure")
+    latency.observe(0.5, target="pkg.ensure")
+
+    other = metrics.Registry()
+    other.counter("frog_calls_total", "Calls").inc(2, target="pkg.ensure", outcome="success")
+    other.histogram("frog_call_seconds", "Call latency", buckets=[0.1, 1.0]).observe(5.0, target="pkg.ensure")
+    other.counter("frog_unknown_total", "Not known here").inc()
+    registry.merge(other.samples())
+
+    assert registry.render().splitlines() == [
+        "# HELP frog_call_seconds Call latency",
+        "# TYPE frog_call_seconds histogram",
+        'frog_call_seconds_bucket{target="pkg.ensure",le="0.1"} 1',
+        'frog_call_seconds_bucket{target="pkg.ensure",le="1"} 2',
+        'frog_call_seconds_bucket{target="pkg.ensure",le="+Inf"} 3',
+        'frog_call_seconds_sum{target="pkg.ensure"} 5.55',
+        'frog_call_seconds_count{target="pkg.ensure"} 3',
+        "# HELP frog_calls_total Calls",
+        "# TYPE frog_calls_total counter",
+        'frog_calls_total{outcome="success",target="pkg.ensure"} 3',
+    ]
+    with pytest.raises(ValueError):
+        registry.histogram("frog_calls_total", "Calls")
+
+
+def test_metrics_are_written_to_a_textfile_and_served(tmp_path):
+    registry = metrics.Registry()
+    registry.counter("frog_connections_opened_total", "Connections").inc(outcome="ok")
+
+    registry.write_textfile(tmp_path / "frog.prom")
+    server = registry.serve(0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            served = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    assert served == (tmp_path / "frog.prom").read_text() == registry.render()
+
+
+def test_fact_caches_count_hits_and_misses(tmp_path):
+    lookups = metrics.REGISTRY.counter("frog_fact_cache_lookups_total", "")
+    before = {outcome: lookups.value(cache="filesystem", outcome=outcome) for outcome in ("hit", "miss")}
+    cache = fact_cache.FilesystemFactCache(tmp_path, 60)
+
+    with pytest.raises(fact_cache.FactCache.NeedsUpdate):
+        cache.get("web-0")
+    cache.update("web-0", {"system": "Linux"})
+    cache.get("web-0")
+
+    assert lookups.value(cache="filesystem", outcome="hit") == before["hit"] + 1
+    assert lookups.value(cache="filesystem", outcome="miss") == before["miss"] + 1
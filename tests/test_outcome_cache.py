@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from frog.errors import DeadlineExceeded
+from frog.outcome_cache import OutcomeCache, unchanged
+from frog.runner import ExecutionResult
+
+
+def test_only_recent_unchanged_outcomes_are_remembered(tmp_path):
+    cache = OutcomeCache(tmp_path / "outcomes.json", ttl=0.2)
+    key = OutcomeCache.key("web-0", "file.ensure", {"files": ["/etc/motd"]}, {"system": "Linux"})
+    cache.record(key, ExecutionResult.ok("web-0", changed={"/etc/motd": False}))
+    cache.record("failed", ExecutionResult.fail("web-0", DeadlineExceeded("web-0", "call", 1.0)))
+    cache.save()
+
+    reloaded = OutcomeCache(tmp_path / "outcomes.json", ttl=0.2)
+    assert reloaded.is_unchanged(key)
+    assert not reloaded.is_unchanged("failed")
+    assert not reloaded.is_unchanged(OutcomeCache.key("web-0", "file.ensure", {"files": ["/etc/motd"]}, {"system": "BSD"}))
+
+    reloaded.record(key, ExecutionResult.ok("web-0", changed=True))
+    assert not reloaded.is_unchanged(key)
+
+    time.sleep(0.2)
+    assert not OutcomeCache(tmp_path / "outcomes.json", ttl=0.2).is_unchanged(key)
+
+
+def test_unchanged_needs_everything_unchanged():
+    assert unchanged(False)
+    assert unchanged({"/a": False, "/b": {"/c": False}})
+    assert not unchanged({"/a": False, "/b": True})
+    assert not unchanged(None)
+    assert not unchanged("pong")
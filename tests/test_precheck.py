@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import socket
+
+import pytest
+
+from frog.inventory import Inventory, InventoryItem
+from frog.precheck import Prober, ProbeCache
+
+
+@pytest.fixture
+def listening():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(16)
+        yield server.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_inventory(**ports) -> Inventory:
+    items = [InventoryItem(host, {"type": "ssh", "options": {"hostname": "127.0.0.1", "port": port}}) for host, port in ports.items()]
+    return Inventory({"all": items})
+
+
+def test_reports_only_unreachable_hosts(listening, closed_port):
+    inv = make_inventory(up=listening, down=closed_port)
+
+    unreachable = Prober(timeout=1).check(inv)
+
+    assert list(unreachable) == ["down"]
+    assert f"127.0.0.1:{closed_port}" in unreachable["down"]
+
+
+def test_skips_hosts_behind_a_jump_host(closed_port):
+    inv = make_inventory(down=closed_port)
+    next(iter(inv)).jump_via = "bastion"
+
+    assert Prober(timeout=1).check(inv) == {}
+
+
+def test_cached_outcomes_are_not_probed_again(tmp_path, listening, closed_port):
+    cache = ProbeCache(tmp_path / "probes.json", ttl=60)
+    cache.update({("127.0.0.1", listening): "was down a moment ago"})
+
+    unreachable = Prober(timeout=1, cache=cache).check(make_inventory(up=listening, down=closed_port))
+
+    assert unreachable["up"] == "was down a moment ago"
+    assert ("127.0.0.1", closed_port) in ProbeCache(tmp_path / "probes.json").get_all([("127.0.0.1", closed_port)])
+
+
+def test_expired_outcomes_are_ignored(tmp_path, listening):
+    cache = ProbeCache(tmp_path / "probes.json", ttl=0)
+    cache.update({("127.0.0.1", listening): "down"})
+
+    assert cache.get_all([("127.0.0.1", listening)]) == {}
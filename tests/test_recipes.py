@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from frog import recipe
+from frog.errors import RecipeFailed
+from frog.recipes import Recipe, load_cookbooks, lookup
+from frog.resources import lookup as lookup_resource
+
+
+def test_independent_recipes_run_side_by_side():
+    calls = []
+    lock = threading.Lock()
+
+    def step(name):
+        @recipe(f"sleep as {name}")
+        def _step():
+            time.sleep(0.2)
+            with lock:
+                calls.append(name)
+        return _step
+
+    steps = [step(f"step{idx}") for idx in range(6)]
+
+    @recipe("after all steps", depends_on=steps)
+    def site(*, message: str):
+        return message
+
+    started = time.monotonic()
+    results = site(message="done", unused="ignored")
+
+    assert time.monotonic() - started < 0.6
+    assert len(calls) == 6
+    assert results[site.name] == "done"
+
+
+def test_shared_dependencies_run_once():
+    calls = []
+
+    @recipe("base")
+    def base():
+        calls.append("base")
+
+    @recipe("left", depends_on=[base])
+    def left():
+        calls.append("left")
+
+    @recipe("right", depends_on=[base])
+    def right():
+        calls.append("right")
+
+    @recipe("top", depends_on=[left, right])
+    def top():
+        calls.append("top")
+
+    top()
+
+    assert calls[0] == "base" and calls[-1] == "top"
+    assert sorted(calls) == ["base", "left", "right", "top"]
+
+
+def test_failed_recipe_skips_dependents_only():
+    ran = []
+
+    @recipe("broken")
+    def broken():
+        raise RuntimeError("nope")
+
+    @recipe("fine")
+    def fine():
+        ran.append("fine")
+
+    @recipe("needs broken", depends_on=[broken])
+    def needs_broken():
+        ran.append("needs_broken")
+
+    @recipe("top", depends_on=[needs_broken, fine])
+    def top():
+        ran.append("top")
+
+    with pytest.raises(RecipeFailed) as err:
+        top()
+
+    assert ran == ["fine"]
+    assert list(err.value.failed) == [broken.name]
+    assert err.value.skipped == sorted([needs_broken.name, top.name])
+
+
+def test_interrupted_recipe_stops_the_run():
+    ran = []
+
+    @recipe("interrupted")
+    def interrupted():
+        raise KeyboardInterrupt
+
+    @recipe("after", depends_on=[interrupted])
+    def after():
+        ran.append("after")
+
+    with pytest.raises(KeyboardInterrupt):
+        after()
+
+    assert ran == []
+
+
+def test_depends_on_must_be_recipes():
+    with pytest.raises(TypeError):
+        recipe("plain", depends_on=[print])(lambda: None)
+
+
+def test_cookbook_recipes_are_looked_up_by_module(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    (tmp_path / "frogtest_webserver.py").write_text(textwrap.dedent("""
+        from frog import recipe
+
+        @recipe("site")
+        def site():
+            return "up"
+    """))
+
+    load_cookbooks([str(tmp_path)])
+
+    assert isinstance(lookup("frogtest_webserver.site"), Recipe)
+    assert lookup_resource("frogtest_webserver.site")() == {"frogtest_webserver.site": "up"}
+    with pytest.raises(NameError):
+        lookup("frogtest_webserver.missing")
+    with pytest.raises(NameError):
+        lookup_resource("test.missing")
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import pytest
+from mitogen.core import TimeoutError
+
+from frog.errors import DeadlineExceeded
+from frog.fact_cache import FilesystemFactCache
+from frog.history import DurationHistory
+from frog.inventory import Inventory, InventoryItem
+from frog.journal import Journal
+from frog.outcome_cache import OutcomeCache
+from frog.runner import CALL_SECONDS, ExecutionResult, FreeStrategy, GroupOrderStrategy, Runner, RunResults, SerialStrategy, Step
+from frog.tracing import Tracer
+from frog.util.concurrency import AdaptiveLimit
+
+
+class FakeMessage:
+    def __init__(self, value):
+        self.value = value
+
+    def unpickle(self, throw_dead=True):
+        return self.value
+
+
+class FakeReceiver:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def get(self, timeout=None):
+        if timeout is not None and timeout < self.delay:
+            time.sleep(timeout)
+            raise TimeoutError("timed out")
+
+        time.sleep(self.delay)
+        return FakeMessage("pong")
+
+
+class FakeContext:
+    via = None
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.context_id = id(self)
+
+    def call_async(self, fn, *args, **kw):
+        return FakeReceiver(self.delay)
+
+    def shutdown(self):
+        raise AssertionError("timed out connections are torn down without a shutdown")
+
+
+class FakeBroker:
+    def defer(self, fn, *args):
+        fn(*args)
+
+
+class FakeStream:
+    def __init__(self, context_id, disconnected: list):
+        self.protocol = self
+        self.remote_id = context_id
+        self.disconnected = disconnected
+
+    def on_disconnect(self, broker):
+        self.disconnected.append(self.remote_id)
+
+
+class FakeRouter:
+    def __init__(self):
+        self.broker = FakeBroker()
+        self.disconnected = []
+
+    def stream_by_id(self, context_id):
+        return FakeStream(context_id, self.disconnected)
+
+
+def make_runner(delays: dict, connect_delays: dict=None, **kw):
+    connect_delays = connect_delays or {}
+    runner = Runner(**kw)
+    router = FakeRouter()
+    runner._connections._router = router
+
+    def open_connection(item, timings=None):
+        time.sleep(connect_delays.get(item.host, 0))
+        return [FakeContext(delays[item.host])]
+
+    runner.open_connection = open_connection
+    inv = Inventory({"web": [InventoryItem(host, {"type": "ssh", "options": {"hostname": host}}) for host in delays]})
+    return runner, inv, router
+
+
+@pytest.fixture
+def close():
+    runners = []
+    yield runners.append
+    for runner in runners:
+        runner.close()
+
+
+def test_call_timeout_tears_down_only_the_slow_host(close):
+    runner, inv, router = make_runner({"fast": 0, "hung": 5}, call_timeout=0.2)
+    close(runner)
+
+    started = time.monotonic()
+    results = {result.host: result for result in runner.execute(inv, "test.ping")}
+
+    assert time.monotonic() - started < 2
+    assert results["fast"].success == {"changed": "pong"}
+    assert results["hung"].timed_out
+    assert results["hung"].failure["args"] == ("hung", "call", 0.2)
+    assert len(router.disconnected) == 1
+
+
+def test_run_timeout_gives_up_on_hosts_still_connecting(close):
+    runner, inv, _ = make_runner({"fast": 0, "stuck": 0}, connect_delays={"stuck": 1}, run_timeout=0.3)
+    close(runner)
+
+    started = time.monotonic()
+    results = list(runner.execute(inv, "test.ping"))
+
+    assert time.monotonic() - started < 1
+    assert {result.host: result.timed_out for result in results} == {"fast": False, "stuck": True}
+
+
+def test_hosts_given_up_on_report_why_and_after_how_long(close):
+    runner, inv, _ = make_runner({"a": 0, "b": 0}, connect_delays={"a": 1}, concurrency=AdaptiveLimit(initial=1, maximum=1))
+    close(runner)
+
+    results = {result.host: result for result in runner.execute(inv, "test.ping", deadline=time.monotonic() + 0.3)}
+
+    assert results["a"].failure["args"][:2] == ("a", "run")
+    assert results["b"].failure["args"][:2] == ("b", "admission")
+    assert all(0 < result.failure["args"][2] <= 0.3 for result in results.values())
+
+
+def test_hosts_whose_parameters_fail_to_evaluate_fail_alone(close):
+    runner, inv, _ = make_runner({"a": 0, "b": 0})
+    close(runner)
+    for item in inv:
+        item.update_facts({"port": 80 if item.host == "a" else "http"})
+
+    results = {result.host: result for result in runner.execute(inv, "test.ping", {"port": "{{ facts.port + 1 }}"})}
+
+    assert results["a"].success == {"changed": "pong"}
+    assert results["b"].failure["exception"] == "TypeError"
+
+
+def test_hosts_given_up_on_cannot_report_later():
+    results = RunResults()
+    results.give_up(ExecutionResult.fail("stuck", DeadlineExceeded("stuck", "run", 1.0)))
+    results.append(ExecutionResult.ok("stuck", changed="pong"))
+
+    assert [result.timed_out for result in results.collected()] == [True]
+
+
+def test_connections_idle_past_the_timeout_are_closed_as_hosts_finish(close, monkeypatch):
+    monkeypatch.setattr(FakeContext, "shutdown", lambda self: FakeReceiver(0))
+    runner, inv, router = make_runner({"quick": 0, "slow": 0.3}, connection_idle_timeout=0.1)
+    close(runner)
+
+    results = list(runner.execute(inv, "test.ping"))
+
+    assert all(result.success for result in results)
+    assert len(router.disconnected) == 1
+    assert runner.connection_stats.expirations == 1
+    assert len(runner._connections) == 1
+
+
+def test_concurrency_limit_admits_hosts_in_turn(close):
+    runner, inv, _ = make_runner({"a": 0.05, "b": 0.05, "c": 0.05}, concurrency=AdaptiveLimit(initial=1, maximum=1))
+    close(runner)
+
+    results = list(runner.execute(inv, "test.ping"))
+
+    assert sorted(result.host for result in results if result.success) == ["a", "b", "c"]
+    assert runner.concurrency == 1
+
+
+def test_history_starts_the_slowest_hosts_first(close, tmp_path):
+    history = DurationHistory(tmp_path / "history.json")
+    history.record("slow", "test.ping", 0.2)
+    history.record("fast", "test.ping", 0.01)
+    runner, inv, _ = make_runner({"fast": 0.01, "new": 0.01, "slow": 0.2}, concurrency=AdaptiveLimit(initial=1, maximum=1), history=history)
+    close(runner)
+
+    results = list(runner.execute(inv, "test.ping"))
+
+    assert [result.host for result in results] == ["slow", "new", "fast"]
+    assert set(runner.makespans["test.ping"]) == {"predicted", "inventory_order", "actual"}
+    assert DurationHistory(tmp_path / "history.json").expected("new", "test.ping") is not None
+
+
+def test_serial_batches_by_count_or_percentage(close):
+    runner, inv, _ = make_runner({"a": 0, "b": 0, "c": 0})
+    close(runner)
+
+    assert [len(batch) for batch in SerialStrategy(2).batches(inv)] == [2, 1]
+    assert [len(batch) for batch in SerialStrategy("50%").batches(inv)] == [2, 1]
+    assert [len(batch) for batch in SerialStrategy("10%").batches(inv)] == [1, 1, 1]
+    with pytest.raises(ValueError):
+        SerialStrategy("0")
+
+
+def test_serial_aborts_remaining_batches_past_max_fail_percentage(close):
+    strategy = SerialStrategy(1, max_fail_percentage=0)
+    runner, inv, _ = make_runner({"a": 0, "hung": 5, "b": 0, "c": 0}, call_timeout=0.1, strategy=strategy)
+    close(runner)
+
+    results = {result.host: result for result in strategy.run(runner, inv, [Step("test.ping")])}
+
+    assert results["a"].success == {"changed": "pong"}
+    assert results["hung"].timed_out
+    assert results["b"].failure["exception"] == "RolloutAborted"
+    assert results["c"].failure["exception"] == "RolloutAborted"
+
+
+def test_free_strategy_does_not_wait_on_the_slowest_host(close):
+    steps = [Step("test.ping"), Step("test.ping")]
+    runner, inv, _ = make_runner({"fast": 0.01, "slow": 0.3})
+    close(runner)
+    assert [result.host for result in runner.strategy.run(runner, inv, steps)] == ["fast", "slow", "fast", "slow"]
+
+    runner.strategy = FreeStrategy()
+    assert [result.host for result in runner.strategy.run(runner, inv, steps)] == ["fast", "fast", "slow", "slow"]
+
+
+def test_groups_start_once_their_prerequisites_converge(close):
+    strategy = GroupOrderStrategy({"app": ["db"], "lb": ["app", "cache"]})
+    runner, inv, _ = make_runner({"db-0": 0.2, "cache-0": 0.2, "app-0": 0.2, "lb-0": 0}, strategy=strategy)
+    close(runner)
+    items = {item.host: item for item in inv}
+    inv = Inventory({group: [items[f"{group}-0"]] for group in ["lb", "app", "db", "cache"]})
+
+    started = time.monotonic()
+    results = strategy.run(runner, inv, [Step("test.ping")])
+
+    assert time.monotonic() - started < 0.6
+    assert [result.host for result in results][2:] == ["app-0", "lb-0"]
+    assert all(result.success for result in results)
+
+
+def test_groups_after_a_failed_group_are_not_run(close):
+    strategy = GroupOrderStrategy({"app": ["db"]})
+    runner, inv, _ = make_runner({"db-0": 5, "other-0": 0, "app-0": 0}, call_timeout=0.1, strategy=strategy)
+    close(runner)
+    items = {item.host: item for item in inv}
+    inv = Inventory({group: [items[f"{group}-0"]] for group in ["app", "db", "other"]})
+
+    results = {result.host: result for result in strategy.run(runner, inv, [Step("test.ping")])}
+
+    assert results["db-0"].timed_out
+    assert results["other-0"].success
+    assert results["app-0"].failure["exception"] == "RolloutAborted"
+    with pytest.raises(ValueError):
+        GroupOrderStrategy({"app": ["db"], "db": ["app"]})
+
+
+def test_groups_after_one_that_was_down_are_not_run(close):
+    strategy = GroupOrderStrategy({"app": ["db"]})
+    runner, inv, _ = make_runner({"db-0": 0, "app-0": 0}, strategy=strategy)
+    close(runner)
+    items = {item.host: item for item in inv}
+    declared = Inventory({group: [items[f"{group}-0"]] for group in ["app", "db"]})
+
+    results = {result.host: result for result in strategy.run(runner, declared.where(lambda item: item.host != "db-0"), [Step("test.ping")])}
+
+    assert list(results) == ["app-0"]
+    assert results["app-0"].failure["exception"] == "RolloutAborted"
+
+
+def test_groups_after_one_without_facts_are_not_run(close):
+    strategy = GroupOrderStrategy({"app": ["db"]})
+    runner, inv, _ = make_runner({"db-0": 0, "app-0": 0}, strategy=strategy)
+    close(runner)
+    items = {item.host: item for item in inv}
+    inv = Inventory({group: [items[f"{group}-0"]] for group in ["app", "db"]})
+    call_on_host = runner.call_on_host
+    runner.call_on_host = lambda ctx, item, source, target, **kw: (
+        ExecutionResult.fail(item.host, OSError("no facts")) if target == "facts.gather" and item.host == "db-0"
+        else ExecutionResult.ok(item.host, changed={}) if target == "facts.gather"
+        else call_on_host(ctx, item, source, target, **kw))
+
+    results = {result.host: result for result in runner.run(inv, "test.ping")}
+
+    assert results["db-0"].failure["exception"] == "OSError"
+    assert results["app-0"].failure["exception"] == "RolloutAborted"
+
+
+def test_groups_after_one_that_crashed_are_not_left_waiting(close):
+    class Crashing(FreeStrategy):
+        def run(self, runner, hosts, steps, deadline=None):
+            if "db" in hosts.hosts:
+                raise RuntimeError("crashed")
+            return super().run(runner, hosts, steps, deadline=deadline)
+
+    strategy = GroupOrderStrategy({"app": ["db"]}, within=Crashing())
+    runner, inv, _ = make_runner({"db-0": 0, "app-0": 0}, strategy=strategy)
+    close(runner)
+    items = {item.host: item for item in inv}
+    inv = Inventory({group: [items[f"{group}-0"]] for group in ["app", "db"]})
+
+    results = strategy.run(runner, inv, [Step("test.ping")])
+
+    assert sorted((result.host, result.failure["exception"]) for result in results) == [("app-0", "RolloutAborted"), ("db-0", "RuntimeError")]
+
+
+def test_results_and_skipped_hosts_are_journaled_as_they_come_in(close, tmp_path):
+    journal = Journal(tmp_path, "run")
+    journal.start("test.ping", {})
+    strategy = SerialStrategy(1, max_fail_percentage=0)
+    runner, inv, _ = make_runner({"a": 0, "hung": 5, "b": 0}, call_timeout=0.1, strategy=strategy, journal=journal)
+    close(runner)
+
+    strategy.run(runner, inv, [Step("test.ping")])
+    list(runner.execute(inv, "test.ping", record=False))
+
+    assert [(result.host, bool(result.success)) for result in journal.results()] == [("a", True), ("hung", False), ("b", False)]
+
+
+def test_journaled_results_are_only_kept_brief(close, tmp_path):
+    journal = Journal(tmp_path, "run")
+    journal.start("test.ping", {})
+    runner, inv, _ = make_runner({"a": 0, "hung": 5}, call_timeout=0.1, journal=journal)
+    close(runner)
+
+    results = {result.host: result for result in runner.execute(inv, "test.ping")}
+
+    assert results["a"].success == {"journaled": True}
+    assert results["hung"].failure == {"exception": "DeadlineExceeded"}
+    assert {result.host: result.outcome() for result in journal.results()}["a"] == {"changed": "pong"}
+
+
+def test_calls_that_changed_nothing_are_skipped_without_connecting(close, tmp_path):
+    runner, inv, _ = make_runner({"converged": 0, "drifting": 0}, outcome_cache=OutcomeCache(tmp_path / "outcomes.json", ttl=60))
+    close(runner)
+    changes = {"converged": False, "drifting": True}
+    connected = []
+    open_connection = runner.open_connection
+    runner.open_connection = lambda item, timings=None: connected.append(item.host) or open_connection(item, timings)
+    called = []
+    runner.call_on_host = lambda ctx, item, *args, **kw: called.append(item.host) or ExecutionResult.ok(item.host, changed=changes[item.host])
+
+    list(runner.execute(inv, "pkg.ensure", {"packages": "nginx"}))
+    for item in inv:
+        runner._connections.discard(str(item), force=True)
+    results = {result.host: result.success for result in runner.execute(inv, "pkg.ensure", {"packages": "nginx"})}
+    assert results == {"converged": {"changed": False, "skipped": True}, "drifting": {"changed": True}}
+    assert sorted(connected) == ["converged", "drifting", "drifting"]
+
+    # Other parameters, or a later run that doesn't skip, make the call.
+    list(runner.execute(inv, "pkg.ensure", {"packages": "apache2"}))
+    assert sorted(called) == ["converged", "converged", "drifting", "drifting", "drifting"]
+    assert not OutcomeCache(tmp_path / "outcomes.json", ttl=60, skip=False).is_unchanged(
+        OutcomeCache.key("converged", "pkg.ensure", {"packages": "nginx"}, {}))
+
+
+def test_runs_with_cached_facts_skip_unchanged_hosts_without_connecting(close, tmp_path):
+    changes = {"converged": False, "drifting": True}
+    connected = []
+
+    def run():
+        runner, inv, _ = make_runner({"converged": 0, "drifting": 0}, outcome_cache=OutcomeCache(tmp_path / "outcomes.json", ttl=60))
+        close(runner)
+        open_connection = runner.open_connection
+        runner.open_connection = lambda item, timings=None: connected.append(item.host) or open_connection(item, timings)
+        runner.call_on_host = lambda ctx, item, source, target, **kw: ExecutionResult.ok(
+            item.host, changed={"os": "linux"} if target == "facts.gather" else changes[item.host])
+        return {result.host: result.success for result in runner.run(inv, "pkg.ensure", {"packages": "nginx"},
+                                                                     fact_cache=FilesystemFactCache(tmp_path / "facts", 3600))}
+
+    run()
+    assert sorted(connected) == ["converged", "drifting"]
+
+    assert run() == {"converged": {"changed": False, "skipped": True}, "drifting": {"changed": True}}
+    assert sorted(connected) == ["converged", "drifting", "drifting"]
+
+
+def test_each_phase_of_a_host_is_traced_and_summarized(close):
+    tracer = Tracer()
+    runner, inv, _ = make_runner({"a": 0, "b": 0.05}, tracer=tracer)
+    close(runner)
+    calls = CALL_SECONDS.count(target="test.ping")
+
+    results = list(runner.execute(inv, "test.ping"))
+
+    assert all(set(result.timings) == {"serialize", "call"} for result in results)
+    phases = {}
+    for event in tracer.events():
+        if event["ph"] == "X":
+            phases.setdefault(event["tid"], []).append(event["name"])
+    assert sorted(phases.values()) == [["serialize", "call", "result"]] * 2
+    assert runner.latencies.summary()["call"]["max"] >= 0.05
+    assert runner.latencies.summary()["result"]["count"] == 2
+    assert CALL_SECONDS.count(target="test.ping") == calls + 2
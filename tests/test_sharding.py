@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import queue
+import sys
+
+from frog.inventory import Inventory, InventoryItem
+from frog.runner import RunnerOptions
+from frog.sharding import ShardFactCache, partition
+
+
+def make_item(host: str, jump_via: str=None) -> InventoryItem:
+    return InventoryItem(host, {"type": "ssh", "options": {"hostname": host}}, jump_via=jump_via)
+
+
+def test_partition_balances_and_keeps_destinations_together():
+    inv = Inventory({
+        "web": [make_item(f"web-{i}", jump_via="bastion-a") for i in range(4)],
+        "db": [make_item(f"db-{i}") for i in range(4)] + [make_item("cache-0", jump_via="bastion-b")],
+    })
+
+    parts = partition(inv, 3)
+
+    assert sorted(len(part) for part in parts) == [2, 3, 4]
+    assert all(part.parent is inv for part in parts)
+    behind_bastion = {f"web-{i}" for i in range(4)}
+    for part in parts:
+        assert len({item.host for item in part} & behind_bastion) in (0, 4)
+    assert sorted(item.host for part in parts for item in part) == sorted(item.host for item in inv)
+
+
+def test_partition_never_makes_empty_shards():
+    inv = Inventory({"web": [make_item("web-0"), make_item("web-1")]})
+
+    assert len(partition(inv, 8)) == 2
+
+
+def test_split_options_share_global_limits():
+    options = RunnerOptions(max_connections=10, max_concurrent_connects=4, connect_rate=8.0, max_connects_per_destination=8)
+
+    split = options.split(3)
+
+    assert split.max_connections == 4
+    assert split.max_concurrent_connects == 2
+    assert split.connect_rate == 8.0 / 3
+    assert split.max_connects_per_destination == 8
+    assert options.max_connections == 10
+
+
+def test_shard_fact_cache_forwards_updates():
+    updates = queue.Queue()
+    cache = ShardFactCache({"web-0": {"fqdn": "web-0.local"}}, updates)
+
+    assert cache.get("web-0") == {"fqdn": "web-0.local"}
+    cache.update("web-1", {"fqdn": "web-1.local"})
+
+    assert cache.get("web-1") == {"fqdn": "web-1.local"}
+    assert updates.get_nowait() == ("facts", "web-1", {"fqdn": "web-1.local"})
+
+
+def test_runners_built_from_options_can_import_cookbooks(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    (tmp_path / "shardbook.py").write_text("VALUE = 1\n")
+
+    runner = RunnerOptions(cookbook_paths=[str(tmp_path)]).build()
+    runner.close()
+
+    assert importlib.import_module("shardbook").VALUE == 1
+    sys.modules.pop("shardbook")
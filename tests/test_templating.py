@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from frog.inventory import Inventory, InventoryItem
+from frog.templating import HostParameters, TemplateService, digest
+
+
+class FakeMessage:
+    def __init__(self, src_id: int):
+        self.src_id = src_id
+
+
+WEB_0 = FakeMessage(src_id=7)
+
+
+@pytest.fixture
+def service(tmp_path):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "hosts.j2").write_text("{{ host.host }} {{ facts.fqdn }} {{ greeting }}\n")
+
+    svc = TemplateService(None, cache_dir=tmp_path / "cache")
+    svc.register_prefix(str(templates))
+    svc.set_inventory(Inventory({"web": [
+        InventoryItem("web-0", {"type": "ssh", "options": {"hostname": "web-0"}}, facts={"fqdn": "web-0.example.com"}),
+        InventoryItem("web-1", {"type": "ssh", "options": {"hostname": "web-1"}}, facts={"fqdn": "web-1.example.com"}),
+    ]}))
+    svc.register_context(WEB_0.src_id, "web-0")
+    return svc
+
+
+def test_render_sends_contents_when_checksum_differs(service):
+    rendered = service.render("hosts.j2", {"greeting": "hi"}, msg=WEB_0)
+
+    assert rendered["contents"] == "web-0 web-0.example.com hi\n"
+    assert rendered["checksum"] == digest(rendered["contents"].encode("utf-8"))
+
+
+def test_render_skips_contents_when_checksum_matches(service):
+    expected = digest(b"web-0 web-0.example.com hi\n")
+    rendered = service.render("hosts.j2", {"greeting": "hi"}, checksum=expected, msg=WEB_0)
+
+    assert rendered == {"checksum": expected, "contents": None}
+
+
+def test_render_is_only_for_the_host_asking(service):
+    with pytest.raises(LookupError):
+        service.render("hosts.j2", {"greeting": "hi"}, msg=FakeMessage(src_id=8))
+
+
+def test_bytecode_cache_is_written(service, tmp_path):
+    service.render("hosts.j2", {"greeting": "hi"}, msg=WEB_0)
+
+    assert any((tmp_path / "cache").iterdir())
+
+
+def test_host_parameters_evaluate_per_host():
+    items = [
+        InventoryItem(f"web-{i}", {"type": "ssh", "options": {"hostname": f"web-{i}"}}, facts={"node": i})
+        for i in range(2)
+    ]
+    inventory = Inventory({"web": items})
+    params = HostParameters({
+        "static": "value",
+        "node": "{{ facts.node + 1 }}",
+        "nested": {"name": "app-{{ host.host }}"},
+    })
+
+    assert params.templated
+    assert params.for_host(items[0], inventory) == {"static": "value", "node": 1, "nested": {"name": "app-web-0"}}
+    assert params.for_host(items[1], inventory) == {"static": "value", "node": 2, "nested": {"name": "app-web-1"}}
+
+
+def test_host_parameters_without_templates_are_passed_through():
+    given = {"message": "pong"}
+    params = HostParameters(given)
+
+    assert not params.templated
+    assert params.for_host(None) is given
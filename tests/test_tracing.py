@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from frog.tracing import Tracer
+
+
+def test_spans_are_written_as_chrome_trace_events_one_thread_per_host(tmp_path):
+    tracer = Tracer()
+    tracer.add("web-0", "connect", 100.0, 0.5)
+    tracer.add("web-0", "connect.ssh", 100.0, 0.25)
+    tracer.add("web-1", "call", 100.5, 0.001)
+    other = Tracer()
+    other.add("web-2", "call", 101.0, 0.002)
+    tracer.merge(other.events())
+    tracer.write(tmp_path / "trace.json")
+
+    with open(tmp_path / "trace.json") as trace_fp:
+        events = json.load(trace_fp)["traceEvents"]
+
+    threads = {event["args"]["name"]: event["tid"] for event in events if event["ph"] == "M"}
+    assert set(threads) == {"web-0", "web-1", "web-2"}
+    spans = [(event["name"], event["cat"], event["ts"], event["dur"]) for event in events if event["ph"] == "X"]
+    assert spans == [
+        ("connect", "connect", 100_000_000, 500_000),
+        ("connect.ssh", "connect", 100_000_000, 250_000),
+        ("call", "call", 100_500_000, 1_000),
+        ("call", "call", 101_000_000, 2_000),
+    ]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from frog.util.concurrency import AdaptiveLimit, ConcurrencyGate
+
+CAPACITY = 20
+
+
+def simulate(limit: AdaptiveLimit, rounds: int=150, error_threshold: float=1.5):
+    """ Runs rounds of `limit.current` hosts against a bottleneck that
+        serves CAPACITY at once: past that, latency grows with the load, and
+        past `error_threshold` times it connections start failing.
+    """
+
+    levels = []
+    for _ in range(rounds):
+        in_flight = limit.current
+        latency = max(1.0, in_flight / CAPACITY)
+        for _ in range(in_flight):
+            limit.record(latency, ok=in_flight <= error_threshold * CAPACITY)
+        levels.append(in_flight)
+
+    return levels
+
+
+@pytest.mark.parametrize("initial", [1, 200])
+def test_converges_around_capacity(initial):
+    levels = simulate(AdaptiveLimit(initial=initial))[50:]
+
+    assert CAPACITY / 2 <= min(levels)
+    assert max(levels) <= 1.6 * CAPACITY
+    assert 0.9 * CAPACITY <= sum(levels) / len(levels) <= 1.3 * CAPACITY
+
+
+def test_backs_off_on_latency_alone():
+    levels = simulate(AdaptiveLimit(initial=1), error_threshold=float("inf"))[50:]
+
+    assert max(levels) <= 2.1 * CAPACITY
+
+
+def test_stays_within_bounds():
+    assert max(simulate(AdaptiveLimit(initial=1, maximum=10))) == 10
+
+    fixed = AdaptiveLimit(initial=4, minimum=4, maximum=4)
+    assert set(simulate(fixed, rounds=20)) == {4}
+
+
+def test_fast_completions_are_forgotten():
+    limit = AdaptiveLimit(initial=8, window=50)
+    for _ in range(5):
+        limit.record(0.000001)
+    for _ in range(200):
+        limit.record(1.0)
+
+    assert limit.baseline == pytest.approx(1.0)
+    assert limit.current > 8
+
+
+def test_gate_leaves_limit_alone_for_completions_without_latency():
+    gate = ConcurrencyGate(AdaptiveLimit(initial=4))
+    for _ in range(20):
+        assert gate.acquire()
+        gate.release()
+
+    assert gate.limit.current == 4
+    assert gate.limit.baseline is None
+
+    assert gate.acquire()
+    gate.release(ok=False)
+    assert gate.limit.baseline is None
+
+
+def test_gate_never_admits_more_than_the_limit():
+    gate = ConcurrencyGate(AdaptiveLimit(initial=3, maximum=3))
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal peak
+        with lock:
+            peak = max(peak, gate.in_flight)
+        time.sleep(0.01)
+        gate.release(0.01)
+
+    threads = []
+    for _ in range(12):
+        assert gate.acquire()
+        thread = threading.Thread(target=work)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert peak <= 3
+    assert gate.in_flight == 0
+
+
+def test_gate_gives_up_at_deadline():
+    gate = ConcurrencyGate(AdaptiveLimit(initial=1, maximum=1))
+    assert gate.acquire()
+
+    assert not gate.acquire(deadline=time.monotonic() + 0.05)
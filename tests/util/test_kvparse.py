@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from frog.util import kvparse
+
+
+def test_parse_typed_values():
+    given = "count=3 ratio=0.5 enabled=true debug=False name=web"
+    expected = {"count": 3, "ratio": "0.5", "enabled": True, "debug": False, "name": "web"}
+
+    assert kvparse.parse(given) == expected
+
+
+def test_parse_nested_and_lists():
+    given = "a={b=1 c={d='two words'}} e=[1, x y, 'p,q', {f=g}, []]"
+    expected = {
+        "a": {"b": 1, "c": {"d": "two words"}},
+        "e": [1, "x y", "p,q", {"f": "g"}, []],
+    }
+
+    assert kvparse.parse(given) == expected
+
+
+def test_parse_unquoted_values_keep_spaces():
+    assert kvparse.parse("contents=hello world path=/tmp/x.conf") == {
+        "contents": "hello world",
+        "path": "/tmp/x.conf",
+    }
+
+
+def test_parse_keeps_template_tags():
+    given = "addr={{ facts.network.interface['eth0'].ipv4[0].addr }} name=x-{{ host.host }}"
+
+    assert kvparse.parse(given) == {
+        "addr": "{{ facts.network.interface['eth0'].ipv4[0].addr }}",
+        "name": "x-{{ host.host }}",
+    }
+
+
+def test_parse_quoted_escapes():
+    assert kvparse.parse(r"""a='it\'s' b="1" """) == {"a": "it's", "b": "1"}
+
+
+def test_parse_many_merges():
+    assert kvparse.parse_many(["a=1", "contents=hello world", "b={c=2}"]) == {
+        "a": 1,
+        "contents": "hello world",
+        "b": {"c": 2},
+    }
+
+
+@pytest.mark.parametrize("given, position", [
+    ("a='unterminated", 2),
+    ("a={b=1", 6),
+    ("a=[1, 2", 7),
+    ("a b", 1),
+    ("a=", 2),
+    ("a='x'y", 5),
+    ("a={{ x }", 2),
+])
+def test_parse_error_positions(given, position):
+    with pytest.raises(kvparse.ParseError) as exc:
+        kvparse.parse(given)
+
+    assert exc.value.position == position
+
+
+def test_parse_modes_and_prefixed_values_are_octal():
+    given = ["mode=0640", "create_mode=0750", "umask=0o022", "count=10", "zero=0"]
+
+    assert kvparse.parse_many(given) == {"mode": 0o640, "create_mode": 0o750, "umask": 0o022, "count": 10, "zero": 0}
+
+    with pytest.raises(kvparse.ParseError, match="octal"):
+        kvparse.parse("mode=0948")
+
+
+def test_parse_keeps_leading_zero_ids():
+    assert kvparse.parse("id=01234 other=08") == {"id": "01234", "other": "08"}
+
+
+def test_parse_keeps_dotted_values_as_strings():
+    assert kvparse.parse_many(["version=1.20", "pin=1.2", "other=1.2.3"]) == {"version": "1.20", "pin": "1.2", "other": "1.2.3"}
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from frog.errors import ConnectionError, DeadlineExceeded
+from frog.inventory import InventoryItem
+from frog.runner import ExecutionResult
+from frog.util.outputs import HostSet, Summary, as_json, as_pretty_json, stream_json
+
+
+def test_host_set_compresses_numbered_hosts_in_any_order():
+    hosts = HostSet()
+    for host in ["web-003", "web-001", "db", "web-002", "web-010", "web-005", "web-004", "cache1.example.com", "cache2.example.com"]:
+        hosts.add(host)
+
+    assert str(hosts) == "db cache[1-2].example.com web-[001-005,010]"
+    assert hosts.count == 9
+
+
+def test_summary_groups_hosts_by_normalized_outcome():
+    summary = Summary()
+    for index in range(1, 1001):
+        summary.add(ExecutionResult.ok(f"web-{index:04d}", changed=index % 100 == 0))
+    summary.add(ExecutionResult.fail("web-1001", DeadlineExceeded("web-1001", "call", 1.0)))
+    summary.add(ExecutionResult.fail("web-1002", DeadlineExceeded("web-1002", "call", 1.0)))
+
+    groups = summary.groups()
+    assert [(count, hosts) for count, hosts, _ in groups] == [
+        (990, "web-[0001-0099,0101-0199,0201-0299,0301-0399,0401-0499,0501-0599,0601-0699,0701-0799,0801-0899,0901-0999]"),
+        (10, "web-[0100,0200,0300,0400,0500,0600,0700,0800,0900,1000]"),
+        (2, "web-[1001-1002]"),
+    ]
+    assert "{host}" in groups[2][2]["repr"]
+    assert "990" in summary.draw()
+
+
+def test_json_is_streamed_a_host_at_a_time():
+    results = [ExecutionResult.ok("web-1", changed={"files": [1, 2]}), ExecutionResult.fail("web-2", DeadlineExceeded("web-2", "call", 1.0))]
+    expected = {result.host: result.outcome() for result in results}
+
+    chunks = list(stream_json(iter(results), indent=2))
+
+    assert len(chunks) == len(results) + 2
+    assert "".join(chunks) == json.dumps(expected, indent=2) == as_pretty_json(results)
+    assert "".join(stream_json(results)) == json.dumps(expected) == as_json(results)
+    assert "".join(stream_json([], indent=2)) == "{}"
+
+
+def test_summary_only_normalizes_whole_host_names():
+    summary = Summary()
+    summary.add(ExecutionResult.ok("web-1", changed="web-10 is web-1's peer"))
+    summary.add(ExecutionResult.ok("db", changed="mydb on db.lan, not db"))
+
+    outcomes = [outcome["changed"] for _, _, outcome in summary.groups()]
+
+    assert outcomes == ["web-10 is {host}'s peer", "mydb on db.lan, not {host}"]
+
+
+def test_unreachable_hosts_render_and_group_together():
+    results = []
+    for host in ["web-1", "web-2"]:
+        item = InventoryItem(host, {"type": "local", "options": {"python_path": "/nonexistent/python"}})
+        error = ConnectionError(item).with_cause(OSError(f"cannot run /nonexistent/python on {host}"))
+        results.append(ExecutionResult.fail(host, error))
+
+    rendered = json.loads("".join(stream_json(results)))
+    summary = Summary()
+    for result in results:
+        summary.add(result)
+
+    assert rendered["web-1"]["args"] == ["web-1", "cannot run /nonexistent/python on web-1"]
+    assert [(count, hosts) for count, hosts, _ in summary.groups()] == [(2, "web-[1-2]")]